@@ -67,7 +67,14 @@ setup(
             'resolve = xylem.commands.resolve:definition',
             'lookup = xylem.commands.lookup:definition',
             'install = xylem.commands.install:definition',
+            'mirror = xylem.commands.mirror:definition',
+            'import-cache = xylem.commands.import_cache:definition',
+            'check-rules = xylem.commands.check_rules:definition',
+            'serve = xylem.commands.serve:definition',
             '_compact_rules_file = xylem.commands._compact_rules_file:definition',
+            '_benchmark_cache = xylem.commands._benchmark_cache:definition',
+            '_benchmark_merge = xylem.commands._benchmark_merge:definition',
+            '_dump_rules = xylem.commands._dump_rules:definition',
         ],
         'xylem.specs': [
             'rules = xylem.specs.plugins.rules:definition',
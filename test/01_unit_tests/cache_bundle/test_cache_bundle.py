@@ -0,0 +1,124 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for creating and importing cache bundles."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from xylem.cache_bundle import InvalidCacheBundleError
+from xylem.cache_bundle import bundle_cache_files
+from xylem.cache_bundle import create_cache_bundle
+from xylem.cache_bundle import import_cache_bundle
+from xylem.config import get_default_config
+from xylem.sources import RulesDatabase
+from xylem.sources import SourcesContext
+from xylem.specs.plugins.rules import RulesSpec
+from xylem.util import redirected_stdio
+
+
+class FakeInstallerContext(object):
+
+    def get_os_tuple(self):
+        return ('ubuntu', 'trusty')
+
+    def get_default_installer_name(self):
+        return 'apt'
+
+
+class CacheBundleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+        self.bundle = os.path.join(self.tempdir, 'bundle.tar.gz')
+        rules = os.path.join(self.tempdir, 'rules.yaml')
+        with open(rules, 'w') as f:
+            f.write('foo:\n  ubuntu: [libfoo]\n')
+        self.sources = "- rules: '{0}'\n".format(rules)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def sources_context(self, name):
+        config = get_default_config()
+        config.sources_dir = os.path.join(self.tempdir, name, 'sources.d')
+        config.cache_dir = os.path.join(self.tempdir, name, 'cache')
+        if not os.path.isdir(config.sources_dir):
+            os.makedirs(config.sources_dir)
+            with open(os.path.join(config.sources_dir, '10-test.yaml'),
+                      'w') as f:
+                f.write(self.sources)
+        return SourcesContext(config, spec_plugins=[RulesSpec()])
+
+    def create_bundle(self):
+        sources_context = self.sources_context('build')
+        sources_context.ensure_cache_dir()
+        database = RulesDatabase(sources_context)
+        database.update()
+        assert database.save_index(FakeInstallerContext())
+        with redirected_stdio():
+            return create_cache_bundle(self.bundle, sources_context)
+
+    def test_bundle(self):
+        ic = FakeInstallerContext()
+        build_manifest = self.create_bundle()
+        sources_context = self.sources_context('consumer')
+        sources_context.ensure_cache_dir()
+        stale = os.path.join(sources_context.cache_dir, 'stale.pickle')
+        open(stale, 'w').close()
+        with redirected_stdio():
+            manifest = import_cache_bundle(
+                self.bundle, sources_context=sources_context)
+        assert manifest == build_manifest
+        assert sorted(manifest['files']) == \
+            bundle_cache_files(sources_context.cache_dir)
+        assert 'index.pickle' in manifest['files']
+        assert not os.path.exists(stale)
+
+        # the lookup index stays valid with the imported caches
+        database = RulesDatabase(sources_context)
+        assert database.load_index(ic)
+        database = RulesDatabase(sources_context)
+        database.load_from_cache()
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+
+    def test_invalid_bundle(self):
+        self.create_bundle()
+        sources_context = self.sources_context('consumer')
+        self.assertRaises(InvalidCacheBundleError, import_cache_bundle,
+                          os.path.join(self.tempdir, 'missing.tar.gz'),
+                          sources_context=sources_context)
+
+        # replace a cache file with different content
+        tampered = os.path.join(self.tempdir, 'tampered.tar.gz')
+        with tarfile.open(self.bundle) as src:
+            with tarfile.open(tampered, 'w:gz') as dst:
+                for member in src.getmembers():
+                    content = src.extractfile(member)
+                    if member.name.endswith('.meta'):
+                        data = content.read() + b'x'
+                        member.size = len(data)
+                        content = tempfile.TemporaryFile()
+                        content.write(data)
+                        content.seek(0)
+                    dst.addfile(member, content)
+        self.assertRaises(InvalidCacheBundleError, import_cache_bundle,
+                          tampered, sources_context=sources_context)
+        # the cache is left unchanged
+        assert os.listdir(sources_context.cache_dir) == ['update.lock']
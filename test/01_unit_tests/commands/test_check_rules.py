@@ -0,0 +1,50 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the check-rules command."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from xylem.commands.check_rules import rules_file_errors
+
+
+class CheckRulesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def errors(self, content):
+        path = os.path.join(self.tempdir, 'rules.yaml')
+        with open(path, 'w') as f:
+            f.write(content)
+        return rules_file_errors(path)
+
+    def test_rules_file_errors(self):
+        assert self.errors("foo:\n  ubuntu: [libfoo]\n") == []
+        errors = self.errors("foo:\n  ubuntu: [libfoo]\n1:\n  ubuntu: []\n")
+        assert len(errors) == 1 and "xylem key" in errors[0]
+        errors = self.errors("foo: [\n")
+        assert len(errors) == 1 and errors[0].startswith("Failed to parse")
+
+    def test_unhashable_key(self):
+        errors = self.errors("? [a, b]\n: {ubuntu: [libfoo]}\n")
+        assert len(errors) == 1 and errors[0].startswith("Failed to parse")
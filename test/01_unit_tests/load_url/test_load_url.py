@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for downloading urls against a local http server."""
+
+from __future__ import unicode_literals
+
+import gzip
+import io
+import threading
+import unittest
+import zlib
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler
+from six.moves.BaseHTTPServer import HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from xylem.load_url import DownloadFailure
+from xylem.load_url import decode_content
+from xylem.load_url import load_url
+from xylem.load_url import load_url_if_modified
+from xylem.load_url import load_url_raw
+from xylem.load_url import pooled_connections
+from xylem.load_url import stream_url_if_modified
+
+
+_content = {
+    '/rules.yaml': 'foo:\n  ubuntu: [libfoo]\n',
+    '/drop.yaml': 'bar:\n  ubuntu: [libbar]\n',
+    '/busy.yaml': 'baz:\n  ubuntu: [libbaz]\n',
+    '/gzip.yaml': 'foo:\n  ubuntu: [libfoo-gzip]\n' * 100,
+    '/deflate.yaml': 'foo:\n  ubuntu: [libfoo-deflate]\n' * 100,
+    '/large.yaml': 'föö-{0}:\n  ubuntu: [libfoo]\n' * 20000,
+    '/invalid.yaml': b'f\xf6\xf6:\n  ubuntu: [libfoo]\n',
+}
+
+_etag = '"v1"'
+_last_modified = 'Thu, 01 Jan 2015 00:00:00 GMT'
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class RulesRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    connections = []
+    busy = 0
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connections.append(self.client_address)
+
+    def send_empty(self, code, headers={}):
+        self.send_response(code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path == '/redirect':
+            self.send_empty(302, {'Location': '/rules.yaml'})
+            return
+        if self.path == '/busy.yaml' and RulesRequestHandler.busy:
+            RulesRequestHandler.busy -= 1
+            self.send_empty(503)
+            return
+        if self.path not in _content:
+            self.send_empty(404)
+            return
+        if self.headers.get('If-None-Match') == _etag or \
+                self.headers.get('If-Modified-Since') == _last_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = _content[self.path]
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        encoding = self.path[1:-len('.yaml')]
+        accepted = self.headers.get('Accept-Encoding', '')
+        self.send_response(200)
+        if encoding in ('gzip', 'deflate') and encoding in accepted:
+            body = _gzip(body) if encoding == 'gzip' else zlib.compress(body)
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', _etag)
+        self.send_header('Last-Modified', _last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/drop.yaml':
+            # close the connection without announcing it to the client
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class LoadUrlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        RulesRequestHandler.requests = []
+        RulesRequestHandler.connections = []
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), RulesRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_load_url(self):
+        data = load_url(self.base_url + '/rules.yaml')
+        assert data == _content['/rules.yaml']
+        self.assertRaises(DownloadFailure, load_url,
+                          self.base_url + '/missing.yaml', retry=0)
+
+    def test_load_url_if_modified(self):
+        url = self.base_url + '/rules.yaml'
+        data, validators = load_url_if_modified(url)
+        assert data == _content['/rules.yaml']
+        assert validators == {'etag': _etag, 'last_modified': _last_modified}
+
+        data, new_validators = load_url_if_modified(url, validators)
+        assert data is None
+        assert new_validators == validators
+
+        data, _ = load_url_if_modified(url, {'last_modified': _last_modified})
+        assert data is None
+
+        data, _ = load_url_if_modified(url, {'etag': '"v0"'})
+        assert data == _content['/rules.yaml']
+
+    def test_pooled_connections(self):
+        url = self.base_url + '/rules.yaml'
+        with pooled_connections():
+            for _ in range(3):
+                assert load_url(url) == _content['/rules.yaml']
+            assert load_url(self.base_url + '/redirect') == \
+                _content['/rules.yaml']
+            self.assertRaises(DownloadFailure, load_url,
+                              self.base_url + '/missing.yaml', retry=0)
+            assert len(RulesRequestHandler.connections) == 1
+        assert len(RulesRequestHandler.requests) == 6
+
+        # without pool every request uses a new connection
+        load_url(url)
+        load_url(url)
+        assert len(RulesRequestHandler.connections) == 3
+
+    def test_pooled_connection_dropped(self):
+        with pooled_connections():
+            for _ in range(2):
+                assert load_url(self.base_url + '/drop.yaml') == \
+                    _content['/drop.yaml']
+        assert len(RulesRequestHandler.requests) == 2
+        assert len(RulesRequestHandler.connections) == 2
+
+    def test_retry(self):
+        url = self.base_url + '/busy.yaml'
+        RulesRequestHandler.busy = 2
+        with pooled_connections():
+            assert load_url(url, retry_period=0) == _content['/busy.yaml']
+        RulesRequestHandler.busy = 2
+        self.assertRaises(DownloadFailure, load_url, url, retry=1,
+                          retry_period=0)
+
+    def test_content_encoding(self):
+        for path in ['/gzip.yaml', '/deflate.yaml']:
+            assert load_url(self.base_url + path) == _content[path]
+        # content that does not match its charset is not loaded
+        self.assertRaises(DownloadFailure, load_url,
+                          self.base_url + '/invalid.yaml')
+
+    def test_load_url_raw(self):
+        url = self.base_url + '/gzip.yaml'
+        data, content_encoding = load_url_raw(url)
+        assert content_encoding == 'gzip'
+        assert decode_content(data, content_encoding) == \
+            _content['/gzip.yaml'].encode('utf-8')
+        assert load_url_raw(url, 'identity') == \
+            (_content['/gzip.yaml'].encode('utf-8'), None)
+        self.assertRaises(DownloadFailure, load_url_raw,
+                          self.base_url + '/missing.yaml')
+
+    def test_stream_url(self):
+        url = self.base_url + '/large.yaml'
+        with pooled_connections():
+            chunks, validators = stream_url_if_modified(url)
+            assert validators['etag'] == _etag
+            chunks = list(chunks)
+            assert len(chunks) > 1
+            assert ''.join(chunks) == _content['/large.yaml']
+            # the connection is reused once the content has been read
+            assert load_url(url) == _content['/large.yaml']
+            assert len(RulesRequestHandler.connections) == 1
+            chunks, _ = stream_url_if_modified(url, validators)
+            assert chunks is None
+
+    def test_decode_content(self):
+        data = b'foo: [bar]\n' * 10
+        assert decode_content(data, None) == data
+        assert decode_content(data, 'identity') == data
+        assert decode_content(_gzip(data), 'gzip') == data
+        assert decode_content(zlib.compress(data), 'deflate') == data
+        raw = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        raw = raw.compress(data) + raw.flush()
+        assert decode_content(raw, 'Deflate') == data
+        assert decode_content(_gzip(zlib.compress(data)),
+                              'deflate, gzip') == data
+        self.assertRaises(ValueError, decode_content, data, 'gzip')
+        self.assertRaises(ValueError, decode_content, data, 'br')
@@ -0,0 +1,140 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for mirroring sources into a local directory."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from six.moves.urllib.request import pathname2url
+
+from xylem.config import get_default_config
+from xylem.mirror import mirror
+from xylem.sources import RulesDatabase
+from xylem.sources import SourcesContext
+from xylem.specs.plugins.rules import RulesSpec
+from xylem.yaml_utils import load_yaml
+
+
+class MirrorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+        self.mirror_dir = os.path.join(self.tempdir, 'mirror')
+        self.sources_dir = os.path.join(self.tempdir, 'sources.d')
+        os.makedirs(self.sources_dir)
+        self.write('foo.yaml', 'foo:\n  ubuntu: [libfoo]\n')
+        self.write('bar.yaml', 'bar:\n  ubuntu: [libbar]\n')
+        self.foo_url = 'file://' + pathname2url(self.path('foo.yaml'))
+        self.write_sources(
+            "- rules: '{0}'\n  max_age: 60\n- rules: '{1}'\n".
+            format(self.foo_url, self.path('bar.yaml')))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def path(self, name):
+        return os.path.join(self.tempdir, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+
+    def write_sources(self, content):
+        with open(os.path.join(self.sources_dir, '10-test.yaml'), 'w') as f:
+            f.write(content)
+
+    def sources_context(self, sources_dir):
+        config = get_default_config()
+        config.sources_dir = sources_dir
+        config.cache_dir = os.path.join(self.tempdir, 'cache')
+        return SourcesContext(config, spec_plugins=[RulesSpec()])
+
+    def mirror(self, **kwargs):
+        return mirror(self.mirror_dir,
+                      sources_context=self.sources_context(self.sources_dir),
+                      **kwargs)
+
+    def read_index(self):
+        with open(os.path.join(self.mirror_dir, 'index.yaml')) as f:
+            return dict((e['url'], e) for e in load_yaml(f.read()) or [])
+
+    def read_sources(self):
+        path = os.path.join(self.mirror_dir, 'sources.d', '10-test.yaml')
+        with open(path) as f:
+            return load_yaml(f.read())
+
+    def test_mirror(self):
+        assert self.mirror()
+        index = self.read_index()
+        assert sorted(index) == sorted([self.foo_url, self.path('bar.yaml')])
+        foo_path = os.path.join(self.mirror_dir, index[self.foo_url]['file'])
+        with open(foo_path) as f:
+            assert f.read() == 'foo:\n  ubuntu: [libfoo]\n'
+        sources = self.read_sources()
+        assert sources == [
+            {'rules': foo_path, 'max_age': 60},
+            {'rules': os.path.join(self.mirror_dir,
+                                   index[self.path('bar.yaml')]['file'])}]
+
+        # the mirrored sources can be used instead of the original ones
+        database = RulesDatabase(self.sources_context(
+            os.path.join(self.mirror_dir, 'sources.d')))
+        database.load_from_source()
+        assert [list(s.data.items()) for s in database.sources] == [
+            [('foo', {'ubuntu': {'any_version': {
+                'default_installer': {'packages': ['libfoo']}}}})],
+            [('bar', {'ubuntu': {'any_version': {
+                'default_installer': {'packages': ['libbar']}}}})]]
+
+        # unchanged files are not touched
+        os.utime(foo_path, (1000, 1000))
+        assert self.mirror()
+        assert os.path.getmtime(foo_path) == 1000
+        self.write('foo.yaml', 'foo:\n  ubuntu: [libfoo2]\n')
+        assert self.mirror()
+        assert os.path.getmtime(foo_path) != 1000
+        assert self.read_index()[self.foo_url]['sha1'] != \
+            index[self.foo_url]['sha1']
+
+    def test_mirror_base_url(self):
+        assert self.mirror(base_url='http://example.com/mirror/')
+        index = self.read_index()
+        assert self.read_sources()[0]['rules'] == \
+            'http://example.com/mirror/' + index[self.foo_url]['file']
+
+    def test_mirror_failure(self):
+        assert self.mirror()
+        index = self.read_index()
+        bar_file = index[self.path('bar.yaml')]['file']
+        os.remove(self.path('foo.yaml'))
+        assert not self.mirror()
+        # the previously mirrored file is kept
+        assert self.read_index()[self.foo_url]['file'] == \
+            index[self.foo_url]['file']
+
+        # files of removed sources are removed
+        self.write_sources("- rules: '{0}'\n".format(self.foo_url))
+        assert not self.mirror()
+        assert list(self.read_index()) == [self.foo_url]
+        assert not os.path.exists(os.path.join(self.mirror_dir, bar_file))
+
+        self.write_sources("- rules: '{0}'\n".format(self.path('baz.yaml')))
+        assert not self.mirror()
+        assert self.read_index() == {}
+        assert self.read_sources() == [{'rules': self.path('baz.yaml')}]
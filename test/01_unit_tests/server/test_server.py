@@ -0,0 +1,145 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the resolution server."""
+
+from __future__ import unicode_literals
+
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from xylem.commands.lookup import lookup_with_server
+from xylem.commands.resolve import resolve_with_server
+from xylem.config import get_default_config
+from xylem.installers import InstallerContext
+from xylem.server import ServerError
+from xylem.server import XylemServer
+from xylem.server import request
+from xylem.session import XylemSession
+from xylem.sources import SourcesContext
+from xylem.specs.plugins.rules import RulesSpec
+
+
+class FakeInstallerContext(InstallerContext):
+
+    """Installer context for a fixed os without loading plugins."""
+
+    def __init__(self):
+        pass
+
+    def get_os_tuple(self):
+        return ('ubuntu', 'trusty')
+
+    def get_os_string(self):
+        return 'ubuntu:trusty'
+
+    def get_default_installer_name(self):
+        return 'apt'
+
+
+class XylemServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+        config = get_default_config()
+        config.sources_dir = os.path.join(self.tempdir, 'sources.d')
+        config.cache_dir = os.path.join(self.tempdir, 'cache')
+        os.makedirs(config.sources_dir)
+        self.rules_path = os.path.join(self.tempdir, 'rules.yaml')
+        self.write_rules('foo:\n  ubuntu: [libfoo]\n')
+        with open(os.path.join(config.sources_dir, '10-test.yaml'), 'w') as f:
+            f.write("- rules: '{0}'\n".format(self.rules_path))
+        self.config = config
+        self.session = XylemSession(
+            config, SourcesContext(config, spec_plugins=[RulesSpec()]),
+            FakeInstallerContext())
+        self.session.update()
+        self.socket_path = os.path.join(self.tempdir, 'xylem.sock')
+        self.server = XylemServer(self.session, self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.session.close()
+        shutil.rmtree(self.tempdir)
+
+    def write_rules(self, content):
+        with open(self.rules_path, 'w') as f:
+            f.write(content)
+
+    def request(self, command, **arguments):
+        return request(command, self.config, self.socket_path, **arguments)
+
+    def test_requests(self):
+        assert self.request('ping')['os'] == 'ubuntu:trusty'
+        assert self.request('keys') == ['foo']
+        assert self.request('lookup', keys=['foo', 'bar']) == dict(
+            os='ubuntu:trusty', rules=[['foo', ['libfoo']], ['bar', {}]])
+        result = self.request('resolve', keys=['bar'])
+        assert result['results'] == []
+        assert result['errors'][0][0] == 'bar'
+        assert "could not find rule for xylem key 'bar'" in \
+            result['errors'][0][1]
+        self.assertRaises(ServerError, self.request, 'unknown')
+
+        # the database is reloaded once the cache changes
+        self.write_rules('foo:\n  ubuntu: [libfoo]\nbar:\n  ubuntu: [bar]\n')
+        self.session.update()
+        assert self.request('keys') == ['bar', 'foo']
+        assert self.session.reloads == 2
+
+    def test_config_mismatch(self):
+        config = get_default_config()
+        config.update(self.config)
+        config.os_override = 'ubuntu:precise'
+        self.assertRaises(ServerError, request, 'ping', config,
+                          self.socket_path)
+
+    def test_socket(self):
+        # only one server per socket
+        self.assertRaises(ServerError, XylemServer, self.session,
+                          self.socket_path)
+
+        # stale sockets are replaced and removed when closing
+        stale_path = os.path.join(self.tempdir, 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(stale_path)
+        stale.close()
+        server = XylemServer(self.session, stale_path)
+        server.server_close()
+        assert not os.path.exists(stale_path)
+        self.assertRaises(ServerError, request, 'ping', self.config,
+                          stale_path)
+
+    def test_commands_socket(self):
+        args = argparse.Namespace(xylem_key=['foo'], all=False,
+                                  socket=self.socket_path)
+        assert lookup_with_server(args, self.config) == \
+            ('ubuntu:trusty', [['foo', ['libfoo']]])
+        args.xylem_key = ['bar']
+        default_installer, results, messages = resolve_with_server(
+            args, self.config)
+        assert default_installer == 'apt' and results == []
+        assert "could not find rule for xylem key 'bar'" in messages[0]
+        args.socket = os.path.join(self.tempdir, 'other.sock')
+        assert lookup_with_server(args, self.config) is None
+        assert resolve_with_server(args, self.config) is None
@@ -0,0 +1,95 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for long-lived xylem sessions."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from xylem.config import get_default_config
+from xylem.installers import InstallerContext
+from xylem.session import XylemSession
+from xylem.sources import SourcesContext
+from xylem.specs.plugins.rules import RulesSpec
+
+
+class FakeInstallerContext(InstallerContext):
+
+    """Installer context for a fixed os without loading plugins."""
+
+    def __init__(self):
+        pass
+
+    def get_os_tuple(self):
+        return ('ubuntu', 'trusty')
+
+    def get_os_string(self):
+        return 'ubuntu:trusty'
+
+    def get_default_installer_name(self):
+        return 'apt'
+
+
+class XylemSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+        config = get_default_config()
+        config.sources_dir = os.path.join(self.tempdir, 'sources.d')
+        config.cache_dir = os.path.join(self.tempdir, 'cache')
+        os.makedirs(config.sources_dir)
+        self.rules_path = os.path.join(self.tempdir, 'rules.yaml')
+        self.write_rules('foo:\n  ubuntu: [libfoo]\n')
+        with open(os.path.join(config.sources_dir, '10-test.yaml'), 'w') as f:
+            f.write("- rules: '{0}'\n".format(self.rules_path))
+        self.session = XylemSession(
+            config, SourcesContext(config, spec_plugins=[RulesSpec()]),
+            FakeInstallerContext())
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.tempdir)
+
+    def write_rules(self, content):
+        with open(self.rules_path, 'w') as f:
+            f.write(content)
+
+    def test_reload(self):
+        session = self.session
+        session.update()
+        assert session.lookup('foo') == {'apt': {'packages': ['libfoo']}}
+        assert session.lookup('foo', compact=True) == ['libfoo']
+        database = session.database
+        assert session.lookup_many(['foo', 'bar']) == {
+            'foo': {'apt': {'packages': ['libfoo']}}, 'bar': {}}
+        assert session.database is database and session.reloads == 1
+
+        # the database is reloaded once the cache changes
+        self.write_rules('foo:\n  ubuntu: [libfoo2]\nbar:\n  ubuntu: [bar]\n')
+        session.update()
+        assert session.lookup('foo') == {'apt': {'packages': ['libfoo2']}}
+        assert session.lookup('bar') == {'apt': {'packages': ['bar']}}
+        assert session.database is not database and session.reloads == 2
+
+    def test_no_reload_sqlite(self):
+        self.session.sources_context.database_backend = 'sqlite'
+        session = self.session
+        session.update()
+        for _ in range(5):
+            assert session.lookup('foo') == {'apt': {'packages': ['libfoo']}}
+        assert session.reloads == 1
@@ -0,0 +1,144 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the serialization formats of cached sources."""
+
+from __future__ import unicode_literals
+
+import unittest
+
+import six.moves.cPickle as pickle
+
+from xylem.sources.cache_format import UnknownCacheFormatError
+from xylem.sources.cache_format import cache_format_of
+from xylem.sources.cache_format import compress_data
+from xylem.sources.cache_format import decompress_data
+from xylem.sources.cache_format import dump_data
+from xylem.sources.cache_format import load_compact_rules
+from xylem.sources.cache_format import load_data
+from xylem.sources.rules_dict import build_os_key_index
+from xylem.sources.rules_dict import has_rule_for_os
+from xylem.sources.rules_dict import lookup_os_key_index
+from xylem.sources.rules_dict import verify_rules_dict
+from xylem.specs.plugins.rules import expand_rules
+from xylem.yaml_utils import load_yaml
+
+
+_rules = """
+foo:
+  ubuntu:
+    trusty: [libfoo, libfoo-dev]
+    precise:
+      apt:
+        packages: [libfoo]
+        depends: [bar]
+  osx:
+    homebrew:
+      packages: [foo]
+      options: {build: true, jobs: 2, ratio: 0.5, extra: null}
+bar:
+  any_os:
+    pip: [bar]
+"""
+
+
+class CacheFormatTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = expand_rules(load_yaml(_rules))
+
+    def test_round_trip(self):
+        for cache_format in ['compact', 'pickle']:
+            blob = dump_data(self.rules, cache_format)
+            assert cache_format_of(blob) == cache_format
+            data = load_data(blob)
+            assert sorted(data.keys()) == ['bar', 'foo']
+            assert 'foo' in data and 'baz' not in data
+            assert data == self.rules
+            verify_rules_dict(data)
+
+    def test_compact_is_lazy(self):
+        data = load_data(dump_data(self.rules, 'compact'))
+        assert data._decoded == {}
+        assert data['bar'] == self.rules['bar']
+        assert list(data._decoded.keys()) == ['bar']
+        # identical strings are shared between decoded keys
+        trusty = data['foo']['ubuntu']['trusty']['default_installer']
+        precise = data['foo']['ubuntu']['precise']['apt']
+        assert trusty['packages'][0] is precise['packages'][0]
+
+    def test_compact_offset(self):
+        blob = dump_data(self.rules, 'compact')
+        data = load_compact_rules(b'padding' + blob, len(b'padding'))
+        # lookups use binary search in the key table
+        assert data['foo'] == self.rules['foo']
+        assert 'bar' in data and 'baz' not in data and 'aaa' not in data
+        self.assertRaises(KeyError, lambda: data['zzz'])
+        assert data._strings is None
+        assert sorted(data) == ['bar', 'foo']
+
+    def test_keys_for_os(self):
+        data = load_data(dump_data(self.rules, 'compact'))
+        assert sorted(data.keys_for_os('ubuntu', 'trusty')) == ['bar', 'foo']
+        assert data.keys_for_os('ubuntu', 'lucid') == ['bar']
+        assert data.keys_for_os('unknown', 'version') == ['bar']
+        assert data._decoded == {}
+        for os_name, os_version in [('osx', 'lion'), ('osx', 'homebrew'),
+                                    ('ubuntu', 'precise')]:
+            expected = [k for k, os_dict in self.rules.items()
+                        if has_rule_for_os(os_dict, os_name, os_version)]
+            assert sorted(data.keys_for_os(os_name, os_version)) == \
+                sorted(expected)
+
+    def test_os_key_index(self):
+        index = build_os_key_index(self.rules)
+        assert index == {
+            'ubuntu': {'trusty': ['foo'], 'precise': ['foo']},
+            'osx': {'homebrew': ['foo']},
+            'any_os': {'any_version': ['bar']}}
+        data = load_data(dump_data(self.rules, 'compact'))
+        assert data.os_key_index() == index
+        assert data._decoded == {}
+        for os_name, os_version in [('osx', 'lion'), ('ubuntu', 'trusty'),
+                                    ('ubuntu', 'lucid'), ('unknown', 'x')]:
+            expected = [k for k, os_dict in self.rules.items()
+                        if has_rule_for_os(os_dict, os_name, os_version)]
+            assert lookup_os_key_index(index, os_name, os_version) == \
+                set(expected)
+
+    def test_compact_fallback(self):
+        data = {'foo': ('not', 'a', 'rules', 'dict')}
+        blob = dump_data(data, 'compact')
+        assert cache_format_of(blob) == 'pickle'
+        assert load_data(blob) == data
+
+    def test_compact_pickle(self):
+        data = load_data(dump_data(self.rules, 'compact'))
+        assert pickle.loads(pickle.dumps(data, protocol=2)) == self.rules
+
+    def test_compression(self):
+        blob = dump_data(self.rules, 'compact')
+        assert compress_data(blob, 'none') == blob
+        compressed = compress_data(blob, 'zlib')
+        assert len(compressed) < len(blob)
+        assert decompress_data(compressed, 'zlib') == blob
+        self.assertRaises(ValueError, decompress_data, blob, 'zlib')
+        self.assertRaises(UnknownCacheFormatError, compress_data, blob, 'xz')
+
+    def test_invalid(self):
+        self.assertRaises(UnknownCacheFormatError, dump_data, {}, 'json')
+        blob = dump_data(self.rules, 'compact')
+        self.assertRaises(ValueError, load_data, blob[:20])
+        self.assertRaises(ValueError, load_data,
+                          blob[:7] + b'\xff' + blob[8:])
@@ -0,0 +1,482 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the rules database."""
+
+from __future__ import unicode_literals
+
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+
+from xylem.config import get_default_config
+from xylem.sources import RulesDatabase
+from xylem.sources import RulesSource
+from xylem.sources import SourcesContext
+from xylem.sources.cache_format import CompactRulesDict
+from xylem.specs.plugins.rules import RulesSpec
+from xylem.specs.plugins.rules import expand_rules
+from xylem.yaml_utils import load_yaml
+from xylem.util import redirected_stdio
+
+
+_fake_urls = {
+    'slow': """
+    foo:
+      ubuntu: [libfoo]
+    """,
+    'fast': """
+    foo:
+      ubuntu: [libfoo-fast]
+    bar:
+      any_os:
+        pip: [bar]
+    """,
+}
+
+
+class FakeRulesSpec(RulesSpec):
+
+    """Rules spec loading from `_fake_urls` instead of the net.
+
+    The fake urls' content is used as etag.
+    """
+
+    def __init__(self):
+        self.requested = []
+        self.loaded = []
+        self.verified = 0
+        self.spec_version = 1
+
+    @property
+    def version(self):
+        return self.spec_version
+
+    def verify_data(self, data, arguments):
+        self.verified += 1
+        return super(FakeRulesSpec, self).verify_data(data, arguments)
+
+    def load_data_if_modified(self, arguments, validators):
+        if arguments not in _fake_urls:
+            raise ValueError("unknown fake url '{0}'".format(arguments))
+        self.requested.append(arguments)
+        if arguments == 'slow':
+            # make sure the sources finish out of order when run in parallel
+            time.sleep(0.1)
+        content = _fake_urls[arguments]
+        if validators and validators.get('etag') == content:
+            return None, validators
+        self.loaded.append(arguments)
+        return expand_rules(load_yaml(content)), dict(etag=content)
+
+
+class FakeInstallerContext(object):
+
+    def __init__(self, os_tuple=('ubuntu', 'trusty'), default='apt'):
+        self.os_tuple = os_tuple
+        self.default = default
+
+    def get_os_tuple(self):
+        return self.os_tuple
+
+    def get_default_installer_name(self):
+        return self.default
+
+
+class RulesDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+        config = get_default_config()
+        config.sources_dir = os.path.join(self.tempdir, 'sources.d')
+        config.cache_dir = os.path.join(self.tempdir, 'cache')
+        os.makedirs(config.sources_dir)
+        self.spec = FakeRulesSpec()
+        self.sources_context = SourcesContext(
+            config=config, spec_plugins=[self.spec])
+        self.sources_context.ensure_cache_dir()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def make_database(self, urls, max_age=None):
+        database = RulesDatabase(self.sources_context)
+        database.sources = [
+            RulesSource(self.spec, url, 'test', self.sources_context,
+                        max_age=max_age)
+            for url in urls]
+        return database
+
+    def test_update_parallel(self):
+        database = self.make_database(['slow', 'fast'])
+        database.jobs = 2
+        database.print_info = True
+        thread_counts = []
+        with redirected_stdio() as (out, err), mock.patch.object(
+                self.spec, 'verify_data', side_effect=lambda data, args:
+                thread_counts.append(threading.active_count())):
+            database.update()
+        lines = out.getvalue().splitlines()
+        assert 'slow' in lines[1] and 'fast' in lines[2], lines
+        # data is verified once the loading threads have finished
+        assert thread_counts == [1, 1]
+
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache()
+        ic = FakeInstallerContext()
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+        assert database.lookup('bar', ic) == {'pip': {'packages': ['bar']}}
+
+    def test_update_errors(self):
+        database = self.make_database(['fast', 'invalid', 'slow'])
+        database.jobs = 3
+        self.assertRaises(ValueError, database.update)
+        assert database.sources[0].is_cache_available()
+        assert not database.sources[2].is_cache_available()
+
+        database.raise_on_error = False
+        with redirected_stdio():
+            database.update()
+        assert database.sources[2].is_cache_available()
+
+    def test_update_unchanged(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        assert sorted(self.spec.loaded) == ['fast', 'slow']
+
+        old_fast = _fake_urls['fast']
+        try:
+            _fake_urls['fast'] = old_fast + "baz: {ubuntu: [libbaz]}\n"
+            database = self.make_database(['slow', 'fast'])
+            database.update()
+            assert database.sources[0].data_unchanged
+            assert not database.sources[1].data_unchanged
+            assert sorted(self.spec.loaded) == ['fast', 'fast', 'slow']
+
+            database = self.make_database(['slow', 'fast'])
+            database.load_from_cache()
+            assert database.lookup('baz', FakeInstallerContext())
+        finally:
+            _fake_urls['fast'] = old_fast
+
+    def test_update_unchanged_then_lookup(self):
+        self.make_database(['slow', 'fast']).update()
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        assert all(s.data_unchanged for s in database.sources)
+        # unchanged sources are read from cache when queried
+        ic = FakeInstallerContext()
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+        assert sorted(database.keys(ic)) == ['bar', 'foo']
+
+    def test_update_unchanged_rewrites_foreign_cache(self):
+        database = self.make_database(['fast'])
+        database.update()
+        assert database.sources[0].is_cache_reusable()
+
+        # caches of other spec versions or cache formats are not kept
+        self.spec.spec_version = 2
+        assert not database.sources[0].is_cache_reusable()
+        database.update()
+        assert not database.sources[0].data_unchanged
+        assert database.sources[0].is_cache_reusable()
+        self.sources_context.cache_format = 'pickle'
+        database.update()
+        assert not database.sources[0].data_unchanged
+        assert self.spec.loaded == ['fast', 'fast', 'fast']
+        database.update()
+        assert database.sources[0].data_unchanged
+
+    def test_update_incremental(self):
+        database = self.make_database(['slow', 'fast'], max_age=3600)
+        database.update(incremental=True)
+        assert sorted(self.spec.requested) == ['fast', 'slow']
+        database = self.make_database(['slow', 'fast'], max_age=3600)
+        database.update(incremental=True)
+        assert len(self.spec.requested) == 2
+        assert all(s.cache_fresh and s.data_unchanged
+                   for s in database.sources)
+        # sources skipped as up to date are read from cache when queried
+        ic = FakeInstallerContext()
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+        assert sorted(database.keys(ic)) == ['bar', 'foo']
+
+        # outdated according to max age
+        database = self.make_database(['slow', 'fast'], max_age=0)
+        time.sleep(0.01)
+        database.update(incremental=True)
+        assert len(self.spec.requested) == 4
+        assert not any(s.cache_fresh for s in database.sources)
+
+        # remote rules files are always outdated according to the spec
+        database = self.make_database(['fast'])
+        assert database.sources[0].is_cache_outdated()
+        database.update(incremental=True)
+        assert len(self.spec.requested) == 5
+
+    def test_cache_outdated_reads_header_only(self):
+        database = self.make_database(['fast'], max_age=3600)
+        database.update()
+        source = database.sources[0]
+        with open(source.cache_file_path(), 'rb') as f:
+            content = f.read()
+        with open(source.cache_file_path(), 'wb') as f:
+            f.write(content.replace(b'libfoo-fast', b'libfoo-slow'))
+        # the corrupt data is not read
+        assert not source.is_cache_outdated()
+        self.assertRaises(ValueError, source.load_from_cache)
+
+    def test_lookup_index(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        ic = FakeInstallerContext()
+        assert database.save_index(ic)
+
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache(ic)
+        assert database.index is not None
+        assert all(s.data is None for s in database.sources)
+        assert sorted(database.keys(ic)) == ['bar', 'foo']
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+        assert database.lookup('baz', ic) == {}
+
+        # sources are loaded on demand for other installer contexts
+        other_ic = FakeInstallerContext(default='pip')
+        assert database.lookup('foo', other_ic) == \
+            {'pip': {'packages': ['libfoo']}}
+        assert sorted(database.keys(other_ic)) == ['bar', 'foo']
+        assert database.lookup_many(['bar'], other_ic) == \
+            {'bar': {'pip': {'packages': ['bar']}}}
+
+        # index is invalid for different os, default installer or sources
+        other_ic = FakeInstallerContext(os_tuple=('ubuntu', 'precise'))
+        assert not database.load_index(other_ic)
+        other_ic = FakeInstallerContext(default='pip')
+        assert not database.load_index(other_ic)
+        assert not self.make_database(['fast', 'slow']).load_index(ic)
+        # the index stays valid if unchanged caches are touched
+        updated = self.make_database(['slow', 'fast'])
+        updated.update()
+        assert all(s.data_unchanged for s in updated.sources)
+        assert database.load_index(ic)
+        database.sources[1].clear_cache()
+        assert not database.load_index(ic)
+
+    def test_merged_rules(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache(lazy=True)
+        ic = FakeInstallerContext()
+        expected = dict((k, database.lookup(k, ic)) for k in ['foo', 'bar'])
+        merged = database.merged_rules({'ubuntu': 'apt'})
+        assert merged == {
+            'foo': {'ubuntu': {'any_version': {
+                'apt': {'packages': ['libfoo']}}}},
+            'bar': {'any_os': {'any_version': {
+                'pip': {'packages': ['bar']}}}}}
+        assert database.merged_rules({'ubuntu': 'apt'}) is merged
+
+        # lookups are answered from the merged rules
+        for source in database.sources:
+            source.data = None
+        assert sorted(database.keys(ic)) == ['bar', 'foo']
+        for xylem_key, installer_dict in expected.items():
+            assert database.lookup(xylem_key, ic) == installer_dict
+        other_ic = FakeInstallerContext(default='pip')
+        self.assertRaises(Exception, database.lookup, 'foo', other_ic)
+
+        # loading the sources again invalidates the merged rules
+        database.load_from_cache()
+        assert database.lookup('foo', other_ic) == \
+            {'pip': {'packages': ['libfoo']}}
+        database.prepare_bulk_lookup(other_ic)
+        for source in database.sources:
+            source.data = None
+        assert database.lookup('foo', other_ic) == \
+            {'pip': {'packages': ['libfoo']}}
+
+    def test_lookup_many(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        ic = FakeInstallerContext()
+        keys = ['foo', 'bar', 'baz']
+        expected = dict((k, database.lookup(k, ic)) for k in keys)
+        assert database.lookup_many(keys, ic) == expected
+
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache(lazy=True)
+        slow, fast = database.sources
+        assert database.lookup_many(['bar'], ic) == {'bar': expected['bar']}
+        # 'slow' does not define 'bar' according to its key manifest
+        assert slow.data is None and fast.data is not None
+        assert database.lookup_many(keys, ic) == expected
+
+        # lookups from merged rules and lookup index give the same result
+        database.prepare_bulk_lookup(ic)
+        assert database.lookup_many(keys, ic) == expected
+        assert database.save_index(ic)
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache(ic)
+        assert database.index is not None
+        assert database.lookup_many(keys, ic) == expected
+
+    def test_os_key_index(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        ic = FakeInstallerContext()
+        other_ic = FakeInstallerContext(os_tuple=('osx', 'lion'))
+
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache(lazy=True)
+        # keys are found with the index stored alongside the cache
+        assert sorted(database.keys(ic)) == ['bar', 'foo']
+        assert database.keys(other_ic) == ['bar']
+        assert all(s.data is None for s in database.sources)
+
+        # without stored index, it is built from the data once
+        for source in database.sources:
+            os.remove(source.cache_meta_file_path())
+        database.load_from_cache()
+        assert sorted(database.keys(ic)) == ['bar', 'foo']
+        for source in database.sources:
+            source.data = None
+        assert database.keys(other_ic) == ['bar']
+
+    def test_lookup_memo(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+        ic = FakeInstallerContext()
+        other_ic = FakeInstallerContext(default='pip')
+        memo = database.lookup_memo
+        foo = database.lookup('foo', ic)
+        assert (memo.hits, memo.misses) == (0, 1)
+        # memoized results are not merged again and can't be modified
+        for source in database.sources:
+            source.data = None
+        foo['apt']['packages'].append('libbar')
+        foo['pip'] = None
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+        assert (memo.hits, memo.misses) == (1, 1)
+        assert database.lookup_many(['foo'], ic) == {'foo': database.lookup(
+            'foo', ic)}
+        assert memo.hits == 3
+        self.assertRaises(Exception, database.lookup, 'foo', other_ic)
+
+        # loading or updating the sources invalidates the memo
+        generation = database.generation
+        database.load_from_cache()
+        assert database.generation > generation and len(memo) == 0
+        assert database.lookup('foo', other_ic) == \
+            {'pip': {'packages': ['libfoo']}}
+        database.update()
+        assert len(memo) == 0
+
+    def test_lazy_load(self):
+        database = self.make_database(['slow', 'fast'])
+        database.update()
+
+        database = self.make_database(['slow', 'fast'])
+        database.load_from_cache(lazy=True)
+        slow, fast = database.sources
+        assert slow.data is None and fast.data is None
+        ic = FakeInstallerContext()
+        assert database.lookup('bar', ic) == {'pip': {'packages': ['bar']}}
+        # 'slow' does not define 'bar' according to its key manifest
+        assert slow.data is None and fast.data is not None
+        assert database.lookup('foo', ic) == {'apt': {'packages': ['libfoo']}}
+        assert slow.data is not None
+
+        slow.clear_cache()
+        self.assertRaises(IOError, slow.load_from_cache, lazy=True)
+
+    def test_lazy_load_stale_manifest(self):
+        database = self.make_database(['fast'])
+        database.update()
+        meta_path = database.sources[0].cache_meta_file_path()
+        with open(meta_path, 'rb') as f:
+            old_meta = f.read()
+        old_fast = _fake_urls['fast']
+        try:
+            _fake_urls['fast'] = old_fast + "baz: {ubuntu: [libbaz]}\n"
+            database.update()
+        finally:
+            _fake_urls['fast'] = old_fast
+        # meta data not belonging to the cached data is ignored
+        with open(meta_path, 'wb') as f:
+            f.write(old_meta)
+        database = self.make_database(['fast'])
+        database.load_from_cache(lazy=True)
+        ic = FakeInstallerContext()
+        assert sorted(database.keys(ic)) == ['bar', 'baz', 'foo']
+        assert database.lookup('baz', ic) == {'apt': {'packages': ['libbaz']}}
+
+    def test_mmap_cache(self):
+        database = self.make_database(['fast'])
+        database.update()
+        source = self.make_database(['fast']).sources[0]
+        source.load_from_cache()
+        assert isinstance(source.data, CompactRulesDict)
+        ic = FakeInstallerContext()
+        assert sorted(source.keys(ic)) == ['bar', 'foo']
+        assert source.lookup('foo', ic) == \
+            {'apt': {'packages': ['libfoo-fast']}}
+
+        # the mapped data stays valid when the cache file is removed
+        database.sources[0].clear_cache()
+        assert source.lookup('bar', ic) == {'pip': {'packages': ['bar']}}
+
+        self.sources_context.cache_format = 'pickle'
+        database.update()
+        source.load_from_cache()
+        assert isinstance(source.data, dict)
+        assert sorted(source.keys(ic)) == ['bar', 'foo']
+
+    def test_compressed_cache(self):
+        self.sources_context.cache_compression = 'zlib'
+        database = self.make_database(['fast'])
+        database.update()
+        source = self.make_database(['fast']).sources[0]
+        source.load_from_cache()
+        # decompressed data is not memory-mapped, but still compact
+        assert isinstance(source.data, CompactRulesDict)
+        assert not isinstance(source.data._buf, mmap.mmap)
+        ic = FakeInstallerContext()
+        assert sorted(source.keys(ic)) == ['bar', 'foo']
+        assert source.lookup('foo', ic) == \
+            {'apt': {'packages': ['libfoo-fast']}}
+
+    def test_trusted_cache(self):
+        database = self.make_database(['fast'])
+        database.update()
+        assert self.spec.verified == 1
+        source = database.sources[0]
+        source.load_from_cache()
+        assert self.spec.verified == 1
+        self.sources_context.paranoid = True
+        source.load_from_cache()
+        assert self.spec.verified == 2
+
+        # corrupt the pickled data
+        with open(source.cache_file_path(), 'rb') as f:
+            content = f.read()
+        with open(source.cache_file_path(), 'wb') as f:
+            f.write(content.replace(b'libfoo-fast', b'libfoo-slow'))
+        self.assertRaises(ValueError, source.load_from_cache)
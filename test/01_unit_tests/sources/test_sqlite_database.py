@@ -0,0 +1,166 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the SQLite rules database backend."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from xylem.config import get_default_config
+from xylem.sources import RulesSource
+from xylem.sources import RulesDatabase
+from xylem.sources import SQLiteRulesDatabase
+from xylem.sources import SourcesContext
+from xylem.sources import create_rules_database
+
+from .test_database import FakeInstallerContext
+from .test_database import FakeRulesSpec
+from .test_database import _fake_urls
+
+
+_fake_urls['sqlite'] = """
+foo:
+  any_os:
+    pip: [foo-any]
+  ubuntu:
+    any_version: [foo-ubuntu]
+    trusty:
+      apt: [foo-trusty]
+      pip: [foo]
+baz:
+  ubuntu:
+    precise: [libbaz]
+    trusty: []
+"""
+
+
+class SQLiteRulesDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='xylem_test_')
+        config = get_default_config()
+        config.sources_dir = os.path.join(self.tempdir, 'sources.d')
+        config.cache_dir = os.path.join(self.tempdir, 'cache')
+        config.database_backend = 'sqlite'
+        os.makedirs(config.sources_dir)
+        self.spec = FakeRulesSpec()
+        self.sources_context = SourcesContext(
+            config=config, spec_plugins=[self.spec])
+        self.sources_context.ensure_cache_dir()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def make_database(self, urls, cls=SQLiteRulesDatabase):
+        database = cls(self.sources_context)
+        database.sources = [
+            RulesSource(self.spec, url, 'test', self.sources_context)
+            for url in urls]
+        return database
+
+    def test_create(self):
+        assert isinstance(create_rules_database(self.sources_context),
+                          SQLiteRulesDatabase)
+        self.sources_context.database_backend = 'cache'
+        assert not isinstance(create_rules_database(self.sources_context),
+                              SQLiteRulesDatabase)
+
+    def test_same_as_cache(self):
+        urls = ['fast', 'sqlite', 'slow']
+        database = self.make_database(urls)
+        database.update()
+        assert os.path.isfile(database.database_file_path())
+        sqlite_db = self.make_database(urls)
+        sqlite_db.load_from_cache()
+        cache_db = self.make_database(urls, RulesDatabase)
+        cache_db.load_from_cache()
+        for os_tuple in [('ubuntu', 'trusty'), ('ubuntu', 'precise'),
+                         ('osx', 'lion')]:
+            for default in ['apt', 'pip']:
+                ic = FakeInstallerContext(os_tuple, default)
+                keys = sorted(cache_db.keys(ic))
+                assert sorted(sqlite_db.keys(ic)) == keys
+                for key in keys + ['unknown']:
+                    assert sqlite_db.lookup(key, ic) == \
+                        cache_db.lookup(key, ic), (key, ic.os_tuple)
+                assert sqlite_db.lookup_many(keys + ['unknown'], ic) == \
+                    cache_db.lookup_many(keys + ['unknown'], ic)
+                for package in ['foo', 'foo-any', 'libfoo-fast', 'libbaz']:
+                    for installer in ['apt', 'pip']:
+                        assert sqlite_db.keys_for_package(
+                            package, installer, ic) == \
+                            cache_db.keys_for_package(package, installer, ic)
+
+    def test_merged_rules(self):
+        urls = ['fast', 'sqlite', 'slow']
+        self.make_database(urls).update()
+        default_installers = {'ubuntu': 'apt', 'osx': 'homebrew'}
+        merged = {}
+        for cls in [SQLiteRulesDatabase, RulesDatabase]:
+            database = self.make_database(urls, cls)
+            database.load_from_cache(lazy=True)
+            merged[cls] = database.merged_rules(default_installers)
+        assert merged[SQLiteRulesDatabase] == merged[RulesDatabase]
+        assert 'baz' in merged[RulesDatabase]
+
+    def test_keys_for_package(self):
+        database = self.make_database(['fast', 'sqlite'])
+        database.update()
+        ic = FakeInstallerContext()
+        assert database.keys_for_package('libfoo-fast', 'apt', ic) == ['foo']
+        assert database.keys_for_package('foo-trusty', 'apt', ic) == []
+        assert database.keys_for_package('foo', 'pip', ic) == ['foo']
+        ic = FakeInstallerContext(os_tuple=('ubuntu', 'precise'))
+        assert database.keys_for_package('libbaz', 'apt', ic) == ['baz']
+
+    def test_outdated(self):
+        database = self.make_database(['fast'])
+        self.assertRaises(IOError, database.load_from_cache)
+        database.update()
+        self.assertRaises(IOError,
+                          self.make_database(['sqlite']).load_from_cache)
+
+        # open readers see the database once rewritten
+        reader = self.make_database(['fast'])
+        reader.load_from_cache()
+        ic = FakeInstallerContext()
+        assert reader.lookup('bar', ic) == {'pip': {'packages': ['bar']}}
+        database = self.make_database(['sqlite'])
+        database.update()
+        assert reader.lookup('bar', ic) == {}
+        self.assertRaises(IOError, reader.load_from_cache)
+        assert reader.connection is None
+
+    def test_outdated_source_cache(self):
+        database = self.make_database(['fast'])
+        database.update()
+        old_fast = _fake_urls['fast']
+        try:
+            _fake_urls['fast'] = old_fast + "baz: {ubuntu: [libbaz]}\n"
+            self.make_database(['fast'], RulesDatabase).update()
+            # the database is outdated once a source cache is rewritten
+            self.assertRaises(IOError,
+                              self.make_database(['fast']).load_from_cache)
+            database = self.make_database(['fast'])
+            database.update()
+            assert database.sources[0].data_unchanged
+        finally:
+            _fake_urls['fast'] = old_fast
+        database.load_from_cache()
+        ic = FakeInstallerContext()
+        assert database.lookup('baz', ic) == {'apt': {'packages': ['libbaz']}}
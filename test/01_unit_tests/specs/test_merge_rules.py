@@ -18,6 +18,7 @@
 
 from __future__ import unicode_literals
 
+from copy import deepcopy
 from pprint import pprint
 
 from xylem.specs.plugins.rules import expand_rules
@@ -226,3 +227,62 @@ def test_merge_rules_filters_installers():
 
     _do_merge_test([rules2], expand_rules(expected))
     _do_merge_test([rules1, rules2], expand_rules(expected))
+
+
+def test_merge_rules_default_installer():
+    """Test merging rules dicts: default installers in several sources."""
+    rules1 = _parse_rules("""
+        füü:
+            ubuntu: [füü]
+        """)
+
+    rules2 = _parse_rules("""
+        füü:
+            ubuntu: [füü-2]
+            osx:
+                lion: [füü-2]
+        """)
+
+    expected = _parse_rules("""
+        füü:
+            ubuntu:
+                any_version:
+                    apt: [füü]
+            osx:
+                lion:
+                    homebrew: [füü-2]
+        """)
+
+    _do_merge_test([rules1, rules2], expected)
+
+
+def test_merge_rules_copy_on_write():
+    """Test merging rules dicts: input is shared, but not modified."""
+    rules1 = _parse_rules("""
+        füü:
+            ubuntu:
+                any_version:
+                    apt: [füü]
+        bar:
+            osx: [bar]
+        """)
+
+    rules2 = _parse_rules("""
+        füü:
+            ubuntu:
+                lucid:
+                    pip: [füü]
+        """)
+
+    rules1_copy = deepcopy(rules1)
+    rules2_copy = deepcopy(rules2)
+    result = merge_rules([rules1, rules2], _default_installers)
+    assert result['füü']['ubuntu'] == {
+        'any_version': {'apt': {'packages': ['füü']}},
+        'lucid': {'pip': {'packages': ['füü']}}}
+    assert rules1 == rules1_copy and rules2 == rules2_copy
+    # unmodified parts of the input are shared
+    assert result['füü']['ubuntu']['any_version'] is \
+        rules1['füü']['ubuntu']['any_version']
+    assert result['bar']['osx']['any_version']['homebrew'] is \
+        rules1['bar']['osx']['any_version']['default_installer']
@@ -16,12 +16,29 @@
 
 from __future__ import unicode_literals
 
+import datetime
+import os
+import time
+
+import mock
+
 from pprint import pprint
 from copy import deepcopy
 
+from six.moves.urllib.request import pathname2url
+
+from xylem.specs.plugins.rules import RulesSpec
 from xylem.specs.plugins.rules import expand_rules
 from xylem.specs.plugins.rules import compact_rules
+from xylem.specs.plugins.rules import SpecParsingError
+from xylem.sources import RulesSource
+from xylem.sources import SourcesContext
+from xylem.sources.rules_dict import _rules_dict_entry_errors
+from xylem.text_utils import to_bytes
+from xylem.text_utils import to_str
+from xylem.yaml_utils import dump_yaml
 from xylem.yaml_utils import load_yaml
+from xylem.util import temporary_directory
 
 
 _default_installers = dict(
@@ -160,3 +177,59 @@ def test_rules_expansion_idempotent():
         print("expected:")
         pprint(expanded)
     assert result == expanded
+
+
+def test_rules_is_data_outdated():
+    spec = RulesSpec()
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'rules.yaml')
+        url = 'file://' + pathname2url(path)
+        assert spec.is_data_outdated(None, url, datetime.datetime.now())
+        with open(path, 'w') as f:
+            f.write('foo: {ubuntu: [libfoo]}\n')
+        loaded = datetime.datetime.now() + datetime.timedelta(seconds=1)
+        assert not spec.is_data_outdated(None, url, loaded)
+        mtime = time.mktime(loaded.timetuple()) + 1
+        os.utime(path, (mtime, mtime))
+        assert spec.is_data_outdated(None, url, loaded)
+    assert spec.is_data_outdated(None, 'http://example.com/rules.yaml',
+                                 datetime.datetime.now())
+
+
+def test_rules_load_data():
+    spec = RulesSpec()
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'rules.yaml')
+        url = 'file://' + pathname2url(path)
+        with open(path, 'wb') as f:
+            f.write(to_bytes(dump_yaml(test1)))
+        assert spec.load_data(url) == expand_rules(deepcopy(test1))
+        with open(path, 'w') as f:
+            f.write('foo: {ubuntu: [libfoo]}\nbar: {ubuntu: {pip: 1}}\n')
+        try:
+            spec.load_data(url)
+            assert False, "expected SpecParsingError"
+        except SpecParsingError as e:
+            assert "'bar'" in to_str(e)
+
+
+def test_rules_expansion_does_not_verify():
+    expanded = expand_rules({'foo bar': {'ubuntu': ['libfoo']}})
+    assert expanded == {'foo bar': {'ubuntu': {'any_version': {
+        'default_installer': {'packages': ['libfoo']}}}}}
+
+
+def test_rules_load_from_source_verifies_once():
+    spec = RulesSpec()
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'rules.yaml')
+        with open(path, 'wb') as f:
+            f.write(to_bytes(dump_yaml(test1)))
+        source = RulesSource(spec, 'file://' + pathname2url(path), 'test',
+                             SourcesContext(spec_plugins=[spec]))
+        with mock.patch(
+                'xylem.sources.rules_dict._rules_dict_entry_errors',
+                side_effect=_rules_dict_entry_errors) as verify_mock:
+            source.load_from_source()
+        assert verify_mock.call_count == len(test1)
+        assert source.data == expand_rules(deepcopy(test1))
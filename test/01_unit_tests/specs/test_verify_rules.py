@@ -16,5 +16,142 @@
 
 from __future__ import unicode_literals
 
+import threading
+
+import mock
+
+from xylem.sources.rules_dict import IdentifierValidator
+from xylem.sources.rules_dict import RulesDictError
+from xylem.sources.rules_dict import parallel_verification
+from xylem.sources.rules_dict import rules_dict_error_report
+from xylem.sources.rules_dict import rules_dict_errors
+from xylem.sources.rules_dict import verify_installer_name
+from xylem.sources.rules_dict import verify_rules_dict
+
 # TODO: add tests that check all the error cases covered by
 # ``verify_rules_dict``
+
+
+def _rule(*packages):
+    return {'packages': list(packages)}
+
+
+def test_verify_rules_dict():
+    verify_rules_dict({'foo': {'ubuntu': {
+        'any_version': {'default_installer': _rule('foo')},
+        'mountain lion': {'pip': _rule('foo')}}}})
+    try:
+        verify_rules_dict({'foo': {'any_os': {'any_version': {
+            'default_installer': _rule('foo')}}}})
+    except ValueError as e:
+        assert str(e) == "'foo/any_os/any_version': Default installer is " \
+            "not allowed here."
+    else:
+        assert False, "expected ValueError"
+
+
+def test_rules_dict_errors():
+    rules = {
+        'foo bar': {'ubuntu': {'trusty': {'apt': _rule('foo')}}},
+        'baz': {
+            'any_version': {'any_version': {'pip': _rule('baz')}},
+            'ubuntu': {
+                'trusty': {'apt': {'packages': 'baz'}},
+                'lucid': [],
+                'precise': {'apt': {'depends': ['any_key']}}}},
+        'ok': {'osx': {'any_version': {'homebrew': _rule('ok')}}},
+    }
+    errors = sorted(rules_dict_errors(rules))
+    assert len(errors) == 5, errors
+    assert errors[0].startswith("'baz': os name is disallowed keyword")
+    assert errors[1].startswith("'baz/ubuntu/lucid': Expected installer "
+                                "dict of type 'dict'")
+    assert errors[2].startswith("'baz/ubuntu/precise/apt': Expected "
+                                "'depends' entry")
+    assert errors[3].startswith("'baz/ubuntu/trusty/apt': Expected "
+                                "'packages' entry")
+    assert errors[4].startswith("xylem key 'foo bar' has disallowed")
+    assert rules_dict_errors(
+        {'foo': {'ubuntu': {'any_version': {'default_installer': {}}}}},
+        allow_default_installer=False) == \
+        ["'foo/ubuntu/any_version': Default installer is not allowed here."]
+    assert rules_dict_errors([]) == \
+        ["Expected rules dict of type 'dict', but got '{0}'.".
+         format(type([]))]
+
+    try:
+        verify_rules_dict(rules)
+    except ValueError as e:
+        assert str(e).splitlines()[0] == "Found 5 errors:"
+    else:
+        assert False, "expected ValueError"
+
+
+def test_identifier_validator():
+    validator = IdentifierValidator("os version", ["any_version"])
+    assert validator.error("any_version") is None
+    assert validator.error("any_os") is not None
+    assert validator.error("mountain lion") is None
+    assert validator.error("10.9") is None
+    assert validator.error("a/b") is not None
+    assert validator.error(b"trusty") is not None
+    assert validator.error(10) is not None
+    # valid identifiers are remembered
+    assert "10.9" in validator._valid
+    assert "a/b" not in validator._valid
+
+    verify_installer_name("default_installer")
+    try:
+        verify_installer_name("any_os")
+    except ValueError as e:
+        assert str(e) == "installer name is disallowed keyword 'any_os'."
+    else:
+        assert False, "expected ValueError"
+
+
+def test_rules_dict_error_report():
+    rules = dict(('key{0}'.format(i), {'ubuntu': {'any_version': {
+        'apt': _rule('foo')}}}) for i in range(50))
+    rules['key7']['any_os'] = {'any_os': {'pip': []}}
+    rules['key 42'] = {'ubuntu': {'any_version': {'pip': _rule('bar')}}}
+    expected = [
+        RulesDictError('key7', ('key7', 'any_os'),
+                       "os version is disallowed keyword 'any_os'."),
+        RulesDictError('key7', ('key7', 'any_os', 'any_os', 'pip'),
+                       "Expected installer rule of type 'dict', but got "
+                       "'{0}'.".format(type([]))),
+        RulesDictError('key 42', (), "xylem key 'key 42' has disallowed "
+                       "characters. Allowed are: alphanumeric, dash, dot, "
+                       "underscore.")]
+
+    def sort_key(e):
+        return e.xylem_key, e.path
+
+    errors = rules_dict_error_report(rules, chunk_size=7)
+    assert sorted(errors, key=sort_key) == sorted(expected, key=sort_key)
+    assert errors[0].to_dict() == dict(
+        key=errors[0].xylem_key, path="/".join(errors[0].path),
+        message=errors[0].message)
+    # errors are found in chunks on worker processes, but in the same order
+    with parallel_verification(2):
+        assert rules_dict_error_report(rules, chunk_size=7) == errors
+        try:
+            verify_rules_dict(rules)
+        except ValueError as e:
+            assert str(e).splitlines()[0] == "Found 3 errors:"
+        else:
+            assert False, "expected ValueError"
+    assert rules_dict_error_report({}) == []
+
+    # no worker processes are forked while other threads are running
+    event = threading.Event()
+    thread = threading.Thread(target=event.wait)
+    thread.start()
+    try:
+        with parallel_verification(2), mock.patch(
+                'xylem.sources.rules_dict._parallel_errors') as parallel_mock:
+            assert rules_dict_error_report(rules, chunk_size=7) == errors
+        assert not parallel_mock.called
+    finally:
+        event.set()
+        thread.join()
@@ -0,0 +1,81 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import os
+import threading
+
+from xylem.util import LRUCache
+from xylem.util import atomic_file
+from xylem.util import file_lock
+from xylem.util import temporary_directory
+
+
+def test_atomic_file():
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'data')
+        with atomic_file(path) as f:
+            f.write(b'old')
+        with open(path, 'rb') as f:
+            assert f.read() == b'old'
+        umask = os.umask(0)
+        os.umask(umask)
+        assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+        try:
+            with atomic_file(path) as f:
+                f.write(b'new')
+                assert os.listdir(tmpdir) != ['data']
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        with open(path, 'rb') as f:
+            assert f.read() == b'old'
+        assert os.listdir(tmpdir) == ['data']
+
+
+def test_file_lock():
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'lock')
+        waited = []
+        acquired = threading.Event()
+
+        def take_lock():
+            with file_lock(path, on_wait=lambda: waited.append(True)):
+                acquired.set()
+
+        with file_lock(path):
+            thread = threading.Thread(target=take_lock)
+            thread.start()
+            assert not acquired.wait(0.2)
+        thread.join(5)
+        assert acquired.is_set()
+        assert waited == [True]
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is least recently used
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('c') == 3 and cache.get('a') == 1
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+    cache.clear()
+    assert len(cache) == 0 and cache.get('a', 'x') == 'x'
+    assert cache.misses == 2
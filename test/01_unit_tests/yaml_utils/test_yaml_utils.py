@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import io
+import unittest
+
+import yaml
+
+from six.moves import reload_module
+
+from xylem import yaml_utils
+from xylem.config_utils import ConfigDict
+
+from xylem.text_utils import text_type
+from xylem.yaml_utils import dump_yaml
+from xylem.yaml_utils import iter_yaml_mapping
+from xylem.yaml_utils import load_yaml
+
+
+_document = """
+foo: &common
+  ubuntu: [libfoo, "libfoo-dev"]
+  any_os: {pip: foo}
+bar: *common
+"näme": [1, 2.5, true, null, ~]
+? [complex, key]
+: {nested: {deep: [x]}}
+"""
+
+_plain_document = _document.replace('[complex, key]', 'complex')
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _check_unicode(data):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            _check_unicode(key)
+            _check_unicode(value)
+    elif isinstance(data, list):
+        for value in data:
+            _check_unicode(value)
+    elif isinstance(data, bytes):
+        assert False, "got bytes: {0!r}".format(data)
+
+
+class YamlUtilsTestCase(unittest.TestCase):
+
+    def check_load_dump(self):
+        data = load_yaml(_plain_document)
+        _check_unicode(data)
+        assert data['foo']['ubuntu'] == ['libfoo', 'libfoo-dev']
+        dump = dump_yaml({'x': data['näme'][:3], 'y': None,
+                          'z': ConfigDict(a={'b': 'ä'})})
+        assert isinstance(dump, text_type)
+        assert dump == "x: [1, 2.5, true]\ny:\nz:\n  a:\n" \
+            "    b: ä\n"
+        assert load_yaml(dump_yaml(data)) == data
+
+    def test_load_dump(self):
+        self.check_load_dump()
+
+    def test_load_dump_without_libyaml(self):
+        saved = {}
+        for name in ['CSafeLoader', 'CSafeDumper']:
+            saved[name] = getattr(yaml, name, None)
+            if saved[name] is not None:
+                delattr(yaml, name)
+        try:
+            reload_module(yaml_utils)
+            assert yaml_utils._Loader.__bases__ == (yaml.SafeLoader,)
+            assert yaml_utils._Dumper.__bases__ == (yaml.SafeDumper,)
+            self.check_load_dump()
+        finally:
+            for name, value in saved.items():
+                if value is not None:
+                    setattr(yaml, name, value)
+            reload_module(yaml_utils)
+
+
+class IterYamlMappingTestCase(unittest.TestCase):
+
+    def test_iter_yaml_mapping(self):
+        expected = load_yaml(_plain_document)
+        data = _plain_document
+        for source in [data, io.StringIO(data), _chunks(data, 1),
+                       _chunks(data, 7)]:
+            entries = list(iter_yaml_mapping(source))
+            assert [k for k, _ in entries] == ['foo', 'bar', 'näme',
+                                               'complex']
+            assert dict(entries) == expected
+            for key, _ in entries:
+                assert isinstance(key, text_type)
+        entries = dict(iter_yaml_mapping(data))
+        # aliased values are not shared between entries
+        assert entries['foo'] is not entries['bar']
+
+
+    def test_iter_yaml_mapping_streaming(self):
+        consumed = []
+
+        def chunks():
+            for line in _document.splitlines(True):
+                consumed.append(line)
+                yield line
+
+        entries = iter_yaml_mapping(chunks())
+        key, value = next(entries)
+        assert key == 'foo'
+        assert len(consumed) < len(_document.splitlines())
+        assert len(list(entries)) == 3
+
+
+    def test_iter_yaml_mapping_invalid(self):
+        assert list(iter_yaml_mapping('')) == []
+        assert list(iter_yaml_mapping('---\n')) == []
+        for data in ['[foo, bar]', 'foo']:
+            self.assertRaises(ValueError, list, iter_yaml_mapping(data))
+        for data in ['foo: [bar\n', 'foo: 1\n---\nbar: 2\n', 'foo: *bar\n',
+                     'foo: {a: 1}\n  b: 2\n']:
+            self.assertRaises(yaml.YAMLError, list, iter_yaml_mapping(data))
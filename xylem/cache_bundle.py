@@ -0,0 +1,317 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Implements portable bundles of the sources cache.
+
+A cache bundle is a gzipped tar archive with a copy of all files in the
+sources cache directory, i.e. the caches of all sources and the merged
+lookup index. One machine creates the bundle with ``xylem update
+--bundle``, and any number of machines with the same source lists
+install it with ``xylem import-cache`` without network access.
+
+The first member of the archive is the manifest ``manifest.yaml`` with
+the sha1 checksum and size of all cache files, which are stored in the
+``cache/`` directory of the archive.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+import yaml
+
+from six import BytesIO
+
+from xylem import __version__
+from xylem.config import get_config
+from xylem.exception import XylemError
+from xylem.log_utils import info
+from xylem.log_utils import info_v
+from xylem.log_utils import warning
+from xylem.sources import RulesDatabase
+from xylem.sources import SourcesContext
+from xylem.sources.database import INDEX_FILE_NAME
+from xylem.sources.database import LOCK_FILE_NAME
+from xylem.text_utils import to_bytes
+from xylem.text_utils import to_str
+from xylem.util import atomic_file
+from xylem.util import file_lock
+from xylem.util import replace_file
+from xylem.yaml_utils import dump_yaml
+from xylem.yaml_utils import load_yaml
+
+
+BUNDLE_MANIFEST_NAME = "manifest.yaml"
+BUNDLE_CACHE_DIR = "cache"
+BUNDLE_FORMAT_VERSION = 1
+
+_CHUNK_SIZE = 1 << 20
+
+
+class InvalidCacheBundleError(XylemError):
+
+    """Cache bundle is malformed or does not match its manifest."""
+
+
+def bundle_cache_files(cache_dir):
+    """Return the names of all files in ``cache_dir`` to be bundled.
+
+    The lock file and hidden (e.g. temporary) files are excluded.
+    """
+    return sorted(
+        name for name in os.listdir(cache_dir)
+        if name != LOCK_FILE_NAME and not name.startswith('.') and
+        os.path.isfile(os.path.join(cache_dir, name)))
+
+
+def create_cache_bundle(bundle_path, sources_context):
+    """Write all files of the sources cache into a bundle.
+
+    The cache must not be modified while the bundle is created, i.e.
+    the caller should hold the update lock.
+
+    :param str bundle_path: path of the bundle file; replaced atomically
+        if it exists
+    :param SourcesContext sources_context: context determining the
+        cache directory
+    :returns: the manifest written to the bundle
+    """
+    cache_dir = sources_context.cache_dir
+    files = {}
+    for name in bundle_cache_files(cache_dir):
+        path = os.path.join(cache_dir, name)
+        checksum, size = _file_checksum(path)
+        files[name] = dict(sha1=checksum, size=size,
+                           mtime=os.path.getmtime(path))
+    manifest = dict(
+        format=BUNDLE_FORMAT_VERSION,
+        xylem_version=__version__,
+        time_created=datetime.datetime.now().isoformat(),
+        cache_format=sources_context.cache_format,
+        cache_compression=sources_context.cache_compression,
+        files=files)
+    with atomic_file(bundle_path) as f:
+        with tarfile.open(fileobj=f, mode='w:gz') as tar:
+            manifest_data = to_bytes(dump_yaml(manifest))
+            member = tarfile.TarInfo(BUNDLE_MANIFEST_NAME)
+            member.size = len(manifest_data)
+            member.mtime = int(time.time())
+            tar.addfile(member, BytesIO(manifest_data))
+            for name in sorted(files):
+                tar.add(os.path.join(cache_dir, name),
+                        arcname=_member_name(name), recursive=False)
+    info("Wrote cache bundle '{0}' with {1} files.".
+         format(bundle_path, len(files)))
+    return manifest
+
+
+def import_cache_bundle(bundle_path, config=None, sources_context=None):
+    """Install a cache bundle into the sources cache directory.
+
+    All files are extracted into a temporary directory and verified
+    against the manifest first. Only if the whole bundle is valid, the
+    files are moved into the cache directory. Cache files not in the
+    bundle are removed. The update lock is held during installation,
+    such that concurrent updates and imports are serialized; readers are
+    not blocked.
+
+    The installation is only atomic per file: each file replaces the
+    old one atomically, but a reader may see some files of the old and
+    some of the new cache. Source caches are therefore replaced before
+    the meta data describing them and the lookup index last; readers
+    ignore meta data and index that do not match the source caches.
+
+    :param str bundle_path: path of the bundle file
+    :param config: config dict to create source context with; if `None`
+        is passed, use global configuration
+    :type config: `dict` or `None`
+    :param sources_context: the sources context determining the cache
+        directory; if `None` is passed, a sources context from
+        ``config`` is created
+    :type sources_context: `SourcesContext` or `None`
+    :returns: the manifest of the installed bundle
+    :raises InvalidCacheBundleError: if the bundle is invalid; the
+        cache is left unchanged
+    """
+    if config is None:
+        config = get_config()
+    sources_context = sources_context or SourcesContext(config)
+    sources_context.ensure_cache_dir()
+    cache_dir = sources_context.cache_dir
+    with file_lock(os.path.join(cache_dir, LOCK_FILE_NAME)):
+        temp_dir = tempfile.mkdtemp(prefix='.import-', dir=cache_dir)
+        try:
+            manifest = _extract_bundle(bundle_path, temp_dir)
+            files = manifest['files']
+            # meta data and index describe the source caches, so they
+            # replace the old files after the caches, index last
+            names = sorted(files, key=lambda n: (
+                n == INDEX_FILE_NAME, n.endswith('.meta'), n))
+            for name in names:
+                replace_file(os.path.join(temp_dir, name),
+                             os.path.join(cache_dir, name))
+            for name in bundle_cache_files(cache_dir):
+                if name not in files:
+                    info_v("Removing cache file '{0}' not in bundle.".
+                           format(name))
+                    os.remove(os.path.join(cache_dir, name))
+        finally:
+            shutil.rmtree(temp_dir)
+    info("Installed cache bundle '{0}' with {1} files into '{2}'.".
+         format(bundle_path, len(files), cache_dir))
+    if manifest.get('xylem_version') != __version__:
+        warning("Cache bundle was created by xylem version '{0}'; the "
+                "cache will be verified again when loaded.".
+                format(manifest.get('xylem_version')))
+    _warn_missing_sources(sources_context, files)
+    return manifest
+
+
+def _extract_bundle(bundle_path, directory):
+    """Extract and verify the cache files of a bundle into ``directory``.
+
+    :returns: the verified manifest
+    :raises InvalidCacheBundleError: if the bundle is invalid
+    """
+    try:
+        tar = tarfile.open(bundle_path, mode='r:gz')
+    except (IOError, OSError, tarfile.TarError) as e:
+        raise InvalidCacheBundleError(
+            "Failed to open cache bundle '{0}': {1}".format(bundle_path, e))
+    with tar:
+        try:
+            member = tar.next()
+            if member is None or member.name != BUNDLE_MANIFEST_NAME:
+                raise InvalidCacheBundleError(
+                    "Cache bundle '{0}' does not start with '{1}'.".
+                    format(bundle_path, BUNDLE_MANIFEST_NAME))
+            manifest = _parse_manifest(
+                tar.extractfile(member).read(), bundle_path)
+            files = manifest['files']
+            extracted = set()
+            while True:
+                member = tar.next()
+                if member is None:
+                    break
+                name = _verify_member(member, files, extracted, bundle_path)
+                _extract_file(tar.extractfile(member),
+                              os.path.join(directory, name),
+                              files[name], bundle_path)
+                mtime = files[name].get('mtime', member.mtime)
+                os.utime(os.path.join(directory, name), (mtime, mtime))
+                extracted.add(name)
+        except (IOError, OSError, EOFError, tarfile.TarError) as e:
+            raise InvalidCacheBundleError(
+                "Failed to read cache bundle '{0}': {1}".
+                format(bundle_path, e))
+    missing = set(files) - extracted
+    if missing:
+        raise InvalidCacheBundleError(
+            "Cache bundle '{0}' is missing files: {1}".
+            format(bundle_path, ", ".join(sorted(missing))))
+    return manifest
+
+
+def _parse_manifest(data, bundle_path):
+    try:
+        manifest = load_yaml(to_str(data))
+    except (yaml.YAMLError, ValueError) as e:
+        raise InvalidCacheBundleError(
+            "Invalid manifest in cache bundle '{0}': {1}".
+            format(bundle_path, e))
+    if not isinstance(manifest, dict) or \
+            manifest.get('format') != BUNDLE_FORMAT_VERSION or \
+            not isinstance(manifest.get('files'), dict):
+        raise InvalidCacheBundleError(
+            "Unsupported manifest in cache bundle '{0}'.".format(bundle_path))
+    for name, entry in manifest['files'].items():
+        if os.path.basename(name) != name or name.startswith('.') or \
+                name == LOCK_FILE_NAME or not isinstance(entry, dict) or \
+                'sha1' not in entry or 'size' not in entry:
+            raise InvalidCacheBundleError(
+                "Invalid entry '{0}' in manifest of cache bundle '{1}'.".
+                format(name, bundle_path))
+    return manifest
+
+
+def _verify_member(member, files, extracted, bundle_path):
+    """Return cache file name of ``member`` after checking it is expected.
+
+    Only regular files listed in the manifest are extracted, such that
+    a bundle cannot write outside of the cache directory.
+    """
+    prefix = BUNDLE_CACHE_DIR + '/'
+    name = member.name[len(prefix):]
+    if not member.name.startswith(prefix) or not member.isfile() or \
+            name not in files or name in extracted:
+        raise InvalidCacheBundleError(
+            "Unexpected member '{0}' in cache bundle '{1}'.".
+            format(member.name, bundle_path))
+    return name
+
+
+def _extract_file(fileobj, path, entry, bundle_path):
+    checksum = hashlib.sha1()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = fileobj.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            checksum.update(chunk)
+            size += len(chunk)
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    if size != entry['size'] or checksum.hexdigest() != entry['sha1']:
+        raise InvalidCacheBundleError(
+            "Checksum mismatch for '{0}' in cache bundle '{1}'.".
+            format(os.path.basename(path), bundle_path))
+
+
+def _warn_missing_sources(sources_context, files):
+    """Warn about configured sources without cache in the bundle."""
+    try:
+        database = RulesDatabase(sources_context)
+    except (XylemError, ValueError, IOError, OSError) as e:
+        warning("Could not check the bundle against the configured "
+                "sources: {0}".format(e))
+        return
+    for source in database.sources:
+        if os.path.basename(source.cache_file_path()) not in files:
+            warning("Cache bundle does not contain source '{0}' of "
+                    "spec '{1}'.".format(source.arguments, source.spec.name))
+
+
+def _file_checksum(path):
+    checksum = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            checksum.update(chunk)
+            size += len(chunk)
+    return checksum.hexdigest(), size
+
+
+def _member_name(name):
+    return BUNDLE_CACHE_DIR + '/' + name
@@ -0,0 +1,174 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import sys
+import timeit
+
+from six import string_types
+
+from xylem.load_url import ACCEPT_ENCODING
+from xylem.load_url import DownloadFailure
+from xylem.load_url import decode_content
+from xylem.load_url import load_url_raw
+from xylem.load_url import pooled_connections
+from xylem.sources import SourcesContext
+from xylem.sources import RulesDatabase
+from xylem.sources.database import CACHE_LOAD_ERRORS
+from xylem.sources.cache_format import CACHE_COMPRESSIONS
+from xylem.sources.cache_format import CACHE_FORMATS
+from xylem.sources.cache_format import cache_format_of
+from xylem.sources.cache_format import compress_data
+from xylem.sources.cache_format import decompress_data
+from xylem.sources.cache_format import dump_data
+from xylem.sources.cache_format import load_data
+
+from xylem.log_utils import info
+from xylem.log_utils import warning
+
+from xylem.text_utils import to_str
+
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Compare the cache formats on the data of the currently cached sources.
+
+For each source, cache format and compression, print the size of the
+stored data and the time it takes to load it. 'load' only decompresses
+and deserializes the data as done when loading the cache, 'load+all'
+additionally decodes the rules of all keys.
+
+With '--download', additionally download each source with an http(s)
+url with and without compressed transfer encoding and print the bytes
+transferred and the time for downloading and decoding.
+
+This is a utility command intended for cache format development.
+"""
+
+
+def prepare_arguments(parser):
+    add = parser.add_argument
+    add('-r', '--repeat', type=int, default=5,
+        help="Number of timing runs; the best run is reported.")
+    add('--download', action='store_true',
+        help="Also measure downloading the sources.")
+
+
+def prepare_config(description):
+    pass
+
+
+def _best_time_ms(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def _load(blob, compression):
+    return load_data(decompress_data(blob, compression))
+
+
+def _load_all(blob, compression):
+    data = _load(blob, compression)
+    for xylem_key in data:
+        data[xylem_key]
+
+
+def _download(url, accept_encoding):
+    data, content_encoding = load_url_raw(url, accept_encoding)
+    decode_content(data, content_encoding)
+    return len(data)
+
+
+def _benchmark_cache(sources, repeat):
+    row = "{0:<36} {1:<8} {2:<5} {3:>10} {4:>10} {5:>10}"
+    info(row.format("source", "format", "comp", "bytes", "load",
+                    "load+all"))
+    variants = [(f, c) for f in CACHE_FORMATS for c in CACHE_COMPRESSIONS]
+    totals = dict((v, [0, 0.0, 0.0]) for v in variants)
+    for source in sources:
+        try:
+            source.load_from_cache()
+        except CACHE_LOAD_ERRORS as e:
+            warning("Skipping source '{0}' without valid cache: {1}".
+                    format(source.arguments, to_str(e)))
+            continue
+        data = dict(source.data.items())
+        for cache_format, compression in variants:
+            blob = compress_data(dump_data(data, cache_format), compression)
+            load = _best_time_ms(lambda: _load(blob, compression), repeat)
+            load_all = _best_time_ms(lambda: _load_all(blob, compression),
+                                     repeat)
+            actual_format = cache_format_of(decompress_data(blob,
+                                                            compression))
+            if actual_format != cache_format:
+                actual_format += "*"
+            info(row.format(to_str(source.arguments)[-36:], actual_format,
+                            compression, len(blob), "{0:.2f}".format(load),
+                            "{0:.2f}".format(load_all)))
+            total = totals[(cache_format, compression)]
+            total[0] += len(blob)
+            total[1] += load
+            total[2] += load_all
+    for cache_format, compression in variants:
+        size, load, load_all = totals[(cache_format, compression)]
+        info(row.format("total", cache_format, compression, size,
+                        "{0:.2f}".format(load), "{0:.2f}".format(load_all)))
+    info("Times in milliseconds; '*' marks data stored with the "
+         "fallback format.")
+
+
+def _benchmark_download(sources, repeat):
+    row = "{0:<36} {1:<16} {2:>10} {3:>10}"
+    info(row.format("source", "encoding", "bytes", "download"))
+    for source in sources:
+        url = source.arguments
+        if not isinstance(url, string_types) or \
+                not url.startswith(('http://', 'https://')):
+            continue
+        for accept_encoding in ['identity', ACCEPT_ENCODING]:
+            try:
+                size = _download(url, accept_encoding)
+                time = _best_time_ms(
+                    lambda: _download(url, accept_encoding), repeat)
+            except (DownloadFailure, IOError, OSError, ValueError) as e:
+                warning("Failed to download '{0}': {1}".
+                        format(url, to_str(e)))
+                break
+            info(row.format(url[-36:], accept_encoding, size,
+                            "{0:.2f}".format(time)))
+    info("Times in milliseconds, including decoding.")
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    try:
+        sources_context = SourcesContext()
+        database = RulesDatabase(sources_context)
+        _benchmark_cache(database.sources, args.repeat)
+        if args.download:
+            with pooled_connections():
+                _benchmark_download(database.sources, args.repeat)
+    except (KeyboardInterrupt, EOFError):
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='_benchmark_cache',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
@@ -0,0 +1,151 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import sys
+import timeit
+
+from xylem.os_support import OSSupport
+from xylem.sources import SourcesContext
+from xylem.sources import RulesDatabase
+from xylem.sources.database import CACHE_LOAD_ERRORS
+from xylem.sources.rules_dict import lookup_rules
+from xylem.sources.rules_dict import merge_installer_dict
+from xylem.sources.rules_dict import merge_rules
+from xylem.specs.plugins.rules import expand_rules
+
+from xylem.log_utils import info
+from xylem.log_utils import warning
+
+from xylem.text_utils import to_str
+from xylem.yaml_utils import load_yaml
+
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Measure merging rules dicts with `merge_rules`.
+
+Merges the given rules files, or if none are given, the data of the
+currently cached sources, for the default installers of all os
+plugins, and prints the number of keys and the time it takes. For
+comparison, the same rules are also obtained the previous way, by
+looking up every key, os and version in each rules dict and merging
+the results, and the time that takes is printed as well.
+
+This is a utility command intended for merge algorithm development.
+"""
+
+
+def prepare_arguments(parser):
+    add = parser.add_argument
+    add('rules_files', nargs='*', metavar='FILE',
+        help="Rules files to merge, highest priority first.")
+    add('-r', '--repeat', type=int, default=5,
+        help="Number of timing runs; the best run is reported.")
+
+
+def prepare_config(description):
+    pass
+
+
+def _load_rules_files(paths):
+    rules_dict_list = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            rules_dict_list.append(expand_rules(load_yaml(to_str(f.read()))))
+    return rules_dict_list
+
+
+def _load_cached_sources():
+    database = RulesDatabase(SourcesContext())
+    rules_dict_list = []
+    for source in database.sources:
+        try:
+            source.load_from_cache()
+        except CACHE_LOAD_ERRORS as e:
+            warning("Skipping source '{0}' without valid cache: {1}".
+                    format(source.arguments, to_str(e)))
+            continue
+        rules_dict_list.append(dict(source.data.items()))
+    return rules_dict_list
+
+
+def _lookup_queries(merged, default_installers):
+    """Return key, os and version triples covering the merged rules."""
+    queries = []
+    for xylem_key, os_dict in merged.items():
+        for os_name in default_installers:
+            versions = list(os_dict.get(os_name, {}))
+            if not versions and 'any_os' in os_dict:
+                versions = ['any_version']
+            queries.extend((xylem_key, os_name, v) for v in versions)
+    return queries
+
+
+def _lookup_and_merge(rules_dict_list, queries, default_installers):
+    """Look up each query in every rules dict and merge the results.
+
+    This is how `RulesDatabase.lookup` answers queries from the sources
+    without merged rules.
+    """
+    for xylem_key, os_name, os_version in queries:
+        installer_dict = {}
+        for rules in reversed(rules_dict_list):
+            merge_installer_dict(
+                lookup_rules(rules, xylem_key, os_name, os_version,
+                             default_installers[os_name]),
+                installer_dict, None)
+
+
+def _benchmark_merge(rules_dict_list, repeat):
+    default_installers = OSSupport().get_default_installer_names()
+    merged = merge_rules(rules_dict_list, default_installers)
+    time = min(timeit.repeat(
+        lambda: merge_rules(rules_dict_list, default_installers),
+        number=1, repeat=repeat)) * 1000
+    info("Merged {0} rules dicts with {1} keys into {2} keys in {3:.2f} "
+         "milliseconds.".format(len(rules_dict_list),
+                                sum(len(r) for r in rules_dict_list),
+                                len(merged), time))
+    queries = _lookup_queries(merged, default_installers)
+    time = min(timeit.repeat(
+        lambda: _lookup_and_merge(rules_dict_list, queries,
+                                  default_installers),
+        number=1, repeat=repeat)) * 1000
+    info("Looked up and merged {0} key/os/version combinations per rules "
+         "dict in {1:.2f} milliseconds.".format(len(queries), time))
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    try:
+        if args.rules_files:
+            rules_dict_list = _load_rules_files(args.rules_files)
+        else:
+            rules_dict_list = _load_cached_sources()
+        _benchmark_merge(rules_dict_list, args.repeat)
+    except (KeyboardInterrupt, EOFError):
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='_benchmark_merge',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
@@ -17,12 +17,14 @@ from __future__ import unicode_literals
 import sys
 import os
 
-from xylem.sources.rules_dict import verify_rules_dict
+from xylem.sources.rules_dict import parallel_verification
+from xylem.sources.rules_dict import rules_dict_error_report
 
 from xylem.specs.plugins.rules import expand_rules
 from xylem.specs.plugins.rules import compact_rules
 
 from xylem.os_support import OSSupport
+from xylem.log_utils import error
 from xylem.log_utils import info
 
 from xylem.text_utils import to_str
@@ -47,6 +49,9 @@ def prepare_arguments(parser):
     add('-w', '--write', action="store_true",
         help="Change the content of the original file instead of printing the "
              "compacted file.")
+    add('-j', '--jobs', type=int, default=None,
+        help="Number of processes to verify the rules with. Defaults to the "
+             "number of CPUs.")
 
 
 def prepare_config(description):
@@ -64,7 +69,13 @@ def main(args=None):
             data = to_str(f.read())
         rules = load_yaml(data)
         rules = expand_rules(rules)
-        verify_rules_dict(rules)
+        with parallel_verification(args.jobs):
+            errors = rules_dict_error_report(rules)
+        if errors:
+            error("Found {0} errors in '{1}':".format(len(errors), filepath))
+            for e in errors:
+                info("  " + e.describe())
+            sys.exit(1)
 
         # compact rules
         compacted = compact_rules(
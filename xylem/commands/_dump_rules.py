@@ -0,0 +1,78 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import sys
+
+from xylem.os_support import OSSupport
+from xylem.sources import SourcesContext
+from xylem.sources import create_rules_database
+
+from xylem.log_utils import error
+from xylem.log_utils import info
+
+from xylem.yaml_utils import dump_yaml
+
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Print the effective rules of all cached sources as one rules dict.
+
+The rules of all sources are merged in order of priority, with the
+default installer of each os filled in. Only os's with an os plugin
+are included, or the given os's.
+
+This is a utility command intended for debugging the rules database.
+"""
+
+
+def prepare_arguments(parser):
+    add = parser.add_argument
+    add('os_names', nargs='*', metavar='OS',
+        help="Only include the rules for these os's (and 'any_os').")
+
+
+def prepare_config(description):
+    pass
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    try:
+        default_installers = OSSupport().get_default_installer_names()
+        if args.os_names:
+            for os_name in args.os_names:
+                if os_name not in default_installers:
+                    error("Unknown os '{0}'.".format(os_name))
+                    sys.exit(1)
+            default_installers = dict(
+                (os_name, default_installers[os_name])
+                for os_name in args.os_names)
+        database = create_rules_database(SourcesContext())
+        database.load_from_cache(lazy=True)
+        info(dump_yaml(database.merged_rules(default_installers)))
+    except (KeyboardInterrupt, EOFError):
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='_dump_rules',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
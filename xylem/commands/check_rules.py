@@ -0,0 +1,99 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import io
+import sys
+
+import yaml
+
+from xylem.sources.rules_dict import rules_dict_errors
+from xylem.specs.plugins.rules import expand_os_definition
+
+from xylem.log_utils import error
+from xylem.log_utils import info
+
+from xylem.text_utils import to_str
+from xylem.yaml_utils import iter_yaml_mapping
+
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Check rules files for errors.
+
+All entries of the given rules files are expanded and verified, and
+all errors are reported, not only the first one. The exit code is 1 if
+any errors were found, which makes this suitable for checking rules
+files in continuous integration.
+"""
+
+
+def prepare_arguments(parser):
+    parser.add_argument('rules_files', nargs='+', metavar='FILE',
+                        help="rules files to check")
+
+
+def prepare_config(description):
+    pass
+
+
+def rules_file_errors(path):
+    """Return list of all errors in the rules file at ``path``."""
+    errors = []
+    try:
+        with io.open(path, 'r', encoding='utf-8') as f:
+            for xylem_key, os_dict in iter_yaml_mapping(f):
+                try:
+                    expanded = expand_os_definition(os_dict)
+                except ValueError as e:
+                    errors.append("'{0}': Failed to expand rule: {1}".
+                                  format(to_str(xylem_key), to_str(e)))
+                    continue
+                errors.extend(rules_dict_errors({xylem_key: expanded}))
+    except (IOError, OSError, TypeError, ValueError, yaml.YAMLError) as e:
+        # TypeError for unhashable keys like '? [a, b]'
+        errors.append("Failed to parse: {0}".format(to_str(e)))
+    return errors
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    try:
+        found_errors = False
+        for path in args.rules_files:
+            errors = rules_file_errors(path)
+            if errors:
+                found_errors = True
+                error("{0}: {1} errors".format(path, len(errors)))
+                for message in errors:
+                    info("  " + message.replace("\n", "\n  "))
+            else:
+                info("{0}: OK".format(path))
+        if found_errors:
+            sys.exit(1)
+    except (KeyboardInterrupt, EOFError):
+        info('')
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='check-rules',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
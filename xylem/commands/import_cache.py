@@ -0,0 +1,58 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import sys
+
+from xylem.cache_bundle import import_cache_bundle
+from xylem.log_utils import info
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Install a cache bundle created with 'xylem update --bundle'.
+
+The bundle replaces the sources cache, such that no update (and no
+network access) is needed, provided the bundle was created with the
+same source lists. All files of the bundle are verified against the
+checksums in its manifest before the cache is modified.
+"""
+
+
+def prepare_arguments(parser):
+    parser.add_argument('bundle', help="path of the cache bundle")
+
+
+def prepare_config(description):
+    pass
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    try:
+        import_cache_bundle(args.bundle)
+    except (KeyboardInterrupt, EOFError):
+        info('')
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='import-cache',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
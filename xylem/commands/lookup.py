@@ -16,10 +16,16 @@ from __future__ import unicode_literals
 
 import sys
 
+from xylem.log_utils import debug
 from xylem.log_utils import info
 from xylem.config import get_config
-from xylem.lookup import lookup
 from xylem.installers import InstallerContext
+from xylem.sources import SourcesContext
+from xylem.sources import create_rules_database
+from xylem.specs.plugins.rules import compact_installer_dict
+from xylem.server import ServerError
+from xylem.server import request
+from xylem.text_utils import to_str
 from xylem.yaml_utils import dump_yaml
 from xylem.terminal_color import ansi
 
@@ -33,24 +39,61 @@ Lookup all rules for a xylem key.
 
 def prepare_arguments(parser):
     parser.add_argument('xylem_key', nargs="+")
+    parser.add_argument('--no-server', action="store_true",
+                        help="""Don't use a running 'xylem serve'
+                        process, but look up in this process.""")
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help="""path of the socket of the 'xylem serve'
+                        process; defaults to 'xylem.sock' in the cache
+                        folder""")
 
 
 def prepare_config(description):
     pass
 
 
+def lookup_with_server(args, config):
+    """Lookup keys with a running server.
+
+    :returns: tuple of os string and list of keys and compact rules, or
+        `None` if no server answered the request
+    """
+    try:
+        response = request('lookup', config, socket_path=args.socket,
+                           keys=args.xylem_key)
+    except ServerError as e:
+        debug(to_str(e))
+        return None
+    return response['os'], response['rules']
+
+
+def lookup_locally(args, config):
+    """Lookup keys in this process; see `lookup_with_server`."""
+    ic = InstallerContext(config=config)
+    database = create_rules_database(SourcesContext(config))
+    database.load_from_cache(ic, lazy=True)
+    installer_dicts = database.lookup_many(args.xylem_key, ic)
+    default_installer_name = ic.get_default_installer_name()
+    return ic.get_os_string(), [
+        (key, compact_installer_dict(installer_dicts[key],
+                                     default_installer_name))
+        for key in args.xylem_key]
+
+
 def main(args=None):
     args = command_handle_args(args, definition)
     config = get_config()
     try:
-        # TODO: handle multiple keys in one go
-        ic = InstallerContext(config=config)
-        for key in args.xylem_key:
-            result = lookup(key, compact=True, config=config,
-                            installer_context=ic)
+        answer = None
+        if not args.no_server:
+            answer = lookup_with_server(args, config)
+        if answer is None:
+            answer = lookup_locally(args, config)
+        os_string, rules = answer
+        for key, result in rules:
             info("Rules for '{}' on '{}':\n{}".
                  format(ansi('cyanf') + key + ansi('reset'),
-                        ansi('cyanf') + ic.get_os_string() + ansi('reset'),
+                        ansi('cyanf') + os_string + ansi('reset'),
                         ansi('yellowf') + dump_yaml(result)[:-1]))
     except (KeyboardInterrupt, EOFError):
         # Note: @William why EOFError here?
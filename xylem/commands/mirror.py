@@ -0,0 +1,70 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import sys
+
+from xylem.mirror import mirror
+from xylem.log_utils import info
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Download the files of all configured sources into a mirror directory.
+
+The mirror contains the downloaded files, an index and a 'sources.d'
+directory with copies of the source lists that refer to the mirrored
+files. Other machines can use the mirror by setting their sources
+directory to the mirror's 'sources.d' (e.g. with '--sources-dir'), or
+by copying the source lists from there.
+
+Without '--base-url', the source lists refer to the mirrored files by
+their absolute path, which suits mirrors on shared file systems. If the
+mirror directory is served over HTTP, pass the url it is served under
+as '--base-url'.
+
+Running the command again only downloads files that changed.
+"""
+
+
+def prepare_arguments(parser):
+    add = parser.add_argument
+    add('directory', help="mirror directory")
+    add('--base-url', default=None,
+        help="url under which the mirror directory is served")
+
+
+def prepare_config(description):
+    pass
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    try:
+        if not mirror(args.directory, base_url=args.base_url):
+            sys.exit(1)
+    except (KeyboardInterrupt, EOFError):
+        info('')
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='mirror',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
@@ -18,6 +18,7 @@ import sys
 
 from six.moves import map
 
+from xylem.log_utils import debug
 from xylem.log_utils import info
 from xylem.log_utils import error
 
@@ -32,6 +33,9 @@ from xylem.config import get_config
 
 from xylem.exception import exc_to_str
 
+from xylem.server import ServerError
+from xylem.server import request
+
 from xylem.util import indent
 
 from .main import command_handle_args
@@ -79,22 +83,59 @@ def prepare_arguments(parser):
     # TODO: even better than the above 'show-depends' would be a way to
     #       to format the dependency DAG
 
+    add('--no-server', action="store_true",
+        help="""Don't use a running 'xylem serve' process, but
+        resolve in this process.""")
+    add('--socket', default=None, metavar='PATH',
+        help="""path of the socket of the 'xylem serve' process;
+        defaults to 'xylem.sock' in the cache folder""")
+
 
 def prepare_config(description):
     pass
 
 
+def resolve_with_server(args, config):
+    """Resolve keys with a running server.
+
+    :returns: tuple of default installer name, results as returned by
+        `resolve` with resolutions as strings and error messages, or
+        `None` if no server answered the request
+    """
+    try:
+        response = request('resolve', config, socket_path=args.socket,
+                           keys=args.xylem_key, all_keys=args.all)
+    except ServerError as e:
+        debug(to_str(e))
+        return None
+    results = [(key, (installer_name, resolutions))
+               for key, installer_name, resolutions in response['results']]
+    messages = [message for _, message in response['errors']]
+    return response['default_installer'], results, messages
+
+
+def resolve_locally(args, config):
+    """Resolve keys in this process; see `resolve_with_server`."""
+    ic = InstallerContext(config=config)
+    results, errors = resolve(args.xylem_key, all_keys=args.all,
+                              config=config, installer_context=ic)
+    messages = [exc_to_str(e) for _, e in errors]
+    return ic.get_default_installer_name(), results, messages
+
+
 def main(args=None):
     args = command_handle_args(args, definition)
     config = get_config()
     try:
-        ic = InstallerContext(config=config)
-        default_installer_name = ic.get_default_installer_name()
-        results, errors = resolve(args.xylem_key, all_keys=args.all,
-                                  config=config, installer_context=ic)
+        answer = None
+        if not args.no_server:
+            answer = resolve_with_server(args, config)
+        if answer is None:
+            answer = resolve_locally(args, config)
+        default_installer_name, results, errors = answer
         if errors:
-            error("\n".join(indent(exc_to_str(e), 2, exclude_first=True)
-                            for _, e in errors))
+            error("\n".join(indent(message, 2, exclude_first=True)
+                            for message in errors))
         for key, (installer_name, resolutions) in results:
             if installer_name != default_installer_name or \
                     args.show_default_installer:
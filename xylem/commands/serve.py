@@ -0,0 +1,82 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import signal
+import sys
+
+from xylem.config import get_config
+from xylem.log_utils import error
+from xylem.log_utils import info
+from xylem.server import ServerError
+from xylem.server import serve
+from xylem.server import server_socket_path
+from xylem.session import XylemSession
+from xylem.text_utils import to_str
+
+from .main import command_handle_args
+
+
+DESCRIPTION = """\
+Answer resolve and lookup queries from a long-running process.
+
+The os is detected, installer plugins are loaded and the rules database
+is loaded from cache once, and queries are answered over a local socket
+until the server is interrupted. 'xylem resolve' and 'xylem lookup' use
+the server if it is running with the same configuration; pass them the
+same '--socket' if a custom socket path is used. The database
+is reloaded automatically after 'xylem update'.
+"""
+
+
+def prepare_arguments(parser):
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help="""path of the server socket; defaults to
+                        'xylem.sock' in the cache folder""")
+
+
+def prepare_config(description):
+    pass
+
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+
+def main(args=None):
+    args = command_handle_args(args, definition)
+    config = get_config()
+    try:
+        socket_path = args.socket or server_socket_path(config)
+        signal.signal(signal.SIGTERM, _terminate)
+        with XylemSession(config) as session:
+            session.ensure_database()
+            serve(session, socket_path)
+    except ServerError as e:
+        error(to_str(e))
+        sys.exit(1)
+    except (KeyboardInterrupt, EOFError):
+        info('')
+        sys.exit(1)
+
+
+# This describes this command to the loader
+definition = dict(
+    title='serve',
+    description=DESCRIPTION,
+    main=main,
+    prepare_arguments=prepare_arguments,
+    prepare_config=prepare_config
+)
@@ -34,6 +34,22 @@ def prepare_arguments(parser):
     # with `install --simulate`
     parser.add_argument('-n', '--dry-run', action='store_true', default=False,
                         help="shows affect of an update only")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="""maximum number of sources to download and
+                        parse concurrently""")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        default=False,
+                        help="""only update sources whose cache is
+                        outdated, according to their 'max_age' or the
+                        spec plugin""")
+    parser.add_argument('--bundle', default=None, metavar='PATH',
+                        help="""after updating, write all source caches
+                        and the lookup index into a portable cache
+                        bundle at PATH, to be installed on other
+                        machines with 'xylem import-cache'""")
+    parser.add_argument('--verify-jobs', type=int, default=None, metavar='N',
+                        help="""verify large sources on N worker
+                        processes""")
 
 
 def prepare_config(description):
@@ -43,7 +59,9 @@ def prepare_config(description):
 def main(args=None):
     args = command_handle_args(args, definition)
     try:
-        update(dry_run=args.dry_run)
+        update(dry_run=args.dry_run, jobs=args.jobs,
+               incremental=args.incremental, bundle=args.bundle,
+               verify_jobs=args.verify_jobs)
     except (KeyboardInterrupt, EOFError):
         info('')
         sys.exit(1)
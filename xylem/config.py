@@ -132,6 +132,25 @@ def build_config_description():
     add("sources_dir", type=Path,
         command_line=True,
         help="""override the sources directory""")
+    add("paranoid", type=Boolean, default=False,
+        command_line=True,
+        help="""if `True`, fully verify cached rules data when loading
+        it, even if its checksum and version stamps show that it was
+        already verified when it was written""")
+    add("cache_format", type=String,
+        command_line=True,
+        help="""format for storing the data of cached sources; one of
+        'compact' (default) or 'pickle'""")
+    add("cache_compression", type=String,
+        command_line=True,
+        help="""compression of the data of cached sources; 'none'
+        (default) or 'zlib' for smaller cache files at the cost of
+        decompressing them on every load""")
+    add("database_backend", type=String,
+        command_line=True,
+        help="""backend of the rules database; 'cache' (default) to
+        query the cached data of each source, or 'sqlite' to query a
+        single SQLite file with all rules""")
     add("disabled_plugins/os", type=List(String), default=[],
         command_line_argument="disable-os-plugins",
         help="""disabled os plugin names""")
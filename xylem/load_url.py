@@ -16,18 +16,34 @@
 
 from __future__ import unicode_literals
 
+import os
 import socket
+import threading
 import time
+import zlib
+from six.moves import http_client
 from six.moves.urllib.error import HTTPError
 from six.moves.urllib.error import URLError
+from six.moves.urllib.parse import urljoin
+from six.moves.urllib.parse import urlparse
+from six.moves.urllib.request import Request
+from six.moves.urllib.request import getproxies
+from six.moves.urllib.request import pathname2url
+from six.moves.urllib.request import proxy_bypass
 from six.moves.urllib.request import urlopen
 import cgi
+import codecs
 
 from xylem.exception import raise_from
 from xylem.exception import XylemError
+from xylem.log_utils import debug
 from xylem.text_utils import to_str
 
 
+ACCEPT_ENCODING = 'gzip, deflate'
+"""Value of the ``Accept-Encoding`` header sent by `load_url`."""
+
+
 class DownloadFailure(XylemError):
 
     """Failure downloading data for I/O or other reasons."""
@@ -36,7 +52,8 @@ class DownloadFailure(XylemError):
 def load_url(url, retry=2, retry_period=1, timeout=10):
     """Load a given url with retries, retry_periods, and timeouts.
 
-    :param str url: URL to load and return contents of
+    :param str url: URL to load and return contents of; plain file
+        system paths are accepted as well (see :func:`url_from_path`)
     :param int retry: number of times to retry the url on 503 or timeout
     :param float retry_period: time to wait between retries in seconds
     :param float timeout: timeout for opening the URL in seconds
@@ -44,27 +61,465 @@ def load_url(url, retry=2, retry_period=1, timeout=10):
     :rtype: str
     :raises DownloadFailure: if loading fails even after retries
     """
+    data, _ = load_url_if_modified(url, None, retry, retry_period, timeout)
+    return data
+
+
+def load_url_if_modified(url, validators=None, retry=2, retry_period=1,
+                         timeout=10):
+    """Load a given url unless it is unchanged since the last download.
+
+    Like :func:`load_url`, but sends a conditional request with
+    ``If-None-Match`` and ``If-Modified-Since`` headers according to
+    ``validators``. If the server responds with ``304 Not Modified``,
+    the body is not downloaded.
+
+    Servers may send the body gzip or deflate compressed; it is
+    decompressed transparently.
+
+    :param validators: validators as returned by a previous call for the
+        same url, or ``None`` to load unconditionally
+    :type validators: `dict` or `None`
+    :param int retry: number of times to retry the url on 503 or timeout
+    :param float retry_period: time to wait between retries in seconds
+    :param float timeout: timeout for opening the URL in seconds
+    :returns: tuple ``(data, validators)``, where ``data`` is the loaded
+        data as string or ``None`` if the url is not modified, and
+        ``validators`` is a dict with the ``'etag'`` and
+        ``'last_modified'`` values of the response (if any)
+    :rtype: ``(str, dict)``
+    :raises DownloadFailure: if loading fails even after retries
+    """
+    chunks, validators = stream_url_if_modified(
+        url, validators, retry, retry_period, timeout)
+    if chunks is None:
+        return None, validators
+    return ''.join(chunks), validators
+
+
+def url_from_path(url):
+    """Return 'file://' url for plain file system paths.
+
+    Strings without url scheme (or with a drive letter on Windows) are
+    interpreted as file system paths relative to the current directory.
+    Other urls are returned unchanged.
+    """
+    scheme = urlparse(url).scheme
+    if scheme and not (len(scheme) == 1 and os.name == 'nt'):
+        return url
+    return urljoin('file:', pathname2url(os.path.abspath(url)))
+
+
+def stream_url_if_modified(url, validators=None, retry=2, retry_period=1,
+                           timeout=10):
+    """Like :func:`load_url_if_modified`, but stream the content.
+
+    The returned iterator yields the decoded content as string chunks
+    while it is downloaded, such that large files do not need to be held
+    in memory as a whole. Retries only happen before the first chunk.
+    The connection is released when the iterator is exhausted or
+    closed.
+
+    :returns: tuple ``(chunks, validators)``, where ``chunks`` is an
+        iterator of strings or ``None`` if the url is not modified
+    :raises DownloadFailure: if loading fails even after retries; while
+        iterating the chunks, if the download is interrupted or the
+        content cannot be decoded
+    """
+    url = url_from_path(url)
+    validators = validators or {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    conditional = bool(headers)
+    headers['Accept-Encoding'] = ACCEPT_ENCODING
     retry = max(retry, 0)  # negative retry count causes infinite loop
     while True:
         try:
-            req = urlopen(url, timeout=timeout)
-        except HTTPError as e:
-            if e.code == 503 and retry:
+            status, get_header, body = _get(url, headers, timeout, True)
+        except socket.timeout as e:
+            if retry:
                 retry -= 1
                 time.sleep(retry_period)
             else:
                 raise_from(DownloadFailure, "Failed to load url '{0}'.".
                            format(url), e)
-        except URLError as e:
-            if isinstance(e.reason, socket.timeout) and retry:
+        except (socket.error, http_client.HTTPException, URLError) as e:
+            raise_from(DownloadFailure, "Failed to load url '{0}'.".
+                       format(url), e)
+        else:
+            if status == 304 and conditional:
+                return None, validators
+            if status == 503 and retry:
                 retry -= 1
                 time.sleep(retry_period)
-            else:
+            elif status >= 400:
                 raise_from(DownloadFailure, "Failed to load url '{0}'.".
-                           format(url), e)
+                           format(url), HTTPError(
+                               url, status, http_client.responses.get(status),
+                               None, None))
+            else:
+                break
+    if body is None or isinstance(body, bytes):
+        body = [body] if body else []
+    return _iter_text(url, body, get_header), _response_validators(get_header)
+
+
+def _iter_text(url, chunks, get_header):
+    """Decode content encoding and charset of chunks of a response body."""
+    _, params = cgi.parse_header(get_header('Content-Type') or '')
+    transferred = decoded = 0
+    try:
+        content_decoder = _ContentDecoder(get_header('Content-Encoding'))
+        text_decoder = codecs.getincrementaldecoder(
+            params.get('charset', 'utf-8'))()
+        for chunk in chunks:
+            transferred += len(chunk)
+            chunk = content_decoder.decompress(chunk)
+            decoded += len(chunk)
+            text = text_decoder.decode(chunk)
+            if text:
+                yield text
+        chunk = content_decoder.flush()
+        decoded += len(chunk)
+        text = text_decoder.decode(chunk, final=True)
+        if text:
+            yield text
+    except (socket.error, http_client.HTTPException, LookupError,
+            ValueError) as e:
+        raise_from(DownloadFailure, "Failed to load url '{0}'.".
+                   format(url), e)
+    debug("Loaded url '{0}': {1} bytes transferred, {2} bytes decoded.".
+          format(url, transferred, decoded))
+
+
+def load_url_raw(url, accept_encoding=ACCEPT_ENCODING, timeout=10):
+    """Load a given url once, without decoding its content.
+
+    Unlike :func:`load_url`, there are no retries and the body is
+    returned as transferred, e.g. to measure the effect of compressed
+    transfer. It can be decoded with :func:`decode_content`.
+
+    :param str accept_encoding: value of the ``Accept-Encoding`` header
+    :param float timeout: timeout for opening the URL in seconds
+    :returns: tuple ``(data, content_encoding)`` of the response body
+        and the value of its ``Content-Encoding`` header or ``None``
+    :rtype: ``(bytes, str)``
+    :raises DownloadFailure: if loading fails or the response status is
+        not 200
+    """
+    url = url_from_path(url)
+    try:
+        status, get_header, data = _get(
+            url, {'Accept-Encoding': accept_encoding}, timeout)
+    except (socket.error, http_client.HTTPException, URLError) as e:
+        raise_from(DownloadFailure, "Failed to load url '{0}'.".
+                   format(url), e)
+    if status != 200:
+        raise DownloadFailure("Failed to load url '{0}': got status {1}.".
+                              format(url, status))
+    return data or b'', get_header('Content-Encoding')
+
+
+def decode_content(data, content_encoding):
+    """Decode response body according to its ``Content-Encoding``.
+
+    :param bytes data: response body
+    :param content_encoding: value of the ``Content-Encoding`` header
+        or ``None``
+    :returns: decoded body
+    :rtype: bytes
+    :raises ValueError: if the encoding is unsupported or the data
+        cannot be decoded
+    """
+    decoder = _ContentDecoder(content_encoding)
+    return decoder.decompress(data) + decoder.flush()
+
+
+class _ContentDecoder(object):
+
+    """Incrementally decode a response body with ``Content-Encoding``."""
+
+    def __init__(self, content_encoding):
+        self.decoders = []
+        encodings = [e.strip().lower()
+                     for e in (content_encoding or '').split(',')]
+        # encodings are listed in the order they were applied
+        for encoding in reversed(encodings):
+            if encoding in ('gzip', 'x-gzip'):
+                self.decoders.append(_ZlibDecoder(encoding))
+            elif encoding == 'deflate':
+                self.decoders.append(_DeflateDecoder())
+            elif encoding not in ('', 'identity'):
+                raise ValueError("Unsupported content encoding '{0}'.".
+                                 format(encoding))
+
+    def decompress(self, data):
+        for decoder in self.decoders:
+            data = decoder.decompress(data)
+        return data
+
+    def flush(self):
+        data = b''
+        for decoder in self.decoders:
+            data = decoder.decompress(data) + decoder.flush()
+        return data
+
+
+class _ZlibDecoder(object):
+
+    def __init__(self, encoding, wbits=16 + zlib.MAX_WBITS):
+        self.encoding = encoding
+        self.decompressor = zlib.decompressobj(wbits)
+
+    def decompress(self, data):
+        try:
+            return self.decompressor.decompress(data)
+        except zlib.error as e:
+            raise ValueError("Failed to decode '{0}' content: {1}".
+                             format(self.encoding, to_str(e)))
+
+    def flush(self):
+        data = self.decompressor.flush()
+        if not getattr(self.decompressor, 'eof', True):
+            raise ValueError("Failed to decode '{0}' content: incomplete "
+                             "or truncated stream".format(self.encoding))
+        return data
+
+
+class _DeflateDecoder(object):
+
+    """Decoder for 'deflate', which some servers send without header."""
+
+    def __init__(self):
+        self.head = b''
+        self.decoder = None
+
+    def decompress(self, data):
+        if self.decoder is None:
+            self.head += data
+            if len(self.head) < 2:
+                return b''
+            data, self.head = self.head, b''
+            cmf, flg = bytearray(data[:2])
+            if cmf & 0x0f == 8 and (cmf * 256 + flg) % 31 == 0:
+                wbits = zlib.MAX_WBITS
+            else:
+                wbits = -zlib.MAX_WBITS
+            self.decoder = _ZlibDecoder('deflate', wbits)
+        return self.decoder.decompress(data)
+
+    def flush(self):
+        if self.decoder is None:
+            if self.head:
+                raise ValueError("Failed to decode 'deflate' content: "
+                                 "incomplete or truncated stream")
+            return b''
+        return self.decoder.flush()
+
+
+def _get(url, headers, timeout, stream=False):
+    """Load url over a pooled connection if possible, else with urlopen.
+
+    :param bool stream: if ``True``, the content of successful
+        responses is returned as iterator of raw chunks
+    :returns: tuple of status code, header getter and raw content
+    """
+    if _use_pool(url):
+        return _pooled_get(url, headers, timeout, stream)
+    return _urlopen_get(url, headers, timeout, stream)
+
+
+def _response_validators(get_header):
+    """Extract cache validators from the headers of an url response."""
+    validators = {}
+    for key, header in [('etag', 'ETag'), ('last_modified', 'Last-Modified')]:
+        value = get_header(header)
+        if value:
+            validators[key] = to_str(value)
+    return validators
+
+
+def _urlopen_get(url, headers, timeout, stream=False):
+    """Load url with `urlopen`.
+
+    :returns: tuple of status code, header getter and content
+    """
+    try:
+        req = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as e:
+        info = e.info()
+        return e.code, info.get if info is not None else _no_header, None
+    except URLError as e:
+        if isinstance(e.reason, socket.timeout):
+            raise e.reason
+        raise
+    if stream:
+        return req.getcode() or 200, req.info().get, _iter_body(req)
+    try:
+        return req.getcode() or 200, req.info().get, req.read()
+    finally:
+        req.close()
+
+
+def _iter_body(response):
+    """Yield chunks of a response body and close the response."""
+    try:
+        while True:
+            chunk = response.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        response.close()
+
+
+def _no_header(name):
+    return None
+
+
+class pooled_connections(object):
+
+    """Reuse persistent HTTP connections while inside this context.
+
+    Inside the context, connections to http and https urls loaded with
+    :func:`load_url` or :func:`load_url_if_modified` are kept alive and
+    reused for further requests to the same host, also by other
+    threads. Leaving the outermost context closes all idle connections.
+    Outside of the context, each connection is closed after the
+    request.
+    """
+
+    def __enter__(self):
+        _pool.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _pool.release()
+
+
+class _ConnectionPool(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._users = 0
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users:
+                return
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def get(self, key, timeout):
+        """Return tuple of connection and `True` if it is reused."""
+        with self._lock:
+            connections = self._idle.get(key)
+            connection = connections.pop() if connections else None
+        if connection is not None:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection, True
+        scheme, host, port = key
+        if scheme == 'https':
+            connection = http_client.HTTPSConnection(
+                host, port, timeout=timeout)
+        else:
+            connection = http_client.HTTPConnection(
+                host, port, timeout=timeout)
+        return connection, False
+
+    def put(self, key, connection):
+        with self._lock:
+            if self._users:
+                self._idle.setdefault(key, []).append(connection)
+                return
+        connection.close()
+
+
+_pool = _ConnectionPool()
+
+_MAX_REDIRECTS = 10
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _use_pool(url):
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or parsed.username:
+        return False
+    # leave proxies to urlopen
+    return (parsed.scheme not in getproxies() or
+            proxy_bypass(parsed.hostname))
+
+
+def _pooled_get(url, headers, timeout, stream=False):
+    """Load url over a pooled persistent connection.
+
+    Redirects are followed. Other responses are returned as is.
+
+    :returns: tuple of status code, header getter and content
+    """
+    for _ in range(_MAX_REDIRECTS + 1):
+        response, data = _pooled_request(url, headers, timeout, stream)
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location:
+            url = urljoin(url, location)
+            if not _use_pool(url):
+                return _urlopen_get(url, headers, timeout, stream)
+            continue
+        return response.status, response.getheader, data
+    raise http_client.HTTPException(
+        "Too many redirects for url '{0}'.".format(url))
+
+
+def _pooled_request(url, headers, timeout, stream=False):
+    parsed = urlparse(url)
+    key = (parsed.scheme, parsed.hostname, parsed.port)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    while True:
+        connection, reused = _pool.get(key, timeout)
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            if stream and response.status == 200:
+                return response, _iter_pooled_body(key, connection, response)
+            data = response.read()
+        except (socket.error, http_client.HTTPException) as e:
+            connection.close()
+            if reused and not isinstance(e, socket.timeout):
+                # the server closed the idle connection; try a new one
+                continue
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            _pool.put(key, connection)
+        return response, data
+
+
+def _iter_pooled_body(key, connection, response):
+    """Yield chunks of a response body and then release the connection."""
+    complete = False
+    try:
+        for chunk in _iter_body(response):
+            yield chunk
+        complete = True
+    finally:
+        if complete and not response.will_close:
+            _pool.put(key, connection)
         else:
-            break
-    _, params = cgi.parse_header(req.headers.get('Content-Type', ''))
-    encoding = params.get('charset', 'utf-8')
-    data = req.read()
-    return to_str(data, encoding=encoding)
+            connection.close()
@@ -15,29 +15,39 @@
 from __future__ import unicode_literals
 
 from xylem.sources import SourcesContext
-from xylem.sources import RulesDatabase
+from xylem.sources import create_rules_database
 from xylem.installers import InstallerContext
 from xylem.specs.plugins.rules import compact_installer_dict
 from xylem.config import get_config
 
 
 def lookup(xylem_key, compact=False, config=None, sources_context=None,
-           installer_context=None):
+           installer_context=None, database=None):
+    """Lookup the rules for a xylem key on the current os.
+
+    :param bool compact: if `True`, return the installer dict in
+        compact notation
+    :param database: loaded rules database to look the key up in; if
+        `None` is passed, the database is loaded from cache using
+        ``sources_context``
+    :type database: `RulesDatabase` or `None`
+    :returns: installer dict
+    """
 
     if config is None:
         config = get_config()
 
-    sources_context = sources_context or SourcesContext(config)
     ic = installer_context or InstallerContext(config)
 
-    database = RulesDatabase(sources_context)
-    database.load_from_cache()
+    if database is None:
+        sources_context = sources_context or SourcesContext(config)
+        database = create_rules_database(sources_context)
+        database.load_from_cache(ic, lazy=True)
 
     installer_dict = database.lookup(xylem_key, ic)
 
     if compact:
         default_installer_name = ic.get_default_installer_name()
-        compacted = compact_installer_dict(installer_dict,
-                                           default_installer_name)
+        return compact_installer_dict(installer_dict, default_installer_name)
 
-    return compacted
+    return installer_dict
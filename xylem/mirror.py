@@ -0,0 +1,240 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Implements the mirror functionality.
+
+A mirror is a directory with a copy of the files of all configured
+sources, such that many machines can update from the mirror instead of
+the upstream urls. The layout of the mirror directory is:
+
+- ``files/``: the mirrored files
+- ``sources.d/``: a copy of the source list files, with the urls of all
+  mirrored sources replaced by the url (or path) of the mirrored file
+- ``index.yaml``: for each mirrored url the mirrored file, its sha1
+  checksum, the time it was last downloaded and the validators for
+  conditional requests
+
+Machines use the mirror by setting their ``sources_dir`` to the
+mirror's ``sources.d``, or by copying the files from there into their
+sources directory. The mirror may be shared as a directory, or served
+over HTTP, in which case the ``base_url`` of the mirror needs to be
+passed when creating it.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import hashlib
+import os
+import re
+
+import yaml
+
+from six.moves.urllib.parse import urlparse
+
+from xylem.config import get_config
+from xylem.exception import exc_to_str
+from xylem.load_url import DownloadFailure
+from xylem.load_url import pooled_connections
+from xylem.load_url import stream_url_if_modified
+from xylem.log_utils import error
+from xylem.log_utils import info
+from xylem.log_utils import info_v
+from xylem.log_utils import warning
+from xylem.sources import RulesDatabase
+from xylem.sources import SourcesContext
+from xylem.sources.impl import SOURCE_DESCRIPTION_OPTIONS
+from xylem.text_utils import to_bytes
+from xylem.text_utils import to_str
+from xylem.util import atomic_file
+from xylem.util import file_lock
+from xylem.yaml_utils import dump_yaml
+from xylem.yaml_utils import load_yaml
+
+
+MIRROR_INDEX_FILE_NAME = "index.yaml"
+MIRROR_FILES_DIR = "files"
+MIRROR_SOURCES_DIR = "sources.d"
+MIRROR_LOCK_FILE_NAME = "mirror.lock"
+
+
+def mirror(directory, base_url=None, config=None, sources_context=None):
+    """Download the files of all configured sources into a mirror.
+
+    Files that were mirrored before are only downloaded again if they
+    changed, as far as the server supports conditional requests. If a
+    file cannot be downloaded, a previously mirrored version is kept.
+    Sources that cannot be mirrored keep their original arguments in
+    the mirror's source lists.
+
+    :param str directory: mirror directory; created if it does not exist
+    :param base_url: url under which ``directory`` is served; if `None`
+        is passed, the source lists refer to the mirrored files by their
+        absolute path
+    :type base_url: `str` or `None`
+    :param config: config dict to create source context with; if `None`
+        is passed, use global configuration
+    :type config: `dict` or `None`
+    :param sources_context: the sources context determining the sources
+        to mirror; if `None` is passed, a sources context from
+        ``config`` is created
+    :type sources_context: `SourcesContext` or `None`
+    :returns: ``True`` if all sources were mirrored successfully
+    """
+    if config is None:
+        config = get_config()
+    sources_context = sources_context or SourcesContext(config)
+    database = RulesDatabase(sources_context)
+    directory = os.path.abspath(directory)
+    files_dir = os.path.join(directory, MIRROR_FILES_DIR)
+    if not os.path.isdir(files_dir):
+        os.makedirs(files_dir)
+    success = True
+    with file_lock(os.path.join(directory, MIRROR_LOCK_FILE_NAME)):
+        old_index = _read_mirror_index(directory)
+        index = {}
+        source_lists = {}
+        with pooled_connections():
+            for source in database.sources:
+                descr = dict((key, getattr(source, key))
+                             for key in SOURCE_DESCRIPTION_OPTIONS
+                             if getattr(source, key) is not None)
+                descr[source.spec.name] = source.arguments
+                name = os.path.basename(source.origin.split(':')[-1])
+                source_lists.setdefault(name, []).append(descr)
+                url = source.spec.source_url(source.arguments)
+                if url is None:
+                    warning("Not mirroring source '{0}' of spec '{1}'.".
+                            format(source.arguments, source.spec.name))
+                    continue
+                entry = old_index.get(url)
+                try:
+                    entry = _mirror_url(url, directory, entry)
+                except (DownloadFailure, IOError, OSError) as e:
+                    success = False
+                    error("Failed to mirror '{0}':\n{1}".
+                          format(url, exc_to_str(e)))
+                    if entry is None or not os.path.isfile(
+                            os.path.join(directory, entry['file'])):
+                        continue
+                    warning("Keeping previously mirrored file for '{0}'.".
+                            format(url))
+                index[url] = entry
+                descr[source.spec.name] = _mirrored_url(
+                    directory, base_url, entry['file'])
+        _write_source_lists(directory, source_lists)
+        _write_mirror_index(directory, index)
+        _remove_stale_files(directory, index)
+    info("Mirrored {0} of {1} sources into '{2}'.".
+         format(len(index), len(database.sources), directory))
+    return success
+
+
+def _mirror_url(url, directory, entry):
+    """Download ``url`` into the mirror unless it is unchanged.
+
+    :param entry: index entry from the last time ``url`` was mirrored,
+        or ``None``
+    :returns: updated index entry
+    """
+    if entry is None:
+        entry = dict(file=_mirror_file_name(url))
+    path = os.path.join(directory, entry['file'])
+    validators = entry.get('validators') if os.path.isfile(path) else None
+    chunks, validators = stream_url_if_modified(url, validators)
+    if chunks is None:
+        info_v("Unchanged: {0}".format(url))
+        return entry
+    old_stat = os.stat(path) if os.path.isfile(path) else None
+    checksum = hashlib.sha1()
+    with atomic_file(path) as f:
+        for chunk in chunks:
+            chunk = to_bytes(chunk)
+            checksum.update(chunk)
+            f.write(chunk)
+    unchanged = old_stat is not None and \
+        entry.get('sha1') == checksum.hexdigest()
+    if unchanged:
+        # keep the modification time, such that machines using the
+        # mirror as local path do not consider their caches outdated
+        os.utime(path, (old_stat.st_atime, old_stat.st_mtime))
+        info_v("Unchanged: {0}".format(url))
+    else:
+        info("Mirrored: {0}".format(url))
+    return dict(entry, validators=validators, sha1=checksum.hexdigest(),
+                time_downloaded=datetime.datetime.now().isoformat())
+
+
+def _mirror_file_name(url):
+    """Return path of the mirrored file for ``url`` relative to mirror."""
+    basename = os.path.basename(urlparse(url).path) or 'index'
+    basename = re.sub(r'[^\w.-]', '_', basename)
+    prefix = hashlib.sha1(to_bytes(url)).hexdigest()[:12]
+    return '/'.join([MIRROR_FILES_DIR, prefix + '-' + basename])
+
+
+def _mirrored_url(directory, base_url, file_name):
+    if base_url:
+        return base_url.rstrip('/') + '/' + file_name
+    return os.path.join(directory, *file_name.split('/'))
+
+
+def _read_mirror_index(directory):
+    path = os.path.join(directory, MIRROR_INDEX_FILE_NAME)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            entries = load_yaml(to_str(f.read())) or []
+        return dict((e['url'], e) for e in entries)
+    except (IOError, OSError, yaml.YAMLError, LookupError, TypeError) as e:
+        warning("Ignoring invalid mirror index '{0}':\n{1}".
+                format(path, exc_to_str(e)))
+        return {}
+
+
+def _write_mirror_index(directory, index):
+    entries = [dict(entry, url=url) for url, entry in sorted(index.items())]
+    with atomic_file(os.path.join(directory, MIRROR_INDEX_FILE_NAME)) as f:
+        f.write(to_bytes(_dump_yaml_list(entries)))
+
+
+def _write_source_lists(directory, source_lists):
+    sources_dir = os.path.join(directory, MIRROR_SOURCES_DIR)
+    if not os.path.isdir(sources_dir):
+        os.makedirs(sources_dir)
+    for name in os.listdir(sources_dir):
+        if name not in source_lists:
+            os.remove(os.path.join(sources_dir, name))
+    for name, descriptions in source_lists.items():
+        with atomic_file(os.path.join(sources_dir, name)) as f:
+            f.write(to_bytes(_dump_yaml_list(descriptions)))
+
+
+def _dump_yaml_list(items):
+    """Dump list of dicts in block style, unlike `dump_yaml`."""
+    result = ''
+    for item in items:
+        lines = dump_yaml(item).splitlines(True)
+        result += '- ' + '  '.join(lines)
+    return result
+
+
+def _remove_stale_files(directory, index):
+    """Remove mirrored files of sources that are no longer configured."""
+    files = set(entry['file'] for entry in index.values())
+    files_dir = os.path.join(directory, MIRROR_FILES_DIR)
+    for name in os.listdir(files_dir):
+        if '/'.join([MIRROR_FILES_DIR, name]) not in files:
+            os.remove(os.path.join(files_dir, name))
@@ -21,7 +21,7 @@ from xylem.config import ensure_config
 from xylem.installers import ensure_installer_context
 from xylem.installers import InstallerError
 
-from xylem.sources import RulesDatabase
+from xylem.sources import create_rules_database
 from xylem.sources import ensure_sources_context
 
 from xylem.text_utils import to_str
@@ -54,12 +54,14 @@ def resolve(xylem_keys,
     del installer_context  # don't use further down, use `ic` only
     if not database:
         sources_context = ensure_sources_context(sources_context, config)
-        database = RulesDatabase(sources_context)
-        database.load_from_cache()
+        database = create_rules_database(sources_context)
+        database.load_from_cache(ic, lazy=True)
     del sources_context  # don't use further down, use `database` only
 
     #  2. Prepare set of keys to look up
     if all_keys:
+        # merge all sources once instead of for every key
+        database.prepare_bulk_lookup(ic)
         lookup_keys = remove_duplicates(xylem_keys + sorted(database.keys(ic)))
     else:
         lookup_keys = remove_duplicates(xylem_keys)
@@ -80,12 +82,22 @@ def resolve(xylem_keys,
             else:
                 install_from_map[k] = inst
 
-    # 4. Resolve each key
+    # 4. Lookup all keys in the database at once; if that fails, look
+    #    them up one by one below to find out which keys fail
+    try:
+        installer_dicts = database.lookup_many(lookup_keys, ic)
+    except LookupError:
+        installer_dicts = None
+
+    # 5. Resolve each key
     for key in lookup_keys:
 
-        # 4.1.  Lookup key in the database
+        # 5.1.  Lookup key in the database
         try:
-            installer_dict = database.lookup(key, ic)
+            if installer_dicts is not None:
+                installer_dict = installer_dicts[key]
+            else:
+                installer_dict = database.lookup(key, ic)
             if not installer_dict:
                 errors.append((key, ResolutionError(
                     "could not find rule for xylem key '{}' on '{}'.".
@@ -96,7 +108,7 @@ def resolve(xylem_keys,
                 ResolutionError, "lookup for key '{}' failed".format(key), e)))
             continue
 
-        # 4.2.  Decide which installer to use
+        # 5.2.  Decide which installer to use
         if key in install_from_map:
             inst_name = install_from_map[key]
             if not ic.lookup_installer(inst_name):
@@ -142,7 +154,7 @@ def resolve(xylem_keys,
                            to_str(installer_dict.keys())))))
                 continue
 
-        # 4.3.  Resolve with determined installer
+        # 5.3.  Resolve with determined installer
         try:
             resolutions = installer.resolve(rule)
         except InstallerError as e:
@@ -0,0 +1,265 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resolution server answering queries over a local socket.
+
+Each invocation of the ``xylem`` command line tool detects the os, loads
+the installer plugins and loads the rules database from cache before
+answering a single query. ``xylem serve`` keeps a `XylemSession` with
+all of that loaded and answers queries from other processes over a Unix
+domain socket; ``xylem resolve`` and ``xylem lookup`` use it if it is
+running. The database is reloaded automatically when ``xylem update``
+rewrites the cache (see `XylemSession.ensure_database`).
+
+The protocol is newline-delimited JSON. Each request is an object with
+entries ``command`` (one of ``'ping'``, ``'resolve'``, ``'lookup'`` and
+``'keys'``), ``config`` (see `config_key`) and the arguments of the
+command. Each response is an object with entry ``ok``, and ``result``
+if the request succeeded or ``error`` otherwise.
+
+Requests are only answered if the client's configuration is the same as
+the server's, since the configuration determines the sources, the os
+and the installers.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import json
+import os
+import socket
+
+from six.moves import socketserver
+
+from xylem.config import DEFAULT_CACHE_DIR
+from xylem.config import ensure_config
+from xylem.config_utils import copy_to_dict
+from xylem.exception import XylemError
+from xylem.exception import exc_to_str
+from xylem.log_utils import debug
+from xylem.log_utils import info
+from xylem.log_utils import info_v
+from xylem.text_utils import to_str
+
+
+SERVER_SOCKET_NAME = "xylem.sock"
+"""Name of the server socket in the cache folder."""
+
+DEFAULT_TIMEOUT = 60
+"""Seconds the client waits for a response before giving up."""
+
+
+class ServerError(XylemError):
+
+    """Exception for the server being unavailable or failing a request."""
+
+
+def server_socket_path(config=None):
+    """Return the path of the server socket for a configuration.
+
+    The socket is placed in the cache folder, outside of the sources
+    cache, such that it does not look like a change to the cache.
+    """
+    config = ensure_config(config)
+    return os.path.join(config.cache_dir or DEFAULT_CACHE_DIR,
+                        SERVER_SOCKET_NAME)
+
+
+def config_key(config):
+    """Return string identifying a configuration.
+
+    Server and client compare these to decide if the server may answer
+    the client's requests.
+    """
+    return json.dumps(copy_to_dict(config), sort_keys=True, default=to_str)
+
+
+class XylemServer(socketserver.UnixStreamServer):
+
+    """Server answering requests sequentially from a `XylemSession`.
+
+    Requests are handled one at a time, since the session and its rules
+    database are not thread-safe. Queries are cheap once the database is
+    loaded, so this is not a bottleneck for local clients.
+
+    :param XylemSession session: session to answer queries from
+    :param str socket_path: path to bind the socket to; an existing
+        socket without a server listening on it is removed
+    :raises ServerError: if a server is already listening on
+        ``socket_path``
+    """
+
+    def __init__(self, session, socket_path):
+        self.session = session
+        self.config_key = config_key(session.config)
+        if os.path.exists(socket_path):
+            if _is_listening(socket_path):
+                raise ServerError("Server is already running on socket "
+                                  "'{0}'.".format(socket_path))
+            os.remove(socket_path)
+        # old-style class in py2, so no `super`
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               _RequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+    def answer(self, request):
+        """Return response dict for a request dict."""
+        try:
+            if request.get('config') != self.config_key:
+                return dict(ok=False, error="Configuration of client and "
+                            "server differ.")
+            command = request.get('command')
+            handler = getattr(self, '_answer_' + to_str(command), None)
+            if handler is None:
+                return dict(ok=False, error="Unknown command '{0}'.".
+                            format(command))
+            return dict(ok=True, result=handler(request))
+        except (XylemError, IOError, OSError, LookupError, TypeError,
+                ValueError) as e:
+            debug("Failed to answer request:\n{0}".format(exc_to_str(e)))
+            return dict(ok=False, error=exc_to_str(e))
+
+    def _answer_ping(self, request):
+        ic = self.session.installer_context
+        return dict(pid=os.getpid(), os=ic.get_os_string(),
+                    default_installer=ic.get_default_installer_name())
+
+    def _answer_resolve(self, request):
+        results, errors = self.session.resolve(
+            request['keys'], all_keys=request.get('all_keys', False))
+        ic = self.session.installer_context
+        return dict(
+            default_installer=ic.get_default_installer_name(),
+            results=[[key, installer_name, [to_str(r) for r in resolutions]]
+                     for key, (installer_name, resolutions) in results],
+            errors=[[key, exc_to_str(e)] for key, e in errors])
+
+    def _answer_lookup(self, request):
+        return dict(
+            os=self.session.installer_context.get_os_string(),
+            rules=[[key, self.session.lookup(key, compact=True)]
+                   for key in request['keys']])
+
+    def _answer_keys(self, request):
+        database = self.session.ensure_database()
+        return sorted(database.keys(self.session.installer_context))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError("Expected object, got '{0}'.".
+                                     format(request))
+            except ValueError as e:
+                response = dict(ok=False, error="Invalid request: {0}".
+                                format(to_str(e)))
+            else:
+                info_v("Request: {0}".format(request.get('command')))
+                response = self.server.answer(request)
+            self.wfile.write(_encode(response))
+            self.wfile.flush()
+
+
+def _encode(message):
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+def _is_listening(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+            return False
+        raise
+    finally:
+        sock.close()
+
+
+def request(command, config=None, socket_path=None, timeout=DEFAULT_TIMEOUT,
+            **arguments):
+    """Send a request to the server and return the result.
+
+    :param str command: one of ``'ping'``, ``'resolve'``, ``'lookup'``
+        and ``'keys'``
+    :param config: config dict; if `None` is passed, use global
+        configuration
+    :type config: `dict` or `None`
+    :param socket_path: path of the server socket; if `None` is passed,
+        use :func:`server_socket_path`
+    :param timeout: seconds to wait for the response
+    :param arguments: arguments of the command, e.g. ``keys`` and
+        ``all_keys`` for ``'resolve'``
+    :returns: the ``result`` entry of the response
+    :raises ServerError: if no server is running, or the server does not
+        answer the request, e.g. because the configurations differ
+    """
+    config = ensure_config(config)
+    socket_path = socket_path or server_socket_path(config)
+    message = dict(arguments, command=command, config=config_key(config))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(_encode(message))
+        sock.shutdown(socket.SHUT_WR)
+        f = sock.makefile('rb')
+        try:
+            line = f.readline()
+        finally:
+            f.close()
+    except (socket.error, socket.timeout) as e:
+        raise ServerError("Failed to connect to server on socket '{0}': "
+                          "{1}".format(socket_path, to_str(e)))
+    finally:
+        sock.close()
+    try:
+        response = json.loads(line.decode('utf-8'))
+    except ValueError:
+        raise ServerError("Invalid response from server: {0!r}".format(line))
+    if not response.get('ok'):
+        raise ServerError("Server failed to answer '{0}' request: {1}".
+                          format(command, response.get('error')))
+    return response['result']
+
+
+def serve(session, socket_path=None):
+    """Answer requests from ``session`` until interrupted.
+
+    :param XylemSession session: session to answer queries from
+    :param socket_path: path of the server socket; if `None` is passed,
+        use :func:`server_socket_path`
+    :raises ServerError: if a server is already running
+    """
+    socket_path = socket_path or server_socket_path(session.config)
+    directory = os.path.dirname(socket_path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    server = XylemServer(session, socket_path)
+    info("Serving on '{0}'.".format(socket_path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,196 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Implements sessions for using xylem as a library.
+
+The functions of the public API (`xylem.lookup.lookup`,
+`xylem.resolve.resolve`, `xylem.install.install`) create the
+configuration, the sources and installer contexts and the rules
+database on every call, unless they are passed in. A `XylemSession`
+creates them once and passes them to every call, which is what tools
+querying xylem many times (e.g. build systems) should use::
+
+    with XylemSession() as session:
+        for package in packages:
+            results, errors = session.resolve(dependencies[package])
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from xylem.config import ensure_config
+from xylem.install import install
+from xylem.installers import ensure_installer_context
+from xylem.lookup import lookup
+from xylem.resolve import resolve
+from xylem.sources import create_rules_database
+from xylem.sources import ensure_sources_context
+from xylem.sources.database import LOCK_FILE_NAME
+from xylem.sources.sqlite_database import DATABASE_FILE_NAME
+from xylem.update import update
+
+
+class XylemSession(object):
+
+    """Long-lived configuration, contexts and rules database.
+
+    The rules database is loaded from cache on first use and kept
+    loaded, including its memoized lookups, until the cache files or
+    source lists on disk change, e.g. by ``xylem update`` in another
+    process. This is checked by comparing the file names and stat
+    results of the files defining the data before each query, which is
+    much cheaper than loading the database again.
+
+    :param config: config dict; if `None` is passed, use global
+        configuration
+    :type config: `dict` or `None`
+    :param sources_context: if `None` is passed, it is created from
+        ``config``
+    :type sources_context: `SourcesContext` or `None`
+    :param installer_context: if `None` is passed, it is created from
+        ``config``, detecting the os once for the whole session
+    :type installer_context: `InstallerContext` or `None`
+    :ivar int reloads: number of times the rules database was loaded
+    """
+
+    def __init__(self, config=None, sources_context=None,
+                 installer_context=None):
+        self.config = ensure_config(config)
+        self.sources_context = ensure_sources_context(sources_context,
+                                                      self.config)
+        self.installer_context = ensure_installer_context(installer_context,
+                                                          self.config)
+        self.database = None
+        self.reloads = 0
+        self._stamp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Release the rules database, e.g. its SQLite connection."""
+        if self.database is not None and hasattr(self.database, 'close'):
+            self.database.close()
+        self.database = None
+        self._stamp = None
+
+    def ensure_database(self):
+        """Return the loaded rules database, reloading it if needed.
+
+        :returns: rules database loaded from cache, which is reused
+            until the cache files or source lists on disk change
+        """
+        # take the stamp before loading, such that changes while loading
+        # cause another reload next time
+        stamp = self._disk_stamp()
+        if self.database is None or stamp != self._stamp:
+            self.close()
+            database = create_rules_database(self.sources_context)
+            database.load_from_cache(self.installer_context, lazy=True)
+            self.database = database
+            self._stamp = stamp
+            self.reloads += 1
+        return self.database
+
+    def lookup(self, xylem_key, compact=False):
+        """Lookup rules for a xylem key; see `xylem.lookup.lookup`."""
+        return lookup(xylem_key, compact=compact, config=self.config,
+                      installer_context=self.installer_context,
+                      database=self.ensure_database())
+
+    def lookup_many(self, xylem_keys):
+        """Return dict mapping xylem keys to their rules.
+
+        See `xylem.sources.database.RulesDatabase.lookup_many`.
+        """
+        return self.ensure_database().lookup_many(xylem_keys,
+                                                  self.installer_context)
+
+    def resolve(self, xylem_keys, all_keys=False):
+        """Resolve xylem keys; see `xylem.resolve.resolve`."""
+        return resolve(xylem_keys, all_keys=all_keys, config=self.config,
+                       database=self.ensure_database(),
+                       installer_context=self.installer_context)
+
+    def install(self, xylem_keys, **kwargs):
+        """Install xylem keys; see `xylem.install.install`.
+
+        Keyword arguments other than the config, contexts and database
+        are passed on.
+        """
+        return install(xylem_keys, config=self.config,
+                       database=self.ensure_database(),
+                       installer_context=self.installer_context, **kwargs)
+
+    def update(self, **kwargs):
+        """Update the cache; see `xylem.update.update`.
+
+        The rules database is reloaded on next use. Keyword arguments
+        other than the config and contexts are passed on.
+        """
+        update(config=self.config, sources_context=self.sources_context,
+               installer_context=self.installer_context, **kwargs)
+
+    def _disk_stamp(self):
+        return (_directory_stamp(self.sources_context.cache_dir,
+                                 _is_cache_data_file),
+                _directory_stamp(self.sources_context.sources_dir,
+                                 _is_source_list_file))
+
+
+def _is_cache_data_file(name):
+    """Check if a file in the cache dir defines the cached data.
+
+    These are the source caches, their meta data, the lookup index and
+    the SQLite database. Other files are ignored, in particular the
+    write-ahead log and shared memory files, which SQLite creates and
+    modifies even when just reading the database.
+    """
+    return name.endswith(('.pickle', '.meta')) or name == DATABASE_FILE_NAME
+
+
+def _is_source_list_file(name):
+    """Check if a file in the sources dir is a source list.
+
+    The lock file and hidden (e.g. temporary) files are ignored.
+    """
+    return name != LOCK_FILE_NAME and not name.startswith('.')
+
+
+def _directory_stamp(directory, include):
+    """Return names, sizes, modification times and inodes of files.
+
+    Inodes are included, since cache files are replaced by renaming,
+    possibly within the resolution of modification times.
+
+    :param include: function deciding by file name which files are part
+        of the stamp
+    """
+    if not directory or not os.path.isdir(directory):
+        return None
+    stamp = []
+    for name in sorted(os.listdir(directory)):
+        if not include(name):
+            continue
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            # removed while listing
+            continue
+        stamp.append((name, st.st_size, st.st_mtime, st.st_ino))
+    return stamp
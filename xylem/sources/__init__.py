@@ -17,8 +17,12 @@ from __future__ import unicode_literals
 from .impl import SourcesContext
 from .impl import ensure_sources_context
 from .impl import UnknownSpecError
+from .impl import UnknownDatabaseBackendError
 from .database import RulesDatabase
 from .database import RulesSource
+from .database import create_rules_database
+from .sqlite_database import SQLiteRulesDatabase
 
 __all__ = ['SourcesContext', 'ensure_sources_context', 'UnknownSpecError',
-           'RulesDatabase', 'RulesSource']
+           'UnknownDatabaseBackendError', 'RulesDatabase', 'RulesSource',
+           'create_rules_database', 'SQLiteRulesDatabase']
@@ -0,0 +1,528 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serialization formats for the data of cached sources.
+
+Two formats are supported. ``'pickle'`` (protocol 2) works for any
+data. ``'compact'`` is specific to expanded rules dicts and is the
+default for those. Data that cannot be represented in the compact format
+is stored with pickle instead. When loading, the format is detected from
+the serialized data.
+
+The compact format stores every string (xylem keys, os names and
+versions, installer names, package names, ...) only once in a string
+table. Rules refer to strings by their index in that table. The rules
+for each xylem key are stored as a separate chunk, and a key table
+sorted by xylem key holds the offset of each chunk. The layout is:
+
+- header: magic, format version, number of strings, size of the string
+  table in bytes, number of keys
+- string offsets: offset of each string relative to the start of the
+  string table, plus the size of the string table
+- string table: all strings utf-8 encoded and separated by ``'\\0'``
+- key table: for each key, string index of the key, offset of its chunk
+  relative to the start of the chunk region, size of its chunk
+- chunk region: for each key the os dict encoded as compact ascii JSON
+
+All integers in the header and tables are unsigned 32 bit little endian.
+
+An os dict is encoded as flat lists of alternating string index and
+value, i.e. ``[os, [version, [installer, rule, ...], ...], ...]``. Inside
+installer rules, strings are encoded as string index, lists of strings
+as lists of string indices, other lists as ``{"[": [value, ...]}``,
+dicts as ``{"": [key, value, ...]}`` and other scalars as ``{"=":
+value}``.
+
+Compact data is accessed through the read-only `CompactRulesDict`. It
+works directly on the serialized data, which may be memory-mapped, such
+that looking up a key only decodes the strings and the chunk of that key
+(found by binary search in the key table). Iterating over all keys
+decodes the string table in bulk.
+
+Independently of the format, the serialized data can be compressed for
+storage on disk (see `compress_data`). Compressed data cannot be queried
+in place, but compact data is still decoded lazily after decompressing.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import struct
+import zlib
+
+import six
+import six.moves.cPickle as pickle
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from xylem.exception import XylemError
+from xylem.text_utils import text_type
+from xylem.text_utils import to_str
+
+
+CACHE_FORMATS = ['compact', 'pickle']
+"""Names of supported cache formats."""
+
+DEFAULT_CACHE_FORMAT = 'compact'
+"""Cache format used if none is configured."""
+
+CACHE_COMPRESSIONS = ['none', 'zlib']
+"""Names of supported compressions of cached data."""
+
+DEFAULT_CACHE_COMPRESSION = 'none'
+"""Compression of cached data used if none is configured."""
+
+COMPACT_MAGIC = b'XYRULES'
+COMPACT_VERSION = 2
+
+_header = struct.Struct(str('<7sBIII'))
+_string_offset = struct.Struct(str('<I'))
+_string_range = struct.Struct(str('<II'))
+_key_entry = struct.Struct(str('<III'))
+_json_decoder = json.JSONDecoder()
+
+# favor load time over size
+_ZLIB_LEVEL = 1
+
+
+class UnknownCacheFormatError(XylemError):
+
+    """Raised for unknown cache format names."""
+
+
+def verify_cache_format(cache_format):
+    """Verify that ``cache_format`` is a known cache format name.
+
+    :raises UnknownCacheFormatError: if the format is unknown
+    """
+    if cache_format not in CACHE_FORMATS:
+        raise UnknownCacheFormatError(
+            "Unknown cache format '{0}'; expected one of {1}.".
+            format(cache_format, to_str(CACHE_FORMATS)))
+
+
+def verify_cache_compression(compression):
+    """Verify that ``compression`` is a known compression name.
+
+    :raises UnknownCacheFormatError: if the compression is unknown
+    """
+    if compression not in CACHE_COMPRESSIONS:
+        raise UnknownCacheFormatError(
+            "Unknown cache compression '{0}'; expected one of {1}.".
+            format(compression, to_str(CACHE_COMPRESSIONS)))
+
+
+def compress_data(blob, compression=DEFAULT_CACHE_COMPRESSION):
+    """Compress serialized data for storage.
+
+    :rtype: `bytes`
+    :raises UnknownCacheFormatError: if ``compression`` is unknown
+    """
+    verify_cache_compression(compression)
+    if compression == 'zlib':
+        return zlib.compress(blob, _ZLIB_LEVEL)
+    return blob
+
+
+def decompress_data(blob, compression=DEFAULT_CACHE_COMPRESSION):
+    """Reverse `compress_data`.
+
+    :raises UnknownCacheFormatError: if ``compression`` is unknown
+    :raises ValueError: if the compressed data is invalid
+    """
+    verify_cache_compression(compression)
+    if compression == 'zlib':
+        try:
+            return zlib.decompress(blob)
+        except zlib.error as e:
+            raise ValueError("Invalid compressed data: {0}".
+                             format(to_str(e)))
+    return blob
+
+
+def dump_data(data, cache_format=DEFAULT_CACHE_FORMAT):
+    """Serialize source data in the given cache format.
+
+    If ``cache_format`` is ``'compact'``, but ``data`` is not a rules
+    dict that can be represented in the compact format, pickle is used.
+
+    :rtype: `bytes`
+    :raises UnknownCacheFormatError: if ``cache_format`` is unknown
+    """
+    verify_cache_format(cache_format)
+    if cache_format == 'compact':
+        try:
+            return dump_compact_rules(data)
+        except ValueError:
+            pass
+    return pickle.dumps(data, protocol=2)
+
+
+def load_data(blob):
+    """Deserialize source data, detecting the cache format.
+
+    :raises ValueError: if compact data is invalid
+    """
+    if blob.startswith(COMPACT_MAGIC):
+        return load_compact_rules(blob)
+    return pickle.loads(blob)
+
+
+def cache_format_of(blob):
+    """Return name of the cache format of serialized data."""
+    return 'compact' if blob.startswith(COMPACT_MAGIC) else 'pickle'
+
+
+class _StringTable(object):
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def id(self, string):
+        if not isinstance(string, text_type):
+            raise ValueError("Expected string, got '{0}'.".format(string))
+        result = self.ids.get(string)
+        if result is None:
+            if '\0' in string:
+                raise ValueError("String contains null character.")
+            result = len(self.strings)
+            self.strings.append(string)
+            self.ids[string] = result
+        return result
+
+
+def _encode_value(value, table):
+    if isinstance(value, text_type):
+        return table.id(value)
+    if isinstance(value, list):
+        if all(isinstance(v, text_type) for v in value):
+            # lists of strings (e.g. packages) are by far the most common
+            # values and are stored without indirection
+            return [table.id(v) for v in value]
+        return {'[': [_encode_value(v, table) for v in value]}
+    if isinstance(value, dict):
+        pairs = []
+        for k, v in value.items():
+            pairs.append(table.id(k))
+            pairs.append(_encode_value(v, table))
+        return {'': pairs}
+    if value is None or isinstance(value, (bool, float) + six.integer_types):
+        return {'=': value}
+    raise ValueError("Cannot encode value of type '{0}'.".format(type(value)))
+
+
+def _decode_value(enc, string):
+    if isinstance(enc, list):
+        return list(map(string, enc))
+    if isinstance(enc, six.integer_types):
+        return string(enc)
+    if '' in enc:
+        return _decode_dict(enc[''], string)
+    if '[' in enc:
+        return [_decode_value(e, string) for e in enc['[']]
+    return enc['=']
+
+
+def _decode_dict(pairs, string):
+    result = {}
+    for i in range(0, len(pairs), 2):
+        value = pairs[i + 1]
+        if isinstance(value, list):
+            value = list(map(string, value))
+        else:
+            value = _decode_value(value, string)
+        result[string(pairs[i])] = value
+    return result
+
+
+def _encode_os_dict(os_dict, table):
+    if not isinstance(os_dict, dict):
+        raise ValueError("Expected os dict.")
+    result = []
+    for os_name, version_dict in os_dict.items():
+        if not isinstance(version_dict, dict):
+            raise ValueError("Expected version dict.")
+        version_enc = []
+        for version, installer_dict in version_dict.items():
+            if not isinstance(installer_dict, dict):
+                raise ValueError("Expected installer dict.")
+            installer_enc = []
+            for installer, rule in installer_dict.items():
+                installer_enc.append(table.id(installer))
+                installer_enc.append(_encode_value(rule, table))
+            version_enc.append(table.id(version))
+            version_enc.append(installer_enc)
+        result.append(table.id(os_name))
+        result.append(version_enc)
+    return result
+
+
+def _decode_os_dict(enc, string):
+    os_dict = {}
+    for i in range(0, len(enc), 2):
+        version_enc = enc[i + 1]
+        version_dict = {}
+        for j in range(0, len(version_enc), 2):
+            installer_enc = version_enc[j + 1]
+            installer_dict = {}
+            for k in range(0, len(installer_enc), 2):
+                rule = installer_enc[k + 1]
+                if isinstance(rule, dict) and '' in rule:
+                    rule = _decode_dict(rule[''], string)
+                else:
+                    rule = _decode_value(rule, string)
+                installer_dict[string(installer_enc[k])] = rule
+            version_dict[string(version_enc[j])] = installer_dict
+        os_dict[string(enc[i])] = version_dict
+    return os_dict
+
+
+def _parse_chunk(chunk):
+    if not six.PY2:
+        # python 2 parses byte strings faster than unicode
+        chunk = chunk.decode('ascii')
+    return _json_decoder.raw_decode(chunk)[0]
+
+
+def dump_compact_rules(rules_dict):
+    """Serialize an expanded rules dict in the compact format.
+
+    :rtype: `bytes`
+    :raises ValueError: if ``rules_dict`` cannot be represented in the
+        compact format
+    """
+    if not isinstance(rules_dict, Mapping):
+        raise ValueError("Expected rules dict.")
+    table = _StringTable()
+    chunks = []
+    for xylem_key in sorted(rules_dict.keys()):
+        enc = _encode_os_dict(rules_dict[xylem_key], table)
+        chunk = json.dumps(enc, separators=(',', ':')).encode('ascii')
+        chunks.append((table.id(xylem_key), chunk))
+    parts = [None]
+    string_offset = 0
+    encoded_strings = []
+    for string in table.strings:
+        encoded = string.encode('utf-8')
+        parts.append(_string_offset.pack(string_offset))
+        encoded_strings.append(encoded)
+        string_offset += len(encoded) + 1
+    strings = b'\0'.join(encoded_strings)
+    parts.append(_string_offset.pack(len(strings) + 1))
+    parts[0] = _header.pack(COMPACT_MAGIC, COMPACT_VERSION, len(table.strings),
+                            len(strings), len(chunks))
+    parts.append(strings)
+    offset = 0
+    for key_id, chunk in chunks:
+        parts.append(_key_entry.pack(key_id, offset, len(chunk)))
+        offset += len(chunk)
+    parts.extend(chunk for _, chunk in chunks)
+    return b''.join(parts)
+
+
+def load_compact_rules(buf, offset=0):
+    """Open compact rules data.
+
+    Only the header is read; see `CompactRulesDict`.
+
+    :param buf: `bytes` or buffer like object (e.g. `mmap.mmap`)
+    :param int offset: position of the compact data in ``buf``
+    :rtype: `CompactRulesDict`
+    :raises ValueError: if ``buf`` is not valid compact data
+    """
+    return CompactRulesDict(buf, offset)
+
+
+class CompactRulesDict(Mapping):
+
+    """Read-only rules dict backed by data in the compact format.
+
+    The os dicts are decoded when they are first accessed. Identical
+    strings in the decoded os dicts are shared. The serialized data is
+    referenced, not copied, such that a memory-mapped cache file is
+    shared between processes through the page cache.
+    """
+
+    def __init__(self, buf, offset=0):
+        if len(buf) < offset + _header.size:
+            raise ValueError("Compact rules data is truncated.")
+        magic, version, n_strings, strings_size, n_keys = \
+            _header.unpack_from(buf, offset)
+        if magic != COMPACT_MAGIC:
+            raise ValueError("Data is not in compact rules format.")
+        if version != COMPACT_VERSION:
+            raise ValueError("Unsupported compact rules format version "
+                             "'{0}'.".format(version))
+        self._buf = buf
+        self._n_strings = n_strings
+        self._n_keys = n_keys
+        self._string_offsets = offset + _header.size
+        self._strings_start = \
+            self._string_offsets + (n_strings + 1) * _string_offset.size
+        self._key_table = self._strings_start + strings_size
+        self._chunks_start = self._key_table + n_keys * _key_entry.size
+        if len(buf) < self._chunks_start:
+            raise ValueError("Compact rules data is truncated.")
+        # all strings, once decoded in bulk
+        self._strings = None
+        # individually decoded strings and os dicts
+        self._string_memo = {}
+        self._decoded = {}
+        # map of keys to their index in the key table, once decoded in bulk
+        self._key_index = None
+
+    def _string(self, index):
+        if self._strings is not None:
+            return self._strings[index]
+        result = self._string_memo.get(index)
+        if result is None:
+            if not 0 <= index < self._n_strings:
+                raise ValueError("Invalid string index '{0}'.".format(index))
+            start, end = _string_range.unpack_from(
+                self._buf, self._string_offsets + index * _string_offset.size)
+            result = self._buf[self._strings_start + start:
+                               self._strings_start + end - 1].decode('utf-8')
+            self._string_memo[index] = result
+        return result
+
+    def _all_strings(self):
+        if self._strings is None:
+            if self._n_strings:
+                strings = self._buf[self._strings_start:self._key_table].\
+                    decode('utf-8').split('\0')
+            else:
+                strings = []
+            if len(strings) != self._n_strings:
+                raise ValueError(
+                    "Compact rules data has invalid string table.")
+            self._strings = strings
+        return self._strings
+
+    def _string_accessor(self):
+        if self._strings is not None:
+            return self._strings.__getitem__
+        return self._string
+
+    def _key_entry(self, index):
+        return _key_entry.unpack_from(
+            self._buf, self._key_table + index * _key_entry.size)
+
+    def _find(self, xylem_key):
+        """Return index of key in key table, or ``None``."""
+        if self._key_index is not None:
+            return self._key_index.get(xylem_key)
+        # binary search in sorted key table
+        low, high = 0, self._n_keys
+        while low < high:
+            middle = (low + high) // 2
+            key = self._string(self._key_entry(middle)[0])
+            if key < xylem_key:
+                low = middle + 1
+            elif key > xylem_key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _chunk(self, index):
+        _, start, size = self._key_entry(index)
+        start += self._chunks_start
+        return self._buf[start:start + size]
+
+    def _load_key_index(self):
+        if self._key_index is None:
+            strings = self._all_strings()
+            key_table = struct.unpack_from(
+                str('<{0}I'.format(3 * self._n_keys)),
+                self._buf, self._key_table)
+            self._key_index = dict(
+                (strings[key_table[i * 3]], i) for i in range(self._n_keys))
+        return self._key_index
+
+    def __getitem__(self, xylem_key):
+        os_dict = self._decoded.get(xylem_key)
+        if os_dict is None:
+            index = self._find(xylem_key)
+            if index is None:
+                raise KeyError(xylem_key)
+            os_dict = _decode_os_dict(_parse_chunk(self._chunk(index)),
+                                      self._string_accessor())
+            self._decoded[xylem_key] = os_dict
+        return os_dict
+
+    def __contains__(self, xylem_key):
+        return self._find(xylem_key) is not None
+
+    def __iter__(self):
+        return iter(self._load_key_index())
+
+    def __len__(self):
+        return self._n_keys
+
+    def __reduce__(self):
+        # pickle as plain dict
+        return (dict, (dict(self.items()),))
+
+    def os_key_index(self):
+        """Return index of the keys by os name and version.
+
+        Same result as `xylem.sources.rules_dict.build_os_key_index`,
+        but without decoding the installer rules.
+        """
+        strings = self._all_strings()
+        index = {}
+        for xylem_key, key_index in self._load_key_index().items():
+            enc = _parse_chunk(self._chunk(key_index))
+            for os_id, version_enc in zip(enc[0::2], enc[1::2]):
+                versions = index.setdefault(strings[os_id], {})
+                for version_id in version_enc[0::2]:
+                    versions.setdefault(strings[version_id], []).append(
+                        xylem_key)
+        for versions in index.values():
+            for keys in versions.values():
+                keys.sort()
+        return index
+
+    def keys_for_os(self, os_name, os_version):
+        """Return keys that have rules for given os name and version.
+
+        Equivalent to checking `xylem.sources.rules_dict.has_rule_for_os`
+        for all os dicts, but without decoding the installer rules.
+        """
+        strings = self._all_strings()
+
+        def string_id(string):
+            try:
+                return strings.index(string)
+            except ValueError:
+                return -1
+
+        any_os = string_id('any_os')
+        os_id = string_id(os_name)
+        version_ids = set([string_id(os_version), string_id('any_version')])
+        result = []
+        for xylem_key, index in self._load_key_index().items():
+            enc = _parse_chunk(self._chunk(index))
+            os_ids = enc[0::2]
+            if any_os in os_ids:
+                result.append(xylem_key)
+            elif os_id in os_ids:
+                version_enc = enc[os_ids.index(os_id) * 2 + 1]
+                if version_ids.intersection(version_enc[0::2]):
+                    result.append(xylem_key)
+        return result
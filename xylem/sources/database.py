@@ -16,10 +16,20 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import os
+import sys
+import copy
+import functools
 import hashlib
 import datetime
+import mmap
+import struct
+import time
 
+from multiprocessing.pool import ThreadPool
+
+import six
 import six.moves.cPickle as pickle
+from six.moves import zip
 
 from xylem import __version__
 from xylem.log_utils import error
@@ -29,16 +39,62 @@ from xylem.log_utils import is_verbose
 from xylem.log_utils import debug
 from .impl import get_default_source_descriptions
 from .impl import get_source_descriptions
+from .impl import source_description_spec
+from .cache_format import COMPACT_MAGIC
+from .cache_format import UnknownCacheFormatError
+from .cache_format import DEFAULT_CACHE_COMPRESSION
+from .cache_format import DEFAULT_CACHE_FORMAT
+from .cache_format import compress_data
+from .cache_format import decompress_data
+from .cache_format import dump_data
+from .cache_format import load_compact_rules
+from .cache_format import load_data
 from xylem.text_utils import to_str
+from xylem.text_utils import to_bytes
+from xylem.util import LRUCache
+from xylem.util import atomic_file
+from xylem.load_url import pooled_connections
 from xylem.sources.rules_dict import verify_installer_dict
+from xylem.sources.rules_dict import has_rule_for_os
+from xylem.sources.rules_dict import lookup_os_key_index
+from xylem.sources.rules_dict import lookup_rules
 from xylem.sources.rules_dict import merge_installer_dict
+from xylem.sources.rules_dict import merge_rules
 
 
 # TODO: Docstrings for RulesSource and RulesDatabase
 
 
+DEFAULT_JOBS = 8
+"""Default number of sources loaded concurrently in `RulesDatabase`."""
+
+DEFAULT_LOOKUP_MEMO_SIZE = 10000
+"""Default number of lookup results memoized in `RulesDatabase`."""
+
+INDEX_FILE_NAME = "index.pickle"
+"""File name of the merged lookup index inside the sources cache dir."""
+
+LOCK_FILE_NAME = "update.lock"
+
+CACHE_LOAD_ERRORS = (IOError, OSError, EOFError, ValueError, struct.error,
+                     pickle.UnpicklingError, UnknownCacheFormatError)
+"""Exceptions raised for cache files that are missing or invalid."""
+
+CACHE_FILE_MAGIC = b'XYCACHE\x01'
+"""Start of source cache files.
+
+A source cache file consists of this magic, the size of the pickled
+header, the header (the cache data without the data itself) and the
+serialized, optionally compressed data (see
+`xylem.sources.cache_format`).
+"""
+
+_cache_file_header_size = struct.Struct(str('<I'))
+_CHECKSUM_BLOCK_SIZE = 1 << 20
+
+
 def _id_string(unique_id):
-    return hashlib.sha1(unique_id).hexdigest()
+    return hashlib.sha1(to_bytes(unique_id)).hexdigest()
 
 
 def _cache_file_path(cache_dir, unique_id):
@@ -46,20 +102,37 @@ def _cache_file_path(cache_dir, unique_id):
     return path
 
 
+def _cache_meta_file_path(cache_dir, unique_id):
+    path = os.path.join(cache_dir, _id_string(unique_id) + ".meta")
+    return path
+
+
+def _checksum(blob):
+    return hashlib.sha1(blob).hexdigest()
+
+
 def _create_cache_data(xylem_version,
                        spec_name,
                        spec_version,
                        arguments,
                        origin,
                        data,
-                       time_data_loaded):
+                       time_data_loaded,
+                       cache_format=DEFAULT_CACHE_FORMAT,
+                       compression=DEFAULT_CACHE_COMPRESSION):
+    # the data is stored pre-serialized together with its checksum, such
+    # that integrity of the cache can be checked cheaply on load
+    data_blob = compress_data(dump_data(data, cache_format), compression)
     cache_data = dict(
         xylem_version=xylem_version,
         spec_name=spec_name,
         spec_version=spec_version,
         arguments=arguments,
         origin=origin,
-        data=data,
+        data=data_blob,
+        data_checksum=_checksum(data_blob),
+        cache_format=cache_format,
+        compression=compression,
         time_data_loaded=time_data_loaded
     )
     return cache_data
@@ -84,28 +157,236 @@ def _verify_cache_data_spec_name(cache_data, spec_name):
                          "'{1}'.".format(spec_name, cache_data['spec_name']))
 
 
-def _read_cache(filepath):
+def _is_cache_data_trusted(cache_data, spec):
+    """Check if cached data can be used without verifying it again.
+
+    This is the case if the data was stored with a checksum (which
+    `_read_cache` has validated) by the same version of xylem and the
+    spec plugin, i.e. the data was verified by the same code before it
+    was written.
+    """
+    return ('data_checksum' in cache_data and
+            cache_data['xylem_version'] == __version__ and
+            cache_data['spec_version'] == spec.version)
+
+
+def _read_header(f):
+    """Read the header of a cache file from its start.
+
+    :returns: cache data without the data itself, or ``None`` if the
+        file was written by an older version of xylem without header
+    """
+    if f.read(len(CACHE_FILE_MAGIC)) != CACHE_FILE_MAGIC:
+        return None
+    header_size, = _cache_file_header_size.unpack(
+        f.read(_cache_file_header_size.size))
+    cache_data = pickle.loads(f.read(header_size))
+    cache_data['data'] = None
+    _verify_cache_data_structure(cache_data)
+    return cache_data
+
+
+def _read_cache_header(filepath):
+    with open(filepath, 'rb') as f:
+        return _read_header(f)
+
+
+def _read_cache(filepath, use_mmap=False):
     with open(filepath, 'rb') as f:
-        cache_data = pickle.load(f)
-        _verify_cache_data_structure(cache_data)
-        return cache_data
+        cache_data = _read_header(f)
+        if cache_data is None:
+            # cache file written by older version of xylem
+            f.seek(0)
+            cache_data = pickle.load(f)
+            _verify_cache_data_structure(cache_data)
+            if 'data_checksum' in cache_data:
+                cache_data['data'] = _load_data_blob(
+                    cache_data['data'], cache_data, filepath)
+            return cache_data
+        data_offset = f.tell()
+        if use_mmap and \
+                cache_data.get('compression', 'none') == 'none' and \
+                f.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC:
+            # compact data is queried in place; the mapping stays valid
+            # after the file is closed or replaced
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _verify_data_checksum(buf, data_offset, cache_data, filepath)
+            cache_data['data'] = load_compact_rules(buf, data_offset)
+        else:
+            f.seek(data_offset)
+            cache_data['data'] = _load_data_blob(
+                f.read(), cache_data, filepath)
+    return cache_data
+
+
+def _verify_data_checksum(buf, offset, cache_data, filepath):
+    checksum = hashlib.sha1()
+    # hash in blocks to avoid copying all of a memory-mapped file at once
+    for start in range(offset, len(buf), _CHECKSUM_BLOCK_SIZE):
+        checksum.update(buf[start:start + _CHECKSUM_BLOCK_SIZE])
+    if checksum.hexdigest() != cache_data['data_checksum']:
+        raise ValueError("Checksum mismatch for data in cache file "
+                         "'{0}'.".format(filepath))
+
+
+def _load_data_blob(data_blob, cache_data, filepath):
+    # the checksum is of the stored, i.e. compressed, data
+    _verify_data_checksum(data_blob, 0, cache_data, filepath)
+    return load_data(decompress_data(
+        data_blob, cache_data.get('compression', 'none')))
 
 
 def _write_cache(cache_data, filepath):
-    with open(filepath, 'wb') as f:
+    header = dict(cache_data)
+    data_blob = header.pop('data')
+    header = pickle.dumps(header, protocol=2)
+    with atomic_file(filepath) as f:
+        f.write(CACHE_FILE_MAGIC)
+        f.write(_cache_file_header_size.pack(len(header)))
+        f.write(header)
+        f.write(data_blob)
+
+
+def _write_pickle(data, filepath):
+    with atomic_file(filepath) as f:
         # protocol 2 is compatible with python 2 and 3
-        pickle.dump(cache_data, f, protocol=2)
+        pickle.dump(data, f, protocol=2)
+
+
+def _sources_fingerprint(sources):
+    """Return a value identifying the list of sources and their caches.
+
+    The fingerprint changes if sources are added, removed or reordered,
+    or if the data of any of the caches changes. It uses the data
+    checksums stored in the cache headers, such that caches that are
+    only touched or copied (e.g. from a cache bundle) keep it.
+    """
+    return [(s.spec.name, s.unique_id(), s.cached_data_checksum())
+            for s in sources]
+
+
+def _create_index_data(xylem_version,
+                       os_tuple,
+                       default_installer,
+                       fingerprint,
+                       rules):
+    index_data = dict(
+        xylem_version=xylem_version,
+        os_tuple=os_tuple,
+        default_installer=default_installer,
+        fingerprint=fingerprint,
+        rules=rules
+    )
+    return index_data
+
+
+def _read_index(filepath):
+    with open(filepath, 'rb') as f:
+        index_data = pickle.load(f)
+        if not (isinstance(index_data, dict) and
+                'xylem_version' in index_data and
+                'os_tuple' in index_data and
+                'default_installer' in index_data and
+                'fingerprint' in index_data and
+                isinstance(index_data.get('rules'), dict)):
+            raise ValueError("Index data has invalid structure.")
+        return index_data
+
+
+def _create_cache_meta(validators, keys, os_key_index, data_checksum):
+    # the checksum ties the meta data to the cache data it describes,
+    # since the two files are not replaced together atomically
+    return dict(validators=validators, keys=keys, os_key_index=os_key_index,
+                data_checksum=data_checksum)
+
+
+def _read_cache_meta(filepath):
+    with open(filepath, 'rb') as f:
+        meta = pickle.load(f)
+        if not isinstance(meta, dict):
+            raise ValueError(
+                "Cache meta data has invalid structure: '{0}'".format(meta))
+        return meta
+
+
+def _write_cache_meta(meta, filepath):
+    with atomic_file(filepath) as f:
+        pickle.dump(meta, f, protocol=2)
+
+
+def _load_source_capture_error(source, revalidate=False, incremental=False):
+    """Load ``source`` and return exception info instead of raising.
+
+    Helper for loading sources in worker threads, such that the errors
+    can be re-raised or reported in the main thread. The data is not
+    verified; see `_verify_source_capture_error`.
+
+    :returns: ``None`` on success, else result of `sys.exc_info`
+    """
+    try:
+        source.load_from_source(revalidate=revalidate,
+                                incremental=incremental, verify=False)
+    except Exception:
+        return sys.exc_info()
+    return None
+
+
+def _verify_source_capture_error(source):
+    """Verify data of ``source`` and return exception info on failure.
+
+    :returns: ``None`` on success, else result of `sys.exc_info`
+    """
+    try:
+        source.verify_loaded_data()
+    except Exception:
+        return sys.exc_info()
+    return None
+
+
+def _ordered_parallel_map(func, items, jobs):
+    """Lazily map ``func`` over ``items`` on a bounded thread pool.
+
+    Up to ``jobs`` items are processed concurrently, but the results are
+    yielded in the order of ``items``. If ``jobs`` is smaller than 2,
+    ``items`` are processed sequentially in the calling thread.
+
+    :param int jobs: maximum number of worker threads
+    """
+    jobs = min(jobs or 1, len(items))
+    if jobs < 2:
+        for item in items:
+            yield func(item)
+        return
+    pool = ThreadPool(jobs)
+    try:
+        for result in pool.imap(func, items):
+            yield result
+        pool.close()
+    finally:
+        # stop processing remaining items if the consumer bails out early
+        pool.terminate()
+        pool.join()
 
 
 class RulesSource(object):
 
-    def __init__(self, spec, arguments, origin, sources_context):
+    def __init__(self, spec, arguments, origin, sources_context,
+                 max_age=None):
         self.spec = spec
         self.arguments = arguments
         self.origin = origin
         self.sources_context = sources_context
+        self.max_age = max_age
         self.data = None
         self.time_data_loaded = None
+        self.validators = None
+        self.data_unchanged = False
+        self.cache_fresh = False
+        self.key_manifest = None
+        self.os_key_index = None
+        self._os_key_index_ready = False
+        self._data_from_cache = False
+        self._load_pending = False
 
         self.spec.verify_arguments(self.arguments)
 
@@ -117,21 +398,95 @@ class RulesSource(object):
                                 self.unique_id())
         return path
 
-    def load_from_source(self):
-        data = self.spec.load_data(self.arguments)
-        self.spec.verify_data(data, self.arguments)
+    def cache_meta_file_path(self):
+        path = _cache_meta_file_path(self.sources_context.cache_dir,
+                                     self.unique_id())
+        return path
+
+    def load_from_source(self, revalidate=False, incremental=False,
+                         verify=True):
+        """Load data from the source.
+
+        :param bool revalidate: if ``True`` and the cache is reusable
+            (see :meth:`is_cache_reusable`), the data is only loaded if
+            it changed since it was cached, according to the validators
+            stored alongside the cache; if it did not change,
+            :attr:`data` is not loaded and :attr:`data_unchanged` is set
+            to ``True``
+        :param bool incremental: if ``True`` and the cache is not
+            outdated according to :meth:`is_cache_outdated`, the source
+            is not accessed at all; :attr:`data` is not loaded and both
+            :attr:`data_unchanged` and :attr:`cache_fresh` are set to
+            ``True``
+        :param bool verify: if ``False``, the loaded data is not
+            verified; the caller must call :meth:`verify_loaded_data`
+            before using it
+        """
+        self.cache_fresh = incremental and not self.is_cache_outdated()
+        if self.cache_fresh:
+            self.data_unchanged = True
+            return
+        validators = None
+        if revalidate and self.is_cache_reusable():
+            validators = self.read_cached_validators()
+        data, validators = self.spec.load_data_if_modified(
+            self.arguments, validators)
+        self.data_unchanged = data is None
+        if self.data_unchanged:
+            return
+        if verify:
+            self.spec.verify_data(data, self.arguments)
         self.data = data
+        self.validators = validators
         self.time_data_loaded = datetime.datetime.now()
+        self._reset_os_key_index(from_cache=False)
+
+    def verify_loaded_data(self):
+        """Verify data loaded by :meth:`load_from_source` without verifying.
 
-    def load_from_cache(self):
-        cache_data = _read_cache(self.cache_file_path())
+        Invalid data is discarded.
+
+        :raises ValueError: if the data is invalid
+        """
+        if self.data_unchanged:
+            return
+        try:
+            self.spec.verify_data(self.data, self.arguments)
+        except BaseException:
+            self.data = None
+            raise
+
+    def load_from_cache(self, lazy=False):
+        """Load data from cache.
+
+        :param bool lazy: if ``True``, only check that the cache is
+            available and defer reading it until the data is first
+            needed by :meth:`lookup` or :meth:`keys`; lookups of keys
+            that are not in the key manifest stored alongside the cache
+            do not read the cache at all
+        :raises IOError: if the cache is not available
+        """
+        if lazy:
+            if not self.is_cache_available():
+                raise IOError("Cache file '{0}' does not exist.".
+                              format(self.cache_file_path()))
+            self.data = None
+            self.key_manifest = None
+            self._load_pending = True
+            self._reset_os_key_index(from_cache=True)
+            return
+        self._load_pending = False
+        cache_data = _read_cache(self.cache_file_path(), use_mmap=True)
         _verify_cache_data_spec_name(cache_data, self.spec.name)
         self.spec.verify_arguments(self.arguments)
-        self.spec.verify_data(cache_data['data'], self.arguments)
+        if self.sources_context.paranoid or \
+                not _is_cache_data_trusted(cache_data, self.spec):
+            self.spec.verify_data(cache_data['data'], self.arguments)
         self.arguments = cache_data['arguments']
         self.origin = cache_data['origin']
         self.data = cache_data['data']
         self.time_data_loaded = cache_data['time_data_loaded']
+        self._reset_os_key_index(from_cache=True)
 
     def save_to_cache(self):
         cache_data = _create_cache_data(
@@ -141,18 +496,181 @@ class RulesSource(object):
             self.arguments,
             self.origin,
             self.data,
-            self.time_data_loaded)
+            self.time_data_loaded,
+            self.sources_context.cache_format,
+            self.sources_context.cache_compression)
         cache_path = self.cache_file_path()
         _write_cache(cache_data, cache_path)
+        # write meta data second, such that the validators never belong
+        # to newer data than what is in the cache
+        keys = self.spec.defined_keys(self.data)
+        if keys is not None:
+            keys = sorted(keys)
+        self.os_key_index = self.spec.os_key_index(self.data)
+        self._os_key_index_ready = True
+        _write_cache_meta(
+            _create_cache_meta(self.validators, keys, self.os_key_index,
+                               cache_data['data_checksum']),
+            self.cache_meta_file_path())
 
-    def is_cache_outdated(self):
+    def is_cache_reusable(self):
+        """Check if the cache can be kept as is if the data is unchanged.
+
+        This is the case if the cache was written by the same version of
+        xylem and the spec (as for `_is_cache_data_trusted`), and in the
+        configured cache format and compression. Other caches need to be
+        rewritten, so the data is loaded again even if it is unchanged.
+        """
+        return self._read_reusable_cache_header() is not None
+
+    def _read_reusable_cache_header(self):
+        """Return the cache header if the cache is reusable, else ``None``.
+
+        See :meth:`is_cache_reusable`. Only the header of the cache file
+        is read, not the data.
+        """
         if not self.is_cache_available():
+            return None
+        path = self.cache_file_path()
+        try:
+            header = _read_cache_header(path)
+        except CACHE_LOAD_ERRORS as e:
+            debug("Failed to read cache file '{0}':\n{1}".
+                  format(path, to_str(e)))
+            return None
+        if header is not None and \
+                header['spec_name'] == self.spec.name and \
+                _is_cache_data_trusted(header, self.spec) and \
+                header.get('cache_format') == \
+                self.sources_context.cache_format and \
+                header.get('compression') == \
+                self.sources_context.cache_compression:
+            return header
+        return None
+
+    def cached_data_checksum(self):
+        """Return checksum of the cached data, or ``None``.
+
+        ``None`` is returned if the cache is unavailable or has no
+        checksum. Reads only the header of the cache file.
+        """
+        try:
+            header = _read_cache_header(self.cache_file_path())
+        except CACHE_LOAD_ERRORS:
+            return None
+        return header.get('data_checksum') if header is not None else None
+
+    def read_cached_meta(self, name, bound=False):
+        """Return entry of meta data stored alongside cache, or ``None``.
+
+        :param bool bound: if ``True``, the entry is only returned if the
+            meta data has the same data checksum as the cache file, i.e.
+            it describes the data that is currently cached; entries
+            derived from the data, like the key manifest, are wrong for
+            other data
+        """
+        path = self.cache_meta_file_path()
+        if not os.path.isfile(path):
+            return None
+        try:
+            meta = _read_cache_meta(path)
+            if bound:
+                header = _read_cache_header(self.cache_file_path())
+                if header is None or 'data_checksum' not in meta or \
+                        meta['data_checksum'] != header.get('data_checksum'):
+                    debug("Cache meta data '{0}' does not belong to the "
+                          "cached data.".format(path))
+                    return None
+        except CACHE_LOAD_ERRORS as e:
+            debug("Failed to read cache meta data '{0}':\n{1}".
+                  format(path, to_str(e)))
+            return None
+        return meta.get(name)
+
+    def read_cached_validators(self):
+        """Return validators stored alongside the cache, or ``None``."""
+        return self.read_cached_meta('validators')
+
+    def may_define_key(self, xylem_key):
+        """Check the key manifest if this source might define a key.
+
+        Only meaningful while loading of the data is pending (see
+        :meth:`load_from_cache`).
+
+        :returns: ``False`` if the key manifest stored alongside the
+            cache proves that ``xylem_key`` is not defined
+        """
+        if self.key_manifest is None:
+            keys = self.read_cached_meta('keys', bound=True)
+            if keys is None:
+                return True
+            self.key_manifest = frozenset(keys)
+        return xylem_key in self.key_manifest
+
+    def _ensure_data_loaded(self):
+        if self._load_pending:
+            self.load_from_cache()
+
+    def _reset_os_key_index(self, from_cache):
+        self.os_key_index = None
+        self._os_key_index_ready = False
+        self._data_from_cache = from_cache
+
+    def _ensure_os_key_index(self):
+        """Return index of the keys by os and version, or ``None``.
+
+        The index stored alongside the cache is used if the data is from
+        the cache and the index belongs to the cached data (see
+        :meth:`read_cached_meta`); otherwise it is built from the data
+        once, such that further queries for any os do not scan the data
+        again.
+        """
+        if not self._os_key_index_ready:
+            index = None
+            if self._data_from_cache:
+                index = self.read_cached_meta('os_key_index', bound=True)
+            if index is None:
+                self._ensure_data_loaded()
+                index = self.spec.os_key_index(self.data)
+            self.os_key_index = index
+            self._os_key_index_ready = True
+        return self.os_key_index
+
+    def touch_cache(self):
+        """Mark cached data as up to date without rewriting it."""
+        os.utime(self.cache_file_path(), None)
+
+    def is_cache_outdated(self):
+        """Check if the cached data needs to be updated.
+
+        If the source has a :attr:`max_age`, the cache is outdated once
+        it was last updated (or found unchanged) more than that many
+        seconds ago. Otherwise the spec plugin decides with
+        ``is_data_outdated_without_data``, or if that is not supported,
+        with ``is_data_outdated``. Only in the latter case is the cached
+        data read; otherwise just the header of the cache file. Caches
+        that cannot be reused as they are (see
+        :meth:`is_cache_reusable`) are always outdated.
+        """
+        header = self._read_reusable_cache_header()
+        if header is None:
             return True
-        cache_data = _read_cache(self.cache_file_path())
-        # here we could also check xylem version if needed in the future
-        if self.spec.name != cache_data('spec_name'):
+        path = self.cache_file_path()
+        if self.max_age is not None:
+            return time.time() - os.path.getmtime(path) > self.max_age
+        outdated = self.spec.is_data_outdated_without_data(
+            self.arguments, header['time_data_loaded'])
+        if outdated is not None:
+            return outdated
+        try:
+            cache_data = _read_cache(path, use_mmap=True)
+        except CACHE_LOAD_ERRORS as e:
+            debug("Failed to read cache file '{0}':\n{1}".
+                  format(path, to_str(e)))
             return True
-        return self.spec.is_data_outdated(cache_data['data'], self.arguments)
+        return self.spec.is_data_outdated(
+            cache_data['data'], self.arguments,
+            cache_data['time_data_loaded'])
 
     def is_cache_available(self):
         path = self.cache_file_path()
@@ -165,40 +683,114 @@ class RulesSource(object):
 
         :raises OSError: if cache file cannot be removed
         """
-        path = self.cache_file_path(self.sources_context)
-        if os.path.exists(path):
-            if is_verbose():
-                info("Removing cache file '%s'.", path)
-            os.remove(path)
-        else:
-            if is_verbose():
-                info("Cache file '%s' already clear.", path)
+        for path in [self.cache_file_path(), self.cache_meta_file_path()]:
+            if os.path.exists(path):
+                if is_verbose():
+                    info("Removing cache file '{0}'.".format(path))
+                os.remove(path)
+            else:
+                if is_verbose():
+                    info("Cache file '{0}' already clear.".format(path))
 
     def lookup(self, xylem_key, installer_context):
+        if self._load_pending and not self.may_define_key(xylem_key):
+            return {}
+        self._ensure_data_loaded()
         installer_dict = self.spec.lookup(
             self.data, xylem_key, installer_context)
         verify_installer_dict(installer_dict, allow_default_installer=False)
         return installer_dict
 
+    def lookup_many(self, xylem_keys, installer_context):
+        """Lookup rules for many xylem keys at once.
+
+        Like :meth:`lookup`, but the spec plugin looks up all keys in
+        one call. Keys that the key manifest proves not to be defined
+        are not passed on, and if no key remains, the cache is not read.
+
+        :returns: dict mapping xylem keys to installer dicts; keys
+            without rules in this source may be missing
+        """
+        if self._load_pending:
+            xylem_keys = [k for k in xylem_keys if self.may_define_key(k)]
+            if not xylem_keys:
+                return {}
+        self._ensure_data_loaded()
+        result = self.spec.lookup_many(
+            self.data, xylem_keys, installer_context)
+        for installer_dict in result.values():
+            verify_installer_dict(installer_dict,
+                                  allow_default_installer=False)
+        return result
+
     def keys(self, installer_context):
-        """Return list of keys defined for current os/version."""
+        """Return list of keys defined for current os/version.
+
+        If the spec provides an index of the keys by os (see
+        :meth:`xylem.specs.impl.Spec.os_key_index`), the data is not
+        scanned, and if the index is stored alongside the cache, not
+        even loaded.
+        """
+        index = self._ensure_os_key_index()
+        if index is not None:
+            os_name, os_version = installer_context.get_os_tuple()
+            return list(lookup_os_key_index(index, os_name, os_version))
+        self._ensure_data_loaded()
         return self.spec.keys(self.data, installer_context)
 
+    def rules_dict(self):
+        """Return the data as expanded rules dict.
+
+        :raises ValueError: if the spec cannot represent its data as
+            rules dict
+        """
+        self._ensure_data_loaded()
+        rules = self.spec.rules_dict(self.data)
+        if rules is None:
+            raise ValueError("Spec '{0}' of source '{1}' does not support "
+                             "conversion to rules dict.".
+                             format(self.spec.name, self.unique_id()))
+        return rules
+
+
+def create_rules_database(sources_context):
+    """Create rules database for the backend configured in the context.
+
+    :param SourcesContext sources_context: sources context; its
+        ``database_backend`` selects `RulesDatabase` (``'cache'``) or
+        `xylem.sources.sqlite_database.SQLiteRulesDatabase`
+        (``'sqlite'``)
+    """
+    if sources_context.database_backend == 'sqlite':
+        # import here to avoid circular import
+        from .sqlite_database import SQLiteRulesDatabase
+        return SQLiteRulesDatabase(sources_context)
+    return RulesDatabase(sources_context)
+
 
 class RulesDatabase(object):
 
+    uses_lookup_index = True
+    """Indicates if `save_index` builds a lookup index."""
+
     def __init__(self, sources_context):
         self.sources_context = sources_context
         self.sources = None  # Note: assuming those have unique ids
+        self.generation = 0
+        self.lookup_memo = LRUCache(DEFAULT_LOOKUP_MEMO_SIZE)
+        self._merged = None
         self.init_from_sources()
         self.print_info = False
         self.raise_on_error = True
+        self.jobs = DEFAULT_JOBS
+        self.index = None
 
     def init_from_sources(self):
         debug("initializing database with sources dir `{}` and cache dir `{}`".
               format(self.sources_context.sources_dir,
                      self.sources_context.cache_dir))
         self.sources = []
+        self.invalidate()
         sources_dir = self.sources_context.sources_dir
         sources_gen = get_source_descriptions(sources_dir)
         if sources_gen is None:
@@ -210,15 +802,26 @@ class RulesDatabase(object):
             sources_gen = get_default_source_descriptions()
         for source_file, source_descriptions in sources_gen:
             for descr in source_descriptions:
-                spec_name, arguments = descr.items()[0]
+                spec_name, arguments = source_description_spec(descr)
                 spec = self.sources_context.get_spec(spec_name)
                 self.sources.append(RulesSource(
                     spec,
                     arguments,
                     source_file,
-                    self.sources_context))
+                    self.sources_context,
+                    max_age=descr.get('max_age')))
         self.verify_unique_ids()
 
+    def invalidate(self):
+        """Discard the merged rules and memoized lookups.
+
+        Called whenever the sources are initialized, loaded or updated,
+        which starts a new :attr:`generation` of the data.
+        """
+        self._merged = None
+        self.generation += 1
+        self.lookup_memo.clear()
+
     def verify_unique_ids(self):
         ids = [_id_string(s.unique_id()) for s in self.sources]
         if not len(ids) == len(set(ids)):
@@ -226,10 +829,34 @@ class RulesDatabase(object):
             raise RuntimeError(
                 "Source ids in rules database are not unique: {0}".format(ids))
 
-    def load_from_cache(self):
+    def index_file_path(self):
+        return os.path.join(self.sources_context.cache_dir, INDEX_FILE_NAME)
+
+    def lock_file_path(self):
+        """Return path of the advisory lock file held during updates."""
+        return os.path.join(self.sources_context.cache_dir, LOCK_FILE_NAME)
+
+    def load_from_cache(self, installer_context=None, lazy=False):
+        """Load all sources from cache.
+
+        If ``installer_context`` is passed and a valid lookup index for
+        its os and default installer exists, only the index is loaded
+        instead. `lookup` and `keys` for that installer context are then
+        answered from the index. See :meth:`load_index`. The sources are
+        then loaded lazily, such that queries for other installer
+        contexts read only the caches they need.
+
+        :param bool lazy: if ``True``, sources read their cache only
+            once their data is needed; see
+            :meth:`RulesSource.load_from_cache`
+        """
+        self.invalidate()
+        if installer_context is not None and \
+                self.load_index(installer_context):
+            lazy = True
         for source in self.sources:
             try:
-                source.load_from_cache()
+                source.load_from_cache(lazy=lazy)
             except Exception as e:
                 # TODO: be more specific about which exceptions to catch here
                 if self.raise_on_error:
@@ -250,9 +877,34 @@ class RulesDatabase(object):
                     error("Failed to save source '{0}' to cache:\n{1}".
                           format(source.unique_id(), e))
 
-    def load_from_source(self):
+    def _load_from_source_ordered(self, revalidate=False, incremental=False):
+        """Load all sources concurrently and yield them in order.
+
+        Sources are loaded on a pool of up to :attr:`jobs` worker
+        threads. Once all are loaded and the threads have finished,
+        their data is verified in this thread, since verification may
+        fork worker processes (see
+        `xylem.sources.rules_dict.parallel_verification`), which is not
+        safe while other threads are running. Progress info is printed
+        (if :attr:`print_info` is set) as the sources are yielded, such
+        that console output has the same order as the list of sources.
+
+        :param bool revalidate: passed on to
+            :meth:`RulesSource.load_from_source`
+        :param bool incremental: passed on to
+            :meth:`RulesSource.load_from_source`
+        :returns: generator of ``(source, exc_info)`` tuples, where
+            ``exc_info`` is ``None`` if loading was successful
+        """
         origins = set()
-        for source in self.sources:
+        results = list(_ordered_parallel_map(
+            functools.partial(_load_source_capture_error,
+                              revalidate=revalidate,
+                              incremental=incremental),
+            self.sources, self.jobs))
+        for source, exc_info in zip(self.sources, results):
+            if exc_info is None:
+                exc_info = _verify_source_capture_error(source)
             if source.origin not in origins:
                 origins.add(source.origin)
                 if self.print_info:
@@ -260,42 +912,74 @@ class RulesDatabase(object):
             if self.print_info:
                 info("Loading: {0} : {1}".
                      format(source.spec.name, source.arguments))
-            try:
-                source.load_from_source()
-            except Exception as e:
-                # TODO: be more specific about which exceptions to catch here
-                if self.raise_on_error:
-                    raise
-                else:
-                    error("Failed to load source '{0}':\n{1}".
-                          format(source.unique_id(), e))
+            yield source, exc_info
 
-    def update(self):
+    def _handle_load_error(self, source, exc_info):
+        if self.raise_on_error:
+            six.reraise(*exc_info)
+        else:
+            error("Failed to load source '{0}':\n{1}".
+                  format(source.unique_id(), exc_info[1]))
+
+    def load_from_source(self):
+        self.invalidate()
+        for source, exc_info in self._load_from_source_ordered():
+            if exc_info is not None:
+                self._handle_load_error(source, exc_info)
+
+    def update(self, incremental=False):
+        """Update the cache of all sources.
+
+        :param bool incremental: if ``True``, skip sources whose cache
+            is not outdated; see :meth:`RulesSource.is_cache_outdated`
+        """
         # TODO: save exceptions if they are not raised and then for the
         # cli command recognize permission errors and suggest to use
         # 'sudo'
 
         # We don't just call `load_from_source` and `save_to_cache` here
         # since we want errors with saving for each source to happen
-        # directly after loading, not at the end.
-        origins = set()
-        for source in self.sources:
-            if source.origin not in origins:
-                origins.add(source.origin)
-                if self.print_info:
-                    info("Processing '{0}'...".format(source.origin))
-            if self.print_info:
-                info("Loading: {0} : {1}".
-                     format(source.spec.name, source.arguments))
-            try:
-                source.load_from_source()
-            except Exception as e:
-                # TODO: be more specific about which exceptions to catch here
-                if self.raise_on_error:
-                    raise
-                else:
-                    error("Failed to load source '{0}':\n{1}".
-                          format(source.unique_id(), e))
+        # directly after loading, not at the end. Loading (download,
+        # parsing, expansion and verification) happens concurrently,
+        # whereas saving happens in order in this thread. Sources that
+        # are unchanged since they were cached are not saved again. HTTP
+        # connections are reused, since sources are mostly on the same few
+        # hosts.
+        self.invalidate()
+        with pooled_connections():
+            self._update_sources(incremental)
+
+    def _update_sources(self, incremental):
+        for source, exc_info in self._load_from_source_ordered(
+                revalidate=True, incremental=incremental):
+            if exc_info is not None:
+                self._handle_load_error(source, exc_info)
+            elif source.cache_fresh:
+                # don't touch the cache, which would extend its max age
+                if self.print_info and is_verbose():
+                    info("Up to date: {0}".format(source.arguments))
+                try:
+                    # the data is not loaded; read it from cache on demand
+                    source.load_from_cache(lazy=True)
+                except CACHE_LOAD_ERRORS as e:
+                    if self.raise_on_error:
+                        raise
+                    else:
+                        error("Failed to load source '{0}' from cache:\n{1}".
+                              format(source.unique_id(), to_str(e)))
+            elif source.data_unchanged:
+                if self.print_info and is_verbose():
+                    info("Unchanged: {0}".format(source.arguments))
+                try:
+                    source.touch_cache()
+                    # the data is not loaded; read it from cache on demand
+                    source.load_from_cache(lazy=True)
+                except (IOError, OSError) as e:
+                    if self.raise_on_error:
+                        raise
+                    else:
+                        error("Failed to touch cache of source '{0}':\n{1}".
+                              format(source.unique_id(), to_str(e)))
             else:
                 try:
                     source.save_to_cache()
@@ -307,8 +991,155 @@ class RulesDatabase(object):
                         error("Failed to save source '{0}' to cache:\n{1}".
                               format(source.unique_id(), to_str(e)))
 
+    def save_index(self, installer_context):
+        """Build and save the merged lookup index for the current os.
+
+        The index maps all xylem keys defined for the os of
+        ``installer_context`` to their merged installer dicts (see
+        :meth:`lookup`). Sources are loaded from cache if they are not
+        already loaded. If any of the sources is unavailable, no index
+        is saved.
+
+        :returns: ``True`` if the index was saved
+        """
+        for source in self.sources:
+            if source.data is None:
+                try:
+                    source.load_from_cache()
+                except CACHE_LOAD_ERRORS as e:
+                    debug("Not saving lookup index; failed to load source "
+                          "'{0}' from cache:\n{1}".
+                          format(source.unique_id(), to_str(e)))
+                    return False
+        self.index = None
+        rules = {}
+        for xylem_key in self.keys(installer_context):
+            rules[xylem_key] = self.lookup(xylem_key, installer_context)
+        index_data = _create_index_data(
+            __version__,
+            tuple(installer_context.get_os_tuple()),
+            installer_context.get_default_installer_name(),
+            _sources_fingerprint(self.sources),
+            rules)
+        _write_pickle(index_data, self.index_file_path())
+        return True
+
+    def load_index(self, installer_context):
+        """Load the merged lookup index if it is still valid.
+
+        The index is valid if it was built for the same os and default
+        installer as in ``installer_context``, the list of sources has
+        not changed, and none of the source caches have been rewritten
+        since.
+
+        :returns: ``True`` if the index was loaded
+        """
+        self.index = None
+        path = self.index_file_path()
+        if not os.path.isfile(path):
+            return False
+        try:
+            index_data = _read_index(path)
+        except CACHE_LOAD_ERRORS as e:
+            debug("Failed to read lookup index '{0}':\n{1}".
+                  format(path, to_str(e)))
+            return False
+        if index_data['xylem_version'] != __version__ or \
+                not self._index_matches(index_data, installer_context) or \
+                index_data['fingerprint'] != _sources_fingerprint(
+                    self.sources):
+            debug("Lookup index '{0}' is outdated.".format(path))
+            return False
+        self.index = index_data
+        return True
+
+    def _index_matches(self, index_data, installer_context):
+        return (index_data is not None and
+                index_data['os_tuple'] ==
+                tuple(installer_context.get_os_tuple()) and
+                index_data['default_installer'] ==
+                installer_context.get_default_installer_name())
+
+    def merged_rules(self, default_installers):
+        """Return the effective rules of all sources as one rules dict.
+
+        The rules dicts of all sources (see :meth:`RulesSource.rules_dict`)
+        are merged with `merge_rules` in order of priority, loading
+        sources from cache if needed. The result is cached until the
+        sources are loaded or updated again, and `lookup` and `keys` are
+        answered from it for installer contexts whose os and default
+        installer are in ``default_installers``. It shares structure
+        with the data of the sources and must not be modified. It can
+        be dumped like any rules dict, e.g. with
+        `xylem.yaml_utils.dump_yaml`.
+
+        :param dict default_installers: dict mapping os names to default
+            installer names; only these os's are contained in the result
+        :returns: merged rules dict
+        :raises ValueError: if the data of a source cannot be
+            represented as rules dict
+        """
+        if self._merged is not None and \
+                self._merged[0] == default_installers:
+            return self._merged[1]
+        rules_dict_list = [s.rules_dict() for s in self.sources]
+        merged = merge_rules(rules_dict_list, default_installers)
+        self._merged = (dict(default_installers), merged)
+        return merged
+
+    def prepare_bulk_lookup(self, installer_context):
+        """Prepare for calling `lookup` for many keys.
+
+        Unless the lookup index is loaded, all sources are merged once
+        for the os of ``installer_context`` (see :meth:`merged_rules`),
+        instead of merging the rules of each source for every key.
+        """
+        if self._index_matches(self.index, installer_context):
+            return
+        os_name = installer_context.get_os_tuple()[0]
+        self.merged_rules(
+            {os_name: installer_context.get_default_installer_name()})
+
+    def _matching_merged_rules(self, installer_context):
+        """Return the cached merged rules if valid for installer context."""
+        if self._merged is None:
+            return None
+        default_installers, merged = self._merged
+        os_name = installer_context.get_os_tuple()[0]
+        if os_name not in default_installers or \
+                default_installers[os_name] != \
+                installer_context.get_default_installer_name():
+            return None
+        return merged
+
     def lookup(self, xylem_key, installer_context):
-        """Return rules for xylem key in current os."""
+        """Return rules for xylem key in current os.
+
+        Results are memoized in :attr:`lookup_memo` by key, os, default
+        installer and :attr:`generation`, such that looking up the same
+        key again does not merge the rules of the sources again. The
+        returned installer dict is a deep copy of the memoized one, such
+        that callers may modify it.
+        """
+        memo_key = (xylem_key,) + self._memo_context(installer_context)
+        installer_dict = self.lookup_memo.get(memo_key)
+        if installer_dict is None:
+            installer_dict = self._lookup(xylem_key, installer_context)
+            self.lookup_memo.put(memo_key, installer_dict)
+        return copy.deepcopy(installer_dict)
+
+    def _memo_context(self, installer_context):
+        return (tuple(installer_context.get_os_tuple()),
+                installer_context.get_default_installer_name(),
+                self.generation)
+
+    def _lookup(self, xylem_key, installer_context):
+        if self._index_matches(self.index, installer_context):
+            return dict(self.index['rules'].get(xylem_key, {}))
+        merged = self._matching_merged_rules(installer_context)
+        if merged is not None:
+            os_name, os_version = installer_context.get_os_tuple()
+            return lookup_rules(merged, xylem_key, os_name, os_version, None)
         installer_dict = {}
         # TODO: merge the other way round
         # TODO: catch errors down the line and wrap in meaningful LookupError
@@ -317,9 +1148,72 @@ class RulesDatabase(object):
             merge_installer_dict(new_rules, installer_dict, None)
         return installer_dict
 
+    def lookup_many(self, xylem_keys, installer_context):
+        """Return dict mapping each of ``xylem_keys`` to its rules.
+
+        Same as calling :meth:`lookup` for every key, but the os and
+        default installer are determined once, and each source is
+        queried for all keys that are not memoized at once (see
+        :meth:`RulesSource.lookup_many`), merging the results key by key
+        in order of priority.
+        """
+        memo_context = self._memo_context(installer_context)
+        result = {}
+        missing = []
+        for key in xylem_keys:
+            installer_dict = self.lookup_memo.get((key,) + memo_context)
+            if installer_dict is None:
+                missing.append(key)
+            else:
+                result[key] = copy.deepcopy(installer_dict)
+        if missing:
+            for key, installer_dict in self._lookup_many(
+                    missing, installer_context).items():
+                self.lookup_memo.put((key,) + memo_context, installer_dict)
+                result[key] = copy.deepcopy(installer_dict)
+        return result
+
+    def _lookup_many(self, xylem_keys, installer_context):
+        if self._index_matches(self.index, installer_context):
+            rules = self.index['rules']
+            return dict((key, dict(rules.get(key, {})))
+                        for key in xylem_keys)
+        merged = self._matching_merged_rules(installer_context)
+        if merged is not None:
+            os_name, os_version = installer_context.get_os_tuple()
+            return dict((key, lookup_rules(
+                merged, key, os_name, os_version, None))
+                for key in xylem_keys)
+        result = dict((key, {}) for key in xylem_keys)
+        for source in reversed(self.sources):
+            for key, new_rules in source.lookup_many(
+                    xylem_keys, installer_context).items():
+                merge_installer_dict(new_rules, result[key], None)
+        return result
+
     def keys(self, installer_context):
         """Return list of keys defined for current os/version."""
+        if self._index_matches(self.index, installer_context):
+            return list(self.index['rules'].keys())
+        merged = self._matching_merged_rules(installer_context)
+        if merged is not None:
+            os_name, os_version = installer_context.get_os_tuple()
+            return [k for k, os_dict in merged.items()
+                    if has_rule_for_os(os_dict, os_name, os_version)]
         keys = set()
         for source in self.sources:
-            keys.update(set(source.keys(installer_context)))
+            keys.update(source.keys(installer_context))
         return list(keys)
+
+    def keys_for_package(self, package, installer_name, installer_context):
+        """Return keys that resolve to ``package`` for an installer.
+
+        :param str package: package name
+        :param str installer_name: name of installer the package is for
+        :returns: sorted list of xylem keys whose rules (see
+            :meth:`lookup`) for ``installer_name`` contain ``package``
+        """
+        return sorted(
+            k for k in self.keys(installer_context) if package in self.lookup(
+                k, installer_context).get(installer_name, {}).
+            get('packages', []))
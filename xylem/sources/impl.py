@@ -32,6 +32,10 @@ from xylem.text_utils import type_name
 from xylem.specs import verify_spec_name
 from xylem.specs import load_spec_plugins
 from xylem.exception import XylemError
+from .cache_format import DEFAULT_CACHE_COMPRESSION
+from .cache_format import DEFAULT_CACHE_FORMAT
+from .cache_format import verify_cache_compression
+from .cache_format import verify_cache_format
 
 
 SOURCES_CACHE_PATH = "sources"
@@ -161,24 +165,50 @@ def verify_source_description_list(descr_list):
                    "source descriptions", e)
 
 
+SOURCE_DESCRIPTION_OPTIONS = ['max_age']
+"""Optional entries of source descriptions besides the spec entry.
+
+``max_age`` is the number of seconds for which the cache of the source
+is considered up to date after it was last updated; see
+`xylem.sources.database.RulesSource.is_cache_outdated`.
+"""
+
+
 def verify_source_description(descr):
     """Verify that a source description has valid structure.
 
+    A source description has one entry mapping spec name to spec
+    arguments, and optionally any of `SOURCE_DESCRIPTION_OPTIONS`.
+
     :param dict descr_list: source description
     :raises ValueError: if structure of source description is invalid
     """
     if not isinstance(descr, dict):
         raise ValueError("Expected source description to be a dictionary, but "
                          "got '{0}'.".format(to_str(type(descr))))
-    keys = descr.keys()
+    keys = [k for k in descr.keys() if k not in SOURCE_DESCRIPTION_OPTIONS]
     if not len(keys) == 1:
-        raise ValueError("Expected source description to have one entry, but "
-                         "got keys '{0}'.".format(keys))
+        raise ValueError("Expected source description to have one spec "
+                         "entry, but got keys '{0}'.".format(keys))
     try:
         verify_spec_name(keys[0])
     except ValueError as e:
         raise_from(ValueError, "source description does not have valid "
-                   "spec name '{0}'".format(keys[0], e))
+                   "spec name '{0}'".format(keys[0]), e)
+    max_age = descr.get('max_age')
+    if max_age is not None and (isinstance(max_age, bool) or
+                                not isinstance(max_age, (int, float)) or
+                                max_age < 0):
+        raise ValueError("Expected 'max_age' of source description to be a "
+                         "non-negative number of seconds, but got '{0}'.".
+                         format(max_age))
+
+
+def source_description_spec(descr):
+    """Return tuple of spec name and arguments of a source description."""
+    for key, value in descr.items():
+        if key not in SOURCE_DESCRIPTION_OPTIONS:
+            return key, value
 
 
 def sources_cache_dir(cache_dir):
@@ -194,6 +224,15 @@ class UnknownSpecError(XylemError):
     pass
 
 
+DATABASE_BACKENDS = ['cache', 'sqlite']
+"""Names of supported rules database backends."""
+
+
+class UnknownDatabaseBackendError(XylemError):
+
+    """Raised for unknown rules database backend names."""
+
+
 # TODO: Should plugins be registered globally (singleton) instead of
 # these context objects? How are they supposed to register with the
 # argument parser. Maybe extra kind of plugin for augmenting the
@@ -209,6 +248,17 @@ class SourcesContext(object):
         if config is None:
             config = get_config()
         self.setup_paths(config)
+        self.paranoid = config.paranoid
+        self.cache_format = config.cache_format or DEFAULT_CACHE_FORMAT
+        verify_cache_format(self.cache_format)
+        self.cache_compression = config.cache_compression or \
+            DEFAULT_CACHE_COMPRESSION
+        verify_cache_compression(self.cache_compression)
+        self.database_backend = config.database_backend or 'cache'
+        if self.database_backend not in DATABASE_BACKENDS:
+            raise UnknownDatabaseBackendError(
+                "Unknown rules database backend '{0}'; expected one of {1}.".
+                format(self.database_backend, to_str(DATABASE_BACKENDS)))
         self.spec_plugins = spec_plugins or load_spec_plugins(
             config.disabled_plugins.spec)
 
@@ -22,13 +22,20 @@
 
 from __future__ import unicode_literals
 
+import multiprocessing
+import os
 import re
-import six
+import threading
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
-from xylem.exception import raise_from
 from xylem.exception import type_error_msg
 
 from xylem.text_utils import text_type
+from xylem.text_utils import to_str
 
 
 def lookup_rules(rules_dict,
@@ -81,30 +88,261 @@ def has_rule_for_os(os_dict, os_name, os_version):
         return os_version in version_dict or 'any_version' in version_dict
 
 
+def build_os_key_index(rules_dict):
+    """Return index of the xylem keys of a rules dict by os and version.
+
+    With the index, the keys that have rules for an os name and version
+    can be found with `lookup_os_key_index` without scanning the whole
+    rules dict.
+
+    :param dict rules_dict: expanded rules dict
+    :returns: dict mapping os names (including 'any_os') to dicts
+        mapping os versions (including 'any_version') to sorted lists
+        of the xylem keys with rules for them
+    """
+    index = {}
+    for xylem_key, os_dict in rules_dict.items():
+        for os_name, version_dict in os_dict.items():
+            versions = index.setdefault(os_name, {})
+            for os_version in version_dict:
+                versions.setdefault(os_version, []).append(xylem_key)
+    for versions in index.values():
+        for keys in versions.values():
+            keys.sort()
+    return index
+
+
+def lookup_os_key_index(os_key_index, os_name, os_version):
+    """Return keys with rules for os name/version according to index.
+
+    Equivalent to checking `has_rule_for_os` for all entries of the
+    indexed rules dict.
+
+    :param dict os_key_index: index as returned by `build_os_key_index`
+    :rtype: `set`
+    """
+    keys = set()
+    for version_keys in os_key_index.get('any_os', {}).values():
+        keys.update(version_keys)
+    versions = os_key_index.get(os_name, {})
+    keys.update(versions.get('any_version', ()))
+    keys.update(versions.get(os_version, ()))
+    return keys
+
+
 def verify_rules_dict(rules_dict, allow_default_installer=True):
     """Verify that an expanded rules dict has valid structure.
 
-    :param dict rules_dict: dictionary mapping xylem keys to os dicts
+    All entries are checked, and all violations are reported at once;
+    see `rules_dict_errors`. Inside the `parallel_verification`
+    context, large rules dicts are verified on a pool of worker
+    processes.
+
+    :param dict rules_dict: dictionary mapping xylem keys to os dicts;
+        read-only mappings such as
+        `xylem.sources.cache_format.CompactRulesDict` are accepted
     :param bool allow_default_installer: indicates if
         'default_installer' installer name is allowed
     :raises ValueError: if rules dict does not have valid structure
     """
-    if not isinstance(rules_dict, dict):
-        raise ValueError("Expected rules dict of type 'dict', but got '{0}'.".
-                         format(type(rules_dict)))
-    for xylem_key, os_dict in rules_dict.items():
-        try:
-            verify_xylem_key(xylem_key)
-        except ValueError as e:
-            raise_from(ValueError, "Expected rules dict to have xylem keys as "
-                       "keys.", e)
+    _raise_errors(rules_dict_error_report(rules_dict,
+                                          allow_default_installer))
+
+
+def rules_dict_errors(rules_dict, allow_default_installer=True):
+    """Return all violations of valid structure in an expanded rules dict.
+
+    Unlike `verify_rules_dict`, no exception is raised, such that
+    callers can report the errors as they see fit, e.g. when checking
+    rules files.
+
+    :param dict rules_dict: dictionary mapping xylem keys to os dicts
+    :param bool allow_default_installer: indicates if
+        'default_installer' installer name is allowed
+    :returns: list of error messages, each starting with the location of
+        the error in the form ``'xylem_key/os/version/installer'``
+    """
+    return [e.describe() for e in rules_dict_error_report(
+        rules_dict, allow_default_installer, jobs=1)]
+
+
+def rules_dict_error_report(rules_dict, allow_default_installer=True,
+                            jobs=None, chunk_size=None):
+    """Return all violations of valid structure as `RulesDictError` list.
+
+    The entries of the rules dict are split by xylem key into chunks of
+    ``chunk_size`` entries, which are verified on up to ``jobs`` worker
+    processes. The workers are forked after the rules dict is complete
+    and inherit it, such that only the chunk boundaries and the errors
+    are passed between processes; serializing the rules dict would cost
+    more than verifying it. Rules dicts with at most ``chunk_size``
+    entries are verified in the calling process, and so are all rules
+    dicts on platforms without :func:`os.fork` and while other threads
+    are running, since forking a process with threads may deadlock.
+    Either way, the errors are returned in the order of the entries of
+    ``rules_dict``.
+
+    :param dict rules_dict: dictionary mapping xylem keys to os dicts
+    :param bool allow_default_installer: indicates if
+        'default_installer' installer name is allowed
+    :param jobs: maximum number of worker processes; if `None` is
+        passed, the number set by the enclosing `parallel_verification`
+        context is used, which is 1 outside of any context
+    :type jobs: `int` or `None`
+    :param chunk_size: number of xylem keys verified in one task; if
+        `None` is passed, :data:`VERIFY_CHUNK_SIZE` is used
+    :type chunk_size: `int` or `None`
+    :rtype: `list` of `RulesDictError`
+    """
+    if not isinstance(rules_dict, Mapping):
+        return [_rules_dict_type_error(rules_dict)]
+    if jobs is None:
+        jobs = _verification_jobs[-1]
+    chunk_size = chunk_size or VERIFY_CHUNK_SIZE
+    if jobs >= 2 and len(rules_dict) > chunk_size and \
+            _fork_context is not None and threading.active_count() == 1:
+        return _parallel_errors(list(rules_dict.items()),
+                                allow_default_installer, jobs, chunk_size)
+    return _chunk_errors((rules_dict.items(), allow_default_installer))
+
+
+VERIFY_CHUNK_SIZE = 2000
+"""Default number of xylem keys verified in one task."""
+
+
+class RulesDictError(object):
+
+    """Single violation of valid structure found in a rules dict.
+
+    :ivar xylem_key: xylem key of the offending entry, or ``None`` if
+        the error does not belong to an entry
+    :ivar tuple path: location of the error, i.e. the xylem key, os
+        name, os version and installer name, as far as they apply
+    :ivar str message: description of the error
+    """
+
+    def __init__(self, xylem_key, path, message):
+        self.xylem_key = xylem_key
+        self.path = tuple(path)
+        self.message = message
+
+    def describe(self):
+        """Return message prefixed with the path of the error."""
+        if self.path:
+            return "'{0}': {1}".format("/".join(self.path), self.message)
+        return self.message
+
+    def to_dict(self):
+        """Return dict with key, path and message, e.g. to dump as yaml."""
+        return dict(key=to_str(self.xylem_key)
+                    if self.xylem_key is not None else None,
+                    path="/".join(self.path), message=self.message)
+
+    def __eq__(self, other):
+        return isinstance(other, RulesDictError) and \
+            (self.xylem_key, self.path, self.message) == \
+            (other.xylem_key, other.path, other.message)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "RulesDictError({0!r}, {1!r}, {2!r})".format(
+            self.xylem_key, self.path, self.message)
+
+
+class parallel_verification(object):
+
+    """Verify large rules dicts on worker processes inside this context.
+
+    Inside the context, `verify_rules_dict` and
+    `rules_dict_error_report` use up to ``jobs`` worker processes if not
+    told otherwise, also when called indirectly, e.g. when verifying the
+    data of sources during :func:`xylem.update.update`.
+
+    :param jobs: maximum number of worker processes; if `None` is
+        passed, the number of CPUs is used
+    :type jobs: `int` or `None`
+    """
+
+    def __init__(self, jobs=None):
+        if jobs is None:
+            try:
+                jobs = multiprocessing.cpu_count()
+            except NotImplementedError:
+                jobs = 1
+        self.jobs = jobs
+
+    def __enter__(self):
+        _verification_jobs.append(self.jobs)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _verification_jobs.pop()
+
+
+_verification_jobs = [1]
+
+if not hasattr(os, 'fork'):
+    _fork_context = None
+elif hasattr(multiprocessing, 'get_context'):
+    _fork_context = multiprocessing.get_context('fork')
+else:
+    _fork_context = multiprocessing
+
+# items of the rules dict being verified in parallel, inherited by the
+# forked worker processes
+_shared_items = None
+
+
+def _parallel_errors(items, allow_default_installer, jobs, chunk_size):
+    global _shared_items
+    bounds = [(start, min(start + chunk_size, len(items)),
+               allow_default_installer)
+              for start in range(0, len(items), chunk_size)]
+    _shared_items = items
+    try:
+        pool = _fork_context.Pool(min(jobs, len(bounds)))
         try:
-            verify_os_dict(os_dict)
-        except ValueError as e:
-            raise_from(ValueError, "Expected rules dict to have valid os "
-                       "dicts as values, but got error for key '{0}'.".
-                       format(xylem_key), e)
-            raise
+            results = pool.map(_shared_chunk_errors, bounds, 1)
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        _shared_items = None
+    return [e for chunk_errors in results for e in chunk_errors]
+
+
+def _shared_chunk_errors(task):
+    """Return errors of a chunk of the rules dict shared with workers.
+
+    Module level function, such that it can be run by worker processes.
+
+    :param tuple task: start and end index of the chunk in
+        ``_shared_items`` and the ``allow_default_installer`` flag
+    """
+    start, stop, allow_default_installer = task
+    return _chunk_errors((_shared_items[start:stop], allow_default_installer))
+
+
+def _chunk_errors(task):
+    """Return errors of a chunk of rules dict entries.
+
+    :param tuple task: iterable of ``(xylem_key, os_dict)`` items and the
+        ``allow_default_installer`` flag
+    """
+    items, allow_default_installer = task
+    errors = []
+    for xylem_key, os_dict in items:
+        _rules_dict_entry_errors(xylem_key, os_dict, allow_default_installer,
+                                 errors)
+    return errors
+
+
+def _rules_dict_type_error(rules_dict):
+    return RulesDictError(
+        None, (), "Expected rules dict of type 'dict', but got '{0}'.".
+        format(type(rules_dict)))
 
 
 def verify_os_dict(os_dict, allow_default_installer=True):
@@ -115,22 +353,9 @@ def verify_os_dict(os_dict, allow_default_installer=True):
         'default_installer' installer name is allowed
     :raises ValueError: if os dict does not have valid structure
     """
-    if not isinstance(os_dict, dict):
-        raise ValueError("Expected os dict of type 'dict', but got '{0}'.".
-                         format(type(os_dict)))
-    for os_name, version_dict in os_dict.items():
-        try:
-            verify_os_name(os_name)
-        except ValueError as e:
-            raise_from(ValueError, "Expected os dict to have os names as "
-                       "keys.", e)
-        try:
-            def_inst = allow_default_installer and os_name != 'any_os'
-            verify_version_dict(version_dict, allow_default_installer=def_inst)
-        except ValueError as e:
-            raise_from(ValueError, "Expected os dict to have valid version "
-                       "dicts as values, but got error for os '{0}'.".
-                       format(os_name), e)
+    errors = []
+    _os_dict_errors(os_dict, allow_default_installer, (), errors)
+    _raise_errors(errors)
 
 
 # optionally pass list of installers and warn if installer name appears
@@ -146,21 +371,9 @@ def verify_version_dict(version_dict, allow_default_installer=True):
         'default_installer' installer name is allowed
     :raises ValueError: if version dict does not have valid structure
     """
-    if not isinstance(version_dict, dict):
-        raise ValueError("Expected version dict of type 'dict', but got "
-                         "'{0}'.".format(type(version_dict)))
-    for os_version, installer_dict in version_dict.items():
-        try:
-            verify_os_version(os_version)
-        except ValueError as e:
-            raise_from(ValueError, "Expected version dict to have os versions "
-                       "as keys.", e)
-        try:
-            verify_installer_dict(installer_dict, allow_default_installer)
-        except ValueError as e:
-            raise_from(ValueError, "Expected version dict to have valid "
-                       "installer dicts as values, but got error for version "
-                       "'{0}'.".format(os_version), e)
+    errors = []
+    _version_dict_errors(version_dict, allow_default_installer, (), errors)
+    _raise_errors(errors)
 
 
 def verify_installer_dict(installer_dict, allow_default_installer=True):
@@ -172,24 +385,10 @@ def verify_installer_dict(installer_dict, allow_default_installer=True):
         'default_installer' installer name is allowed
     :raises ValueError: if installer dict does not have valid structure
     """
-    if not isinstance(installer_dict, dict):
-        raise ValueError("Expected installer dict of type 'dict', but got "
-                         "'{0}'.".format(type(installer_dict)))
-    for installer_name, installer_rule in installer_dict.items():
-        if not allow_default_installer:
-            if installer_name == 'default_installer':
-                raise ValueError("Default installer is not allowed here.")
-        try:
-            verify_installer_name(installer_name)
-        except ValueError as e:
-            raise_from(ValueError, "Expected installer dict to have installer "
-                       "names as keys.", e)
-        try:
-            verify_installer_rule(installer_rule)
-        except ValueError as e:
-            raise_from(ValueError, "Expected installer dict to have installer "
-                       "rules as values, but got error for installer '{0}.".
-                       format(installer_name), e)
+    errors = []
+    _installer_dict_errors(installer_dict, allow_default_installer, (),
+                           errors)
+    _raise_errors(errors)
 
 
 def verify_installer_rule(installer_rule):
@@ -198,31 +397,119 @@ def verify_installer_rule(installer_rule):
     :param dict installer_rule: dictionary describing an installer command
     :raises ValueError: if installer rule does not have valid structure
     """
+    errors = []
+    _installer_rule_errors(installer_rule, (), errors)
+    _raise_errors(errors)
+
+
+def _raise_errors(errors):
+    if errors:
+        messages = [e.describe() for e in errors]
+        if len(messages) > 1:
+            messages = ["Found {0} errors:".format(len(messages))] + messages
+        raise ValueError("\n".join(messages))
+
+
+def _add_error(errors, path, message):
+    errors.append(RulesDictError(path[0] if path else None, path, message))
+
+
+def _identifier_error(validator, identifier, path, errors):
+    """Add error for ``identifier`` at ``path``; return ``True`` if valid."""
+    message = validator.error(identifier)
+    if message is None:
+        return True
+    _add_error(errors, path, message)
+    return False
+
+
+def _rules_dict_entry_errors(xylem_key, os_dict, allow_default_installer,
+                             errors):
+    message = _xylem_key_validator.error(xylem_key)
+    if message is not None:
+        errors.append(RulesDictError(xylem_key, (), message))
+        xylem_key = to_str(xylem_key)
+    _os_dict_errors(os_dict, allow_default_installer, (xylem_key,), errors)
+
+
+def _os_dict_errors(os_dict, allow_default_installer, path, errors):
+    if not isinstance(os_dict, dict):
+        _add_error(errors, path,
+                   "Expected os dict of type 'dict', but got '{0}'.".
+                   format(type(os_dict)))
+        return
+    for os_name, version_dict in os_dict.items():
+        if not _identifier_error(_os_name_validator, os_name, path, errors):
+            os_name = to_str(os_name)
+        def_inst = allow_default_installer and os_name != 'any_os'
+        _version_dict_errors(version_dict, def_inst, path + (os_name,),
+                             errors)
+
+
+def _version_dict_errors(version_dict, allow_default_installer, path,
+                         errors):
+    if not isinstance(version_dict, dict):
+        _add_error(errors, path,
+                   "Expected version dict of type 'dict', but got '{0}'.".
+                   format(type(version_dict)))
+        return
+    for os_version, installer_dict in version_dict.items():
+        if not _identifier_error(_os_version_validator, os_version, path,
+                                 errors):
+            os_version = to_str(os_version)
+        _installer_dict_errors(installer_dict, allow_default_installer,
+                               path + (os_version,), errors)
+
+
+def _installer_dict_errors(installer_dict, allow_default_installer, path,
+                           errors):
+    if not isinstance(installer_dict, dict):
+        _add_error(errors, path,
+                   "Expected installer dict of type 'dict', but got '{0}'.".
+                   format(type(installer_dict)))
+        return
+    for installer_name, installer_rule in installer_dict.items():
+        if not allow_default_installer and \
+                installer_name == 'default_installer':
+            _add_error(errors, path, "Default installer is not allowed here.")
+        elif not _identifier_error(_installer_name_validator, installer_name,
+                                   path, errors):
+            installer_name = to_str(installer_name)
+        _installer_rule_errors(installer_rule, path + (installer_name,),
+                               errors)
+
+
+def _installer_rule_errors(installer_rule, path, errors):
     if not isinstance(installer_rule, dict):
-        raise ValueError("Expected installer rule of type 'dict', but got "
-                         "'{0}'.".format(type(installer_rule)))
+        _add_error(errors, path,
+                   "Expected installer rule of type 'dict', but got '{0}'.".
+                   format(type(installer_rule)))
+        return
     for key, value in installer_rule.items():
         if not isinstance(key, text_type):
-            raise ValueError("Expected installer rule to have keys of text"
-                             " type, but got '{0}'.".format(type(key)))
+            _add_error(errors, path,
+                       "Expected installer rule to have keys of text type, "
+                       "but got '{0}'.".format(type(key)))
         # The contents of the installer rule is specific to the
         # according installer plugin, but we check for a few common keys here
-        if key == "packages":
+        elif key == "packages":
             if not isinstance(value, list):
-                raise ValueError(
-                    "Expected 'packages' entry of installer rule to be of "
-                    "type 'list', but got '{0}'".format(type(value)))
-        if key == "depends":
+                _add_error(errors, path,
+                           "Expected 'packages' entry of installer rule to "
+                           "be of type 'list', but got '{0}'".
+                           format(type(value)))
+        elif key == "depends":
             if not isinstance(value, list):
-                raise ValueError(
-                    "Expected 'depends' entry of installer rule to be of "
-                    "type 'list', but got '{0}'".format(type(value)))
-            try:
-                for xylem_key in value:
-                    verify_xylem_key(xylem_key)
-            except ValueError as e:
-                raise_from(ValueError, "Expected 'depends' entry of installer "
-                           "rule to be list of xylem keys.", e)
+                _add_error(errors, path,
+                           "Expected 'depends' entry of installer rule to be "
+                           "of type 'list', but got '{0}'".format(type(value)))
+                continue
+            for xylem_key in value:
+                message = _xylem_key_validator.error(xylem_key)
+                if message is not None:
+                    _add_error(errors, path,
+                               "Expected 'depends' entry of installer rule "
+                               "to be list of xylem keys: " + message)
 
 
 def verify_xylem_key(xylem_key):
@@ -230,7 +517,7 @@ def verify_xylem_key(xylem_key):
 
     :raises ValueError: if ``xylem_key`` is not valid
     """
-    verify_rules_dict_identifier(xylem_key, "xylem key")
+    _xylem_key_validator.verify(xylem_key)
 
 
 def verify_os_name(os_name):
@@ -238,7 +525,7 @@ def verify_os_name(os_name):
 
     :raises ValueError: if ``os_name`` is not valid
     """
-    verify_rules_dict_identifier(os_name, "os name", ["any_os"])
+    _os_name_validator.verify(os_name)
 
 
 def verify_os_version(os_version):
@@ -246,7 +533,7 @@ def verify_os_version(os_version):
 
     :raises ValueError: if ``os_version`` is not valid
     """
-    verify_rules_dict_identifier(os_version, "os version", ["any_version"])
+    _os_version_validator.verify(os_version)
 
 
 def verify_installer_name(installer_name):
@@ -254,8 +541,7 @@ def verify_installer_name(installer_name):
 
     :raises ValueError: if ``installer_name`` is not valid
     """
-    verify_rules_dict_identifier(
-        installer_name, "installer name", ["default_installer"])
+    _installer_name_validator.verify(installer_name)
 
 
 def verify_rules_dict_identifier(identifier, kind, allow_keywords=[]):
@@ -267,27 +553,102 @@ def verify_rules_dict_identifier(identifier, kind, allow_keywords=[]):
         for this identifier
     :raises ValueError: if ``identifier`` is not valid
     """
-    rules_dict_keywords = {'any_os', 'any_version', 'default_installer',
-                           'unset_installers', 'any_key'}
-    # FIXME: implement this whitelist differently (specific to where it
-    #        might occur)
-    rules_dict_whitelist = {'mountain lion'}
-    # NOTE: 'unset_installers' is reserved for future use, not yet implemented.
-    if not isinstance(identifier, text_type):
-        raise ValueError(type_error_msg("str", identifier, what_for=kind))
-    if identifier in rules_dict_keywords - set(allow_keywords):
-        raise ValueError("{0} is disallowed keyword '{1}'.".
-                         format(kind, identifier))
-    if identifier in rules_dict_whitelist:
-        return
-    if not re.match('(?u)^[\w.’+-]+$', identifier):
-        raise ValueError(
-            "{0} '{1}' has disallowed characters. Allowed are: alphanumeric, "
-            "dash, dot, underscore.".format(kind, identifier))
+    get_identifier_validator(kind, allow_keywords).verify(identifier)
+
+
+RULES_DICT_KEYWORDS = frozenset(['any_os', 'any_version', 'default_installer',
+                                 'unset_installers', 'any_key'])
+"""Keywords of rules dicts, which are not allowed as identifiers.
+
+'unset_installers' is reserved for future use, not yet implemented.
+"""
+
+# FIXME: implement this whitelist differently (specific to where it
+#        might occur)
+RULES_DICT_WHITELIST = frozenset(['mountain lion'])
+"""Identifiers that are allowed despite having disallowed characters."""
 
+_IDENTIFIER_PATTERN = re.compile(r'(?u)^[\w.’+-]+$')
 
-# TODO: change order of merge to start with highest priority. Change
-# naming accordingly.
+
+class IdentifierValidator(object):
+
+    """Validator for one kind of identifier used in rules dicts.
+
+    The disallowed keywords and the pattern are prepared once, and
+    identifiers that were found valid are remembered, such that checking
+    them again is a single set lookup. Use `get_identifier_validator`
+    to get a shared instance.
+
+    :param str kind: kind of identifier for error messages
+    :param allow_keywords: keywords that are allowed for this kind of
+        identifier
+    """
+
+    max_memo_size = 100000
+    """Number of valid identifiers remembered before the memo is reset."""
+
+    def __init__(self, kind, allow_keywords=()):
+        self.kind = kind
+        self.disallowed_keywords = RULES_DICT_KEYWORDS - \
+            frozenset(allow_keywords)
+        self._valid = set()
+
+    def error(self, identifier):
+        """Return the error message for ``identifier``, or ``None``.
+
+        :returns: ``None`` if ``identifier`` is valid
+        """
+        if not isinstance(identifier, text_type):
+            return type_error_msg("str", identifier, what_for=self.kind)
+        if identifier in self._valid:
+            return None
+        if identifier in self.disallowed_keywords:
+            return "{0} is disallowed keyword '{1}'.".format(
+                self.kind, identifier)
+        if identifier not in RULES_DICT_WHITELIST and \
+                not _IDENTIFIER_PATTERN.match(identifier):
+            return ("{0} '{1}' has disallowed characters. Allowed are: "
+                    "alphanumeric, dash, dot, underscore.".
+                    format(self.kind, identifier))
+        if len(self._valid) >= self.max_memo_size:
+            self._valid.clear()
+        self._valid.add(identifier)
+        return None
+
+    def verify(self, identifier):
+        """Verify validity of ``identifier``.
+
+        :raises ValueError: if ``identifier`` is not valid
+        """
+        message = self.error(identifier)
+        if message is not None:
+            raise ValueError(message)
+
+
+_identifier_validators = {}
+
+
+def get_identifier_validator(kind, allow_keywords=()):
+    """Return the shared `IdentifierValidator` for a kind of identifier.
+
+    :param str kind: kind of identifier for error messages
+    :param allow_keywords: keywords that are allowed for this kind of
+        identifier
+    """
+    key = (kind, frozenset(allow_keywords))
+    validator = _identifier_validators.get(key)
+    if validator is None:
+        validator = _identifier_validators.setdefault(
+            key, IdentifierValidator(kind, allow_keywords))
+    return validator
+
+
+_xylem_key_validator = get_identifier_validator("xylem key")
+_os_name_validator = get_identifier_validator("os name", ["any_os"])
+_os_version_validator = get_identifier_validator("os version", ["any_version"])
+_installer_name_validator = get_identifier_validator(
+    "installer name", ["default_installer"])
 
 
 def merge_rules(rules_dict_list, default_installers):
@@ -297,10 +658,18 @@ def merge_rules(rules_dict_list, default_installers):
     ``rules_dict_list`` take precedence. It is assumed that all
     rules dicts are fully expanded and have valid structure.
 
-    The rules dicts are deep copied up to the installer rules, which are
-    themselves not deep copied. Therefore, the resulting rules dict
-    shares structure with the input rules dicts (namely the installer
-    rules themselves).
+    The rules dicts are processed in a single pass starting with the
+    highest priority. An installer rule is only added if no rules dict
+    with higher priority has a rule for the same installer for the same
+    os and version, in an 'any_version' entry of the same os (unless the
+    rule itself is for 'any_version'), or in an 'any_os' entry (unless
+    the rule itself is for 'any_os').
+
+    Parts of the input are copied only when they are modified, i.e.
+    os, version and installer dicts are shared with the input rules
+    dicts until rules of lower priority are added to them, and the
+    installer rules themselves are never copied. The resulting rules
+    dict therefore must not be modified.
 
     The os's in the rules dicts are filtered such that only os names
     that appear as keys of ``default_installers`` appear in the merged
@@ -315,81 +684,101 @@ def merge_rules(rules_dict_list, default_installers):
     :returns: merged rules dict
     """
     combined_rules = {}
-    # an invariant for the following loop is that in the combined rules,
-    # os names have already been filtered, and 'default_installer' keys
-    # have been replaced.
-    # TODO: note this invariant in the called functions as well
-    for rules in reversed(rules_dict_list):
-        for xylem_key, new_os_dict in rules.items():
-            if xylem_key not in combined_rules:
-                combined_os_dict = copy_os_dict(
-                    new_os_dict, default_installers)
-                if combined_os_dict:
-                    combined_rules[xylem_key] = combined_os_dict
+    # ids of the dicts in combined_rules that were created by the merge
+    # and can be modified, as opposed to those shared with the input
+    owned = set()
+    for rules in rules_dict_list:
+        for xylem_key, os_dict in rules.items():
+            if xylem_key in combined_rules:
+                _merge_os_dict(os_dict, combined_rules, xylem_key,
+                               default_installers, owned)
             else:
-                merge_os_dict(
-                    new_os_dict, combined_rules[xylem_key], default_installers)
+                os_dict = prepare_os_dict(os_dict, default_installers)
+                if os_dict:
+                    combined_rules[xylem_key] = os_dict
     return combined_rules
 
 
-def merge_os_dict(new_os_dict, combined_os_dict, default_installers):
-    """Merge os dict into an existing one."""
-    # first, check for any_os in new_os_dict, since other entries in the
-    # new_os_dict overwrite the any_os entry, but the any_os entry
-    # overrides existing entries in combined_os_dict
-    if "any_os" in new_os_dict:
-        new_version_dict = new_os_dict["any_os"]
-        new_installer_dict = new_version_dict["any_version"]
-        for installer in new_installer_dict.keys():
-            # remove any existing rules for installer, as
-            # they are overridden by 'any_os'
-            installer = replace_default_installer(installer, None)
-            remove_rule_for_all_os(combined_os_dict, installer)
-        if "any_os" in combined_os_dict:
-            merge_installer_dict(
-                new_installer_dict,
-                combined_os_dict["any_os"]["any_version"],
-                None)
-        else:
-            combined_os_dict["any_os"] = copy_version_dict(
-                new_version_dict, None)
-    for os, new_version_dict in new_os_dict.items():
-        if os not in default_installers:
+_NO_RULES = {}
+"""Empty dict standing in for missing entries; never modified."""
+
+
+def _merge_os_dict(os_dict, combined_rules, xylem_key, default_installers,
+                   owned):
+    """Add the rules of an os dict with lower priority to a merge."""
+    # the overriding 'any_os' and 'any_version' entries are taken from
+    # the combined rules before the corresponding entries of os_dict
+    # are added, since entries of the same os dict do not override each
+    # other
+    any_os_installers = combined_rules[xylem_key].get(
+        'any_os', _NO_RULES).get('any_version', _NO_RULES)
+    for os_name, version_dict in os_dict.items():
+        if os_name == 'any_os' or os_name not in default_installers:
             continue
-        if os not in combined_os_dict:
-            combined_os_dict[os] = copy_version_dict(
-                new_version_dict, default_installers[os])
-        else:
-            merge_version_dict(
-                new_version_dict, combined_os_dict[os], default_installers[os])
-
-
-def merge_version_dict(new_version_dict, combined_version_dict,
-                       default_installer):
-    """Merge version dict into an existing one."""
-    # first, check for any_version in new_version_dict, since other
-    # entries in new_version_dict override the any_version entry, but
-    # the any_version entry overrides existing entries in
-    # combined_version_dict
-    if "any_version" in new_version_dict:
-        new_installer_dict = new_version_dict["any_version"]
-        for installer in new_installer_dict.keys():
-            installer = replace_default_installer(installer, default_installer)
-            remove_rule_for_all_versions(combined_version_dict, installer)
-        if "any_version" in combined_version_dict:
-            merge_installer_dict(
-                new_installer_dict, combined_version_dict["any_version"], None)
-        else:
-            combined_version_dict["any_version"] = copy_installer_dict(
-                new_installer_dict, default_installer)
-    for version, new_installer_dict in new_version_dict.items():
-        if version not in combined_version_dict:
-            combined_version_dict[version] = copy_installer_dict(
-                new_installer_dict, default_installer)
-        else:
-            merge_installer_dict(
-                new_installer_dict, combined_version_dict[version],
-                default_installer)
+        default_installer = default_installers[os_name]
+        any_version_installers = combined_rules[xylem_key].get(
+            os_name, _NO_RULES).get('any_version', _NO_RULES)
+        for version, installer_dict in version_dict.items():
+            if version != 'any_version':
+                _merge_installer_dict(
+                    installer_dict, combined_rules, owned, xylem_key,
+                    os_name, version, default_installer,
+                    any_os_installers, any_version_installers)
+        if 'any_version' in version_dict:
+            _merge_installer_dict(
+                version_dict['any_version'], combined_rules, owned,
+                xylem_key, os_name, 'any_version', default_installer,
+                any_os_installers)
+    if 'any_os' in os_dict:
+        _merge_installer_dict(
+            os_dict['any_os']['any_version'], combined_rules, owned,
+            xylem_key, 'any_os', 'any_version', None)
+
+
+def _merge_installer_dict(installer_dict, combined_rules, owned, xylem_key,
+                          os_name, version, default_installer,
+                          any_os_installers=_NO_RULES,
+                          any_version_installers=_NO_RULES):
+    """Add the rules of an installer dict with lower priority to a merge.
+
+    Rules for installers that already have a rule for this os and
+    version, or in ``any_os_installers`` or ``any_version_installers``,
+    are skipped.
+    """
+    existing = combined_rules[xylem_key].get(os_name, _NO_RULES).get(
+        version, _NO_RULES)
+    combined_installer_dict = None
+    for installer_name, installer_rule in installer_dict.items():
+        if installer_name == 'default_installer':
+            installer_name = replace_default_installer(
+                installer_name, default_installer)
+        if installer_name in existing or \
+                installer_name in any_os_installers or \
+                installer_name in any_version_installers:
+            continue
+        if combined_installer_dict is None:
+            combined_os_dict = _owned_entry(combined_rules, xylem_key, owned)
+            combined_version_dict = _owned_entry(
+                combined_os_dict, os_name, owned)
+            combined_installer_dict = _owned_entry(
+                combined_version_dict, version, owned)
+        combined_installer_dict[installer_name] = installer_rule
+
+
+def _owned_entry(parent, key, owned):
+    """Return ``parent[key]`` after making sure it can be modified.
+
+    A missing entry is created; an entry shared with the input is
+    replaced by a copy.
+    """
+    child = parent.get(key)
+    if child is None:
+        child = parent[key] = {}
+        owned.add(id(child))
+    elif id(child) not in owned:
+        child = parent[key] = dict(child)
+        owned.add(id(child))
+    return child
 
 
 def merge_installer_dict(new_installer_dict, combined_installer_dict,
@@ -401,47 +790,59 @@ def merge_installer_dict(new_installer_dict, combined_installer_dict,
         combined_installer_dict[installer_name] = installer_rule
 
 
-def copy_os_dict(os_dict, default_installers):
-    """Deep copy os dict up to the installer rules.
-
-    The installer rules themselves are not deep-copied.
+def prepare_os_dict(os_dict, default_installers):
+    """Filter os dict and replace default installers, copying on write.
 
     The os's in the os dicts are filtered such that only os names
-    that appear as keys of ``default_installers`` appear in the merged
-    rules dict.
+    that appear as keys of ``default_installers`` appear in the result.
 
     'default_installer' installer names are replaced according to
     ``default_installers``.
 
+    Only the dicts that change are copied; if nothing changes,
+    ``os_dict`` itself is returned. The installer rules are never
+    copied.
+
     :param dict default_installers: dict mapping os names to default
         installer names
     """
-    result = {}
-    for os, version_dict in os_dict.items():
-        if os == 'any_os':
-            result[os] = copy_version_dict(
-                version_dict, None)
-        elif os in default_installers:
-            result[os] = copy_version_dict(
-                version_dict, default_installers[os])
+    result = os_dict
+    for os_name, version_dict in os_dict.items():
+        if os_name == 'any_os':
+            default_installer = None
+        elif os_name in default_installers:
+            default_installer = default_installers[os_name]
+        else:
+            if result is os_dict:
+                result = dict(os_dict)
+            del result[os_name]
+            continue
+        new_version_dict = prepare_version_dict(
+            version_dict, default_installer)
+        if new_version_dict is not version_dict:
+            if result is os_dict:
+                result = dict(os_dict)
+            result[os_name] = new_version_dict
     return result
 
 
-def copy_version_dict(version_dict, default_installer):
-    """Deep copy version dict up to the installer rules.
+def prepare_version_dict(version_dict, default_installer):
+    """Replace default installers in version dict, copying on write.
 
-    The installer rules themselves are not deep-copied.
-
-    'default_installer' installer names are replaced according to
-    ``default_installer``.
+    Installer dicts with a 'default_installer' entry are copied with
+    the entry replaced according to ``default_installer``. If there are
+    none, ``version_dict`` itself is returned.
 
     :param str default_installer: name of the default installer for this
         os
     """
-    result = {}
+    result = version_dict
     for version, installer_dict in version_dict.items():
-        result[version] = copy_installer_dict(
-            installer_dict, default_installer)
+        if 'default_installer' in installer_dict:
+            if result is version_dict:
+                result = dict(version_dict)
+            result[version] = copy_installer_dict(
+                installer_dict, default_installer)
     return result
 
 
@@ -480,43 +881,3 @@ def replace_default_installer(installer_name, default_installer_name):
                 "is not allowed")
     else:
         return installer_name
-
-
-def remove_rule_for_all_os(os_dict, installer_name):
-    """Remove rules for ``installer_name`` from os dict.
-
-    All rules for installer ``installer_name`` are removed from
-    ``os_dict`` for a specific os entries, i.e. except for the rules in
-    ``any_os`` entries.
-
-    :param dict os_dict: os dict to be manipulated
-    :param str installer_name: name of installer to be removed
-    """
-    for os_name, version_dict in list(six.iteritems(os_dict)):
-        if os_name == "any_os":
-            continue
-        remove_rule_for_all_versions(
-            version_dict, installer_name, retain_any_version=False)
-        if not version_dict:
-            del os_dict[os_name]
-
-
-def remove_rule_for_all_versions(
-        version_dict, installer_name, retain_any_version=True):
-    """Remove rules for ``installer_name`` from version dict.
-
-    All rules for installer ``installer_name`` are removed from
-    ``version_dict`` for all specific versions, i.e. except for the
-    rules in ``any_version`` entries (if ``retain_any_version`` is
-    True).
-
-    :param dict os_dict: os dict to be manipulated
-    :param str installer_name: name of installer to be removed
-    """
-    for version, installer_dict in list(six.iteritems(version_dict)):
-        if retain_any_version and version == "any_version":
-            continue
-        if installer_name in installer_dict:
-            del installer_dict[installer_name]
-        if not installer_dict:
-            del version_dict[version]
@@ -0,0 +1,371 @@
+# Copyright 2014 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rules database backend persisting all rules in an SQLite file.
+
+`SQLiteRulesDatabase` stores the expanded rules of all sources as rows
+``(priority, key, os, version, installer, rule)``, where priority is the
+position of the source in the list of sources. Lookups, the keys for an
+os and the reverse lookup of keys by package are answered by indexed
+queries instead of walking the data of each source.
+
+The per-source caches are still maintained by `update`, such that
+unchanged sources need not be downloaded again. The SQLite file is
+rewritten in a single transaction at the end of `update`. The database
+is in write-ahead-log mode, such that readers see the last committed
+state and are never blocked while an update is running. Concurrent
+updates are serialized by SQLite's write lock.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import os
+import sqlite3
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from xylem import __version__
+from xylem.log_utils import debug
+from xylem.log_utils import error
+from xylem.text_utils import to_str
+from xylem.sources.rules_dict import replace_default_installer
+
+from .database import CACHE_LOAD_ERRORS
+from .database import RulesDatabase
+
+
+DATABASE_FILE_NAME = "rules.sqlite"
+
+SCHEMA_VERSION = 2
+"""Version of the database schema, stored as ``PRAGMA user_version``."""
+
+_SCHEMA = """
+CREATE TABLE sources (
+    priority INTEGER PRIMARY KEY,
+    unique_id TEXT NOT NULL,
+    xylem_version TEXT NOT NULL,
+    data_checksum TEXT
+);
+CREATE TABLE rules (
+    id INTEGER PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    os TEXT NOT NULL,
+    version TEXT NOT NULL,
+    installer TEXT,
+    rule TEXT
+);
+CREATE INDEX rules_lookup ON rules (key, os, version, installer);
+CREATE INDEX rules_os ON rules (os, version, key);
+CREATE TABLE packages (
+    rule_id INTEGER NOT NULL,
+    package TEXT NOT NULL
+);
+CREATE INDEX packages_package ON packages (package);
+"""
+
+# Rows are ordered such that merging them in order gives the precedence
+# of `RulesDatabase.lookup`: lower priority sources first and within a
+# source 'any_os', then 'any_version', then the specific version.
+_LOOKUP_QUERY = """
+SELECT installer, rule FROM rules
+WHERE key = ? AND installer IS NOT NULL AND
+      ((os = 'any_os' AND version = 'any_version') OR
+       (os = ? AND version IN ('any_version', ?)))
+ORDER BY priority DESC,
+         CASE WHEN os = 'any_os' THEN 0
+              WHEN version = 'any_version' THEN 1
+              ELSE 2 END
+"""
+
+_KEYS_QUERY = """
+SELECT DISTINCT key FROM rules
+WHERE os = 'any_os' OR (os = ? AND version IN ('any_version', ?))
+"""
+
+_PACKAGE_QUERY = """
+SELECT DISTINCT rules.key FROM packages
+JOIN rules ON rules.id = packages.rule_id
+WHERE packages.package = ? AND
+      rules.installer IN ('default_installer', ?)
+"""
+
+_BUSY_TIMEOUT = 60
+
+
+class SQLiteRulesDatabase(RulesDatabase):
+
+    """Rules database answering queries from an SQLite file.
+
+    Only sources whose data is an expanded rules dict (such as for the
+    'rules' spec) are supported.
+    """
+
+    uses_lookup_index = False
+
+    def __init__(self, sources_context):
+        super(SQLiteRulesDatabase, self).__init__(sources_context)
+        self.connection = None
+
+    def database_file_path(self):
+        return os.path.join(self.sources_context.cache_dir,
+                            DATABASE_FILE_NAME)
+
+    def prepare_bulk_lookup(self, installer_context):
+        """Do nothing; queries are answered from the SQLite database."""
+
+    def _connect(self):
+        return sqlite3.connect(self.database_file_path(),
+                               timeout=_BUSY_TIMEOUT, isolation_level=None)
+
+    def load_from_cache(self, installer_context=None, lazy=False):
+        """Open the SQLite database.
+
+        The arguments are accepted for compatibility with
+        `RulesDatabase.load_from_cache` and are ignored.
+
+        :raises IOError: if the database does not exist or does not
+            match the current list of sources or their caches (only if
+            :attr:`raise_on_error` is set)
+        """
+        self.close()
+        self.invalidate()
+        try:
+            path = self.database_file_path()
+            if not os.path.isfile(path):
+                raise IOError("Rules database '{0}' does not exist.".
+                              format(path))
+            connection = self._connect()
+            if not self._is_up_to_date(connection):
+                connection.close()
+                raise IOError("Rules database '{0}' is outdated; run "
+                              "'xylem update'.".format(path))
+            self.connection = connection
+        except (IOError, OSError, sqlite3.Error) as e:
+            if self.raise_on_error:
+                raise
+            else:
+                error("Failed to open rules database:\n{0}".
+                      format(to_str(e)))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _is_up_to_date(self, connection):
+        schema_version, = connection.execute(
+            "PRAGMA user_version").fetchone()
+        if schema_version != SCHEMA_VERSION:
+            return False
+        stored = connection.execute(
+            "SELECT unique_id, xylem_version, data_checksum FROM sources "
+            "ORDER BY priority").fetchall()
+        return stored == self._sources_rows()
+
+    def _sources_rows(self):
+        # the checksums detect source caches rewritten since the
+        # database was written, e.g. by an update with another backend
+        return [(s.unique_id(), __version__, s.cached_data_checksum())
+                for s in self.sources]
+
+    def update(self, incremental=False):
+        """Update the per-source caches and rewrite the SQLite database.
+
+        The database is not rewritten if all sources are unchanged and
+        it is up to date already.
+
+        :param bool incremental: see `RulesDatabase.update`
+        """
+        super(SQLiteRulesDatabase, self).update(incremental=incremental)
+        try:
+            self.save_to_database()
+        except (IOError, OSError, ValueError, sqlite3.Error) as e:
+            if self.raise_on_error:
+                raise
+            else:
+                error("Failed to save rules database:\n{0}".
+                      format(to_str(e)))
+
+    def save_to_database(self):
+        """Write the data of all sources to the SQLite database.
+
+        Sources are loaded from cache if they are not already loaded. If
+        any of the sources is unavailable, the database is not changed.
+
+        :returns: ``True`` if the database is up to date
+        """
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            if all(s.data_unchanged for s in self.sources) and \
+                    self._is_up_to_date(connection):
+                debug("Rules database is up to date.")
+                return True
+            for source in self.sources:
+                if source.data is None:
+                    try:
+                        source.load_from_cache()
+                    except CACHE_LOAD_ERRORS as e:
+                        error("Not saving rules database; failed to load "
+                              "source '{0}' from cache:\n{1}".
+                              format(source.unique_id(), to_str(e)))
+                        return False
+            rules_rows, package_rows = self._create_rows()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_rows(connection, rules_rows, package_rows)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            self.invalidate()
+            return True
+        finally:
+            connection.close()
+
+    def _create_rows(self):
+        rules_rows = []
+        package_rows = []
+        for priority, source in enumerate(self.sources):
+            if not isinstance(source.data, Mapping):
+                raise ValueError(
+                    "Source '{0}' of spec '{1}' is not supported by the "
+                    "SQLite rules database.".
+                    format(source.unique_id(), source.spec.name))
+            for xylem_key, os_dict in source.data.items():
+                for os_name, version_dict in os_dict.items():
+                    for version, installer_dict in version_dict.items():
+                        if not installer_dict:
+                            # keep track of the key being defined for
+                            # os/version
+                            rules_rows.append(
+                                (len(rules_rows), priority, xylem_key,
+                                 os_name, version, None, None))
+                        for installer, rule in installer_dict.items():
+                            rule_id = len(rules_rows)
+                            rules_rows.append(
+                                (rule_id, priority, xylem_key, os_name,
+                                 version, installer, json.dumps(rule)))
+                            for package in rule.get('packages', []):
+                                package_rows.append((rule_id, package))
+        return rules_rows, package_rows
+
+    def _write_rows(self, connection, rules_rows, package_rows):
+        schema_version, = connection.execute(
+            "PRAGMA user_version").fetchone()
+        if schema_version != SCHEMA_VERSION:
+            for table in ['sources', 'rules', 'packages']:
+                connection.execute("DROP TABLE IF EXISTS {0}".format(table))
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    connection.execute(statement)
+            connection.execute(
+                "PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+        else:
+            for table in ['sources', 'rules', 'packages']:
+                connection.execute("DELETE FROM {0}".format(table))
+        connection.executemany(
+            "INSERT INTO sources VALUES (?, ?, ?, ?)",
+            [(i,) + row for i, row in enumerate(self._sources_rows())])
+        connection.executemany(
+            "INSERT INTO rules VALUES (?, ?, ?, ?, ?, ?, ?)", rules_rows)
+        connection.executemany(
+            "INSERT INTO packages VALUES (?, ?)", package_rows)
+
+    def save_index(self, installer_context):
+        """Do nothing; the SQLite database is indexed for all os's.
+
+        :returns: ``True``
+        """
+        return True
+
+    def merged_rules(self, default_installers):
+        """Return the effective rules of all sources as one rules dict.
+
+        The SQLite database is not used; sources that are not loaded
+        are read from their per-source caches on demand (see
+        `RulesDatabase.merged_rules`).
+
+        :raises ValueError: if the data of a source cannot be
+            represented as rules dict
+        """
+        for source in self.sources:
+            if source.data is None:
+                source.load_from_cache(lazy=True)
+        return super(SQLiteRulesDatabase, self).merged_rules(
+            default_installers)
+
+    def _ensure_connection(self):
+        if self.connection is None:
+            self.load_from_cache()
+
+    def _memo_context(self, installer_context):
+        # other processes may rewrite the database while it is open;
+        # its data version changes whenever that happens
+        self._ensure_connection()
+        data_version = self.connection.execute(
+            "PRAGMA data_version").fetchone()
+        return super(SQLiteRulesDatabase, self)._memo_context(
+            installer_context) + (data_version,)
+
+    def _lookup(self, xylem_key, installer_context):
+        self._ensure_connection()
+        os_name, os_version = installer_context.get_os_tuple()
+        default_installer = installer_context.get_default_installer_name()
+        installer_dict = {}
+        for installer, rule in self.connection.execute(
+                _LOOKUP_QUERY, (xylem_key, os_name, os_version)):
+            installer = replace_default_installer(installer, default_installer)
+            installer_dict[installer] = json.loads(rule)
+        return installer_dict
+
+    def _lookup_many(self, xylem_keys, installer_context):
+        self._ensure_connection()
+        os_name, os_version = installer_context.get_os_tuple()
+        default_installer = installer_context.get_default_installer_name()
+        result = {}
+        for xylem_key in xylem_keys:
+            installer_dict = result[xylem_key] = {}
+            for installer, rule in self.connection.execute(
+                    _LOOKUP_QUERY, (xylem_key, os_name, os_version)):
+                installer = replace_default_installer(installer,
+                                                      default_installer)
+                installer_dict[installer] = json.loads(rule)
+        return result
+
+    def keys(self, installer_context):
+        """Return list of keys defined for current os/version."""
+        self._ensure_connection()
+        os_name, os_version = installer_context.get_os_tuple()
+        return [row[0] for row in self.connection.execute(
+            _KEYS_QUERY, (os_name, os_version))]
+
+    def keys_for_package(self, package, installer_name, installer_context):
+        """Return keys that resolve to ``package`` for an installer.
+
+        Candidate keys are found with the package index and then
+        checked with :meth:`lookup`.
+        """
+        self._ensure_connection()
+        candidates = [row[0] for row in self.connection.execute(
+            _PACKAGE_QUERY, (package, installer_name))]
+        return sorted(
+            k for k in candidates if package in self.lookup(
+                k, installer_context).get(installer_name, {}).
+            get('packages', []))
@@ -65,6 +65,32 @@ class Spec(PluginBase):
     def load_data(self, arguments):
         return
 
+    def load_data_if_modified(self, arguments, validators):
+        """Load data unless it is unchanged since it was last loaded.
+
+        ``validators`` are opaque to the caller; they are whatever this
+        method returned when the current data was loaded, and are stored
+        alongside the cached data. Spec plugins that cannot determine
+        cheaply if their data has changed can rely on this default
+        implementation, which always loads the data.
+
+        :param validators: validators from the last load, or ``None``
+        :returns: tuple ``(data, validators)``, where ``data`` is
+            ``None`` if the data is unchanged
+        """
+        return self.load_data(arguments), None
+
+    def source_url(self, arguments):
+        """Return the url that the data is loaded from, or ``None``.
+
+        Sources of specs that load their data from a single url, which
+        is then also their ``arguments``, can be mirrored with ``xylem
+        mirror``. Mirrored sources get the url of the mirrored file as
+        new ``arguments``. The default implementation returns ``None``,
+        i.e. sources of the spec are not mirrored.
+        """
+        return None
+
     @abc.abstractmethod
     def verify_arguments(self, arguments):
         return
@@ -79,6 +105,19 @@ class Spec(PluginBase):
     def is_data_outdated(self, data, arguments, data_load_time):
         return
 
+    def is_data_outdated_without_data(self, arguments, data_load_time):
+        """Check if data is outdated without access to it, or ``None``.
+
+        Like `is_data_outdated`, but for specs that decide without
+        looking at the data, such that the freshness of cached data can
+        be checked without reading the cache. The default implementation
+        returns ``None``, meaning that the data is needed and
+        `is_data_outdated` is called instead.
+
+        :returns: ``True`` if outdated, ``False`` if not, or ``None``
+        """
+        return None
+
     # TODO: possibly make use of URL HEAD request for is_data_outdated
     # to check age or resource. EXAMPLE:
     # import httplib
@@ -107,14 +146,58 @@ class Spec(PluginBase):
     # NOTE: all lookup type queries need to take installer_context
     # argument
 
-    # TODO: needs there be in addition to 'lookup' the capability for
-    # spec plugins to dump their data as rules dict? Like lookup for all
-    # key/os/versions triples, but might use any_os/any_version. This is
-    # needed if we want to be able to dump the whole database for
-    # debugging purposes
-
-    # TODO: should there be a method to list the xylem keys defined by
-    # this spec plugin? (similar to above todo about dump_db)
+    def lookup_many(self, data, xylem_keys, installer_context):
+        """Lookup rules for many xylem keys at once.
+
+        Spec plugins should override this to do the work that depends
+        only on ``installer_context`` once for all keys. The default
+        implementation calls `lookup` for every key.
+
+        :returns: dict mapping xylem keys to installer dicts as returned
+            by `lookup`; keys without rules may be missing
+        """
+        return dict((key, self.lookup(data, key, installer_context))
+                    for key in xylem_keys)
+
+    def rules_dict(self, data):
+        """Return ``data`` as expanded rules dict, or ``None``.
+
+        The rules dict may use 'any_os', 'any_version' and
+        'default_installer' and must not be modified by the caller. It
+        is used to merge the data of all sources into one effective
+        rules dict (see
+        `xylem.sources.database.RulesDatabase.merged_rules`), e.g. to
+        dump the whole database for debugging. The default
+        implementation returns ``None``, meaning that the data cannot be
+        represented as rules dict.
+        """
+        return None
+
+    def defined_keys(self, data):
+        """Return all xylem keys for which ``data`` might define rules.
+
+        The result is stored as a key manifest alongside the cached
+        data, such that lookups for other keys can skip loading the
+        cache of this source entirely. The default implementation
+        returns ``None``, meaning that the keys are unknown and the data
+        is always loaded.
+
+        :returns: list of xylem keys or ``None``
+        """
+        return None
+
+    def os_key_index(self, data):
+        """Return index of the xylem keys of ``data`` by os and version.
+
+        The index is stored alongside the cached data, such that `keys`
+        can be answered for any os without loading or scanning the
+        data. The default implementation returns ``None``, meaning that
+        the data is always used.
+
+        :returns: index as returned by
+            `xylem.sources.rules_dict.build_os_key_index`, or ``None``
+        """
+        return None
 
     # TODO: how exactly do we support various other queries such as 'who
     # needs' 'depends' 'depends-on' etc
@@ -248,17 +248,26 @@ Which expands to::
 
 from __future__ import unicode_literals
 
+import os
+import time
+
+from six.moves.urllib.parse import urlparse
+from six.moves.urllib.request import url2pathname
+
 from xylem.sources.rules_dict import verify_rules_dict
 from xylem.sources.rules_dict import lookup_rules
 from xylem.sources.rules_dict import has_rule_for_os
+from xylem.sources.rules_dict import build_os_key_index
+from xylem.sources.cache_format import CompactRulesDict
 
 from xylem.specs import Spec
 
-from xylem.yaml_utils import load_yaml
 from xylem.yaml_utils import dump_yaml
+from xylem.yaml_utils import iter_yaml_mapping
 from xylem.text_utils import text_type
 from xylem.text_utils import to_str
-from xylem.load_url import load_url
+from xylem.load_url import stream_url_if_modified
+from xylem.load_url import url_from_path
 from xylem.log_utils import error
 from xylem.exception import XylemError
 
@@ -272,7 +281,8 @@ class RulesSpec(Spec):
 
     """Rules file spec.
 
-    ``arguments`` are the url of the rules file.
+    ``arguments`` are the url of the rules file, or a plain file system
+    path.
 
     ``data`` is the expanded rules dict.
     """
@@ -289,14 +299,28 @@ class RulesSpec(Spec):
         return arguments
 
     def load_data(self, arguments):
+        rules, _ = self.load_data_if_modified(arguments, None)
+        return rules
+
+    def load_data_if_modified(self, arguments, validators):
         # TODO: Can we fast-fail if there is no connectivity (instead of
         # doing the retries)? How to find out if there is no internet
         # connection in general (as opposed to the resources not being
         # accessible)?
-        data = load_url(arguments)
-        rules = load_yaml(data)
-        rules = expand_rules(rules)
-        return rules
+        chunks, validators = stream_url_if_modified(arguments, validators)
+        if chunks is None:
+            # not modified; skip parsing and expansion
+            return None, validators
+        # Parse while downloading and expand each key as soon as it is
+        # complete, such that neither the whole file nor its yaml node
+        # graph need to be held in memory.
+        rules = {}
+        for xylem_key, os_dict in iter_yaml_mapping(chunks):
+            rules[xylem_key] = expand_rules_entry(xylem_key, os_dict)
+        return rules, validators
+
+    def source_url(self, arguments):
+        return arguments
 
     def verify_arguments(self, arguments):
         if not isinstance(arguments, text_type):
@@ -309,8 +333,18 @@ class RulesSpec(Spec):
         return verify_rules_dict(data)
 
     def is_data_outdated(self, data, arguments, data_load_time):
-        # TODO: actual sensible implementation here
-        return True
+        return self.is_data_outdated_without_data(arguments, data_load_time)
+
+    def is_data_outdated_without_data(self, arguments, data_load_time):
+        # Only local files can be checked without network access. Remote
+        # rules files are always considered outdated; the update then
+        # revalidates them with a cheap conditional request.
+        path = _local_path(arguments)
+        if path is None or not os.path.isfile(path):
+            return True
+        load_timestamp = time.mktime(data_load_time.timetuple()) + \
+            data_load_time.microsecond / 1e6
+        return os.path.getmtime(path) >= load_timestamp
 
     def lookup(self, data, xylem_key, installer_context):
         os, version = installer_context.get_os_tuple()
@@ -319,15 +353,47 @@ class RulesSpec(Spec):
         return lookup_rules(
             data, xylem_key, os, version, default_installer_name)
 
+    def lookup_many(self, data, xylem_keys, installer_context):
+        os, version = installer_context.get_os_tuple()
+        default_installer_name = installer_context.get_default_installer_name()
+        return dict((key, lookup_rules(
+            data, key, os, version, default_installer_name))
+            for key in xylem_keys if key in data)
+
+    def rules_dict(self, data):
+        return data
+
+    def defined_keys(self, data):
+        return list(data.keys())
+
+    def os_key_index(self, data):
+        if isinstance(data, CompactRulesDict):
+            return data.os_key_index()
+        return build_os_key_index(data)
+
     def keys(self, data, installer_context):
-        result = []
         os_name, os_version = installer_context.get_os_tuple()
+        if isinstance(data, CompactRulesDict):
+            # query cached data in place without decoding all rules
+            return data.keys_for_os(os_name, os_version)
+        result = []
         for key, os_dict in data.items():
             if has_rule_for_os(os_dict, os_name, os_version):
                 result.append(key)
         return result
 
 
+def _local_path(url):
+    """Return the file system path for 'file://' urls and plain paths.
+
+    For other urls, return ``None``.
+    """
+    parsed = urlparse(url_from_path(url))
+    if parsed.scheme != 'file':
+        return None
+    return url2pathname(parsed.path)
+
+
 # TODO: The following code needs to be looked over and naming of
 # functions/variables/parameters be
 
@@ -339,7 +405,7 @@ class SpecParsingError(XylemError):
     def __init__(self, msg, related_snippet=None):
         if related_snippet:
             msg += "\n\n" + to_str(related_snippet)
-        ValueError.__init__(self, msg)
+        XylemError.__init__(self, msg)
 
 
 # TODO: note in the docstrings that arguments are reused/modified in
@@ -438,15 +504,26 @@ def expand_rules(rules):
                          .format(type(rules)))
     for xylem_key, os_dict in rules.items():
         # Store the (possibly) updated os_dict
-        try:
-            rules[xylem_key] = expand_os_definition(os_dict)
-        except ValueError as exc:
-            raise SpecParsingError("Failed to expand rule for '{0}': {1}"
-                                   .format(xylem_key, exc),
-                                   dump_yaml({xylem_key: os_dict}))
+        rules[xylem_key] = expand_rules_entry(xylem_key, os_dict)
     return rules
 
 
+def expand_rules_entry(xylem_key, os_dict):
+    """Expand the os dict of a single xylem key.
+
+    The expanded os dict is not verified; see `verify_rules_dict`.
+
+    :raises SpecParsingError: if the os dict cannot be expanded
+    """
+    try:
+        expanded = expand_os_definition(os_dict)
+    except ValueError as exc:
+        raise SpecParsingError("Failed to expand rule for '{0}': {1}"
+                               .format(xylem_key, exc),
+                               dump_yaml({xylem_key: os_dict}))
+    return expanded
+
+
 # TODO: Cleanup, error handling and docstrings for `compact...` functions
 
 
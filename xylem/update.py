@@ -19,9 +19,21 @@
 from __future__ import unicode_literals
 
 from xylem.sources import SourcesContext
-from xylem.sources import RulesDatabase
+from xylem.sources import create_rules_database
+
+from xylem.installers import ensure_installer_context
 
 from xylem.config import get_config
+from xylem.cache_bundle import create_cache_bundle
+from xylem.sources.rules_dict import parallel_verification
+
+from xylem.log_utils import info
+from xylem.log_utils import info_v
+from xylem.log_utils import warning
+
+from xylem.exception import XylemError
+from xylem.util import file_lock
+from xylem.exception import exc_to_str
 
 
 # TODO: remove handle_spec_urls (move some logic into the accoring
@@ -58,7 +70,9 @@ from xylem.config import get_config
 #     return rules_dict_list
 
 
-def update(dry_run=False, config=None, sources_context=None):
+def update(dry_run=False, config=None, sources_context=None, jobs=None,
+           installer_context=None, incremental=False, bundle=None,
+           verify_jobs=None):
     """Update the xylem cache.
 
     If the prefix is set then the source lists are searched for in the
@@ -74,13 +88,70 @@ def update(dry_run=False, config=None, sources_context=None):
         instantiate the rules database; if `None` is passed, a sources
         context from ``config`` is created
     :type sources_context: `SourcesContext` or `None`
+    :param jobs: maximum number of sources to load concurrently; if
+        `None` is passed, the default of `RulesDatabase` is used
+    :type jobs: `int` or `None`
+    :param installer_context: installer context determining the os for
+        which the merged lookup index is built; if `None` is passed, an
+        installer context from ``config`` is created
+    :type installer_context: `InstallerContext` or `None`
+    :param bool incremental: if `True`, only update sources whose cache
+        is outdated
+    :param bundle: if not `None`, path of a cache bundle to write after
+        the update; see `xylem.cache_bundle`
+    :type bundle: `str` or `None`
+    :param verify_jobs: if not `None`, number of worker processes to
+        verify large rules dicts with; see
+        `xylem.sources.rules_dict.parallel_verification`
+    :type verify_jobs: `int` or `None`
     """
     if config is None:
         config = get_config()
     sources_context = sources_context or SourcesContext(config)
     sources_context.ensure_cache_dir()
-    database = RulesDatabase(sources_context)
+    database = create_rules_database(sources_context)
     database.print_info = True
     # support partial update of local sources even without connectivity:
     database.raise_on_error = False
-    database.update()
+    if jobs is not None:
+        database.jobs = jobs
+    # concurrent updates are serialized; readers are not blocked, since
+    # all cache files are replaced atomically
+    with parallel_verification(verify_jobs or 1), \
+            file_lock(database.lock_file_path(), on_wait=_print_waiting):
+        database.update(incremental=incremental)
+        if database.uses_lookup_index:
+            _save_index(database, installer_context, config)
+        if bundle is not None:
+            _create_bundle(database, bundle)
+
+
+def _create_bundle(database, bundle):
+    missing = [s for s in database.sources if not s.is_cache_available()]
+    for source in missing:
+        warning("Cache bundle does not contain source '{0}', since it is "
+                "not available.".format(source.unique_id()))
+    create_cache_bundle(bundle, database.sources_context)
+
+
+def _print_waiting():
+    info("Waiting for other update to finish...")
+
+
+def _save_index(database, installer_context, config):
+    # the lookup index is an optimization; don't fail if we cannot
+    # determine the os to build it for
+    try:
+        ic = ensure_installer_context(installer_context, config)
+    except XylemError as e:
+        warning("Not building lookup index:\n{0}".
+                format(exc_to_str(e, tb=False, chain=True)))
+        return
+    if database.load_index(ic):
+        info_v("Lookup index for '{0}' is up to date.".
+               format(ic.get_os_string()))
+        return
+    info("Building lookup index for '{0}'...".format(ic.get_os_string()))
+    if not database.save_index(ic):
+        warning("Not building lookup index, since not all sources are "
+                "available.")
@@ -26,13 +26,33 @@ import shutil
 import sys
 import tempfile
 import subprocess
+import threading
+
+from collections import OrderedDict
 
 from six import StringIO
 
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks on this platform (e.g. Windows)
+    fcntl = None
+
 from xylem.text_utils import to_str
 from xylem.exception import exc_to_str
 
 
+def _read_umask():
+    # the umask can only be read by setting it; do this once at import
+    # time, since changing it races with threads creating files
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_umask = _read_umask()
+
+
 class change_directory(object):
     def __init__(self, directory=''):
         self.directory = directory
@@ -78,6 +98,111 @@ class temporary_directory(object):
             os.chdir(self.original_cwd)
 
 
+class atomic_file(object):
+
+    """Open a file for writing such that it is replaced atomically.
+
+    Content is written to a temporary file in the same directory, which
+    is synced to disk and then renamed to ``path``. Readers therefore
+    see either the old or the complete new content, even if the writing
+    process crashes. If an exception is raised inside the context, the
+    temporary file is removed and ``path`` is left unchanged.
+    """
+
+    def __init__(self, path, mode='wb'):
+        self.path = path
+        self.mode = mode
+        self.temp_path = None
+        self.file = None
+
+    def __enter__(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, self.temp_path = tempfile.mkstemp(
+            prefix='.' + name + '.', suffix='.tmp', dir=directory)
+        # mkstemp creates files only readable by the owner
+        os.chmod(self.temp_path, 0o666 & ~_umask)
+        self.file = os.fdopen(fd, self.mode)
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.file.close()
+            if exc_type is None:
+                replace_file(self.temp_path, self.path)
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+
+_replace_file = getattr(os, 'replace', os.rename)
+
+
+def replace_file(source, path):
+    """Atomically replace ``path`` by the file ``source``.
+
+    Both paths must be on the same file system. The rename is made
+    durable where supported.
+    """
+    _replace_file(source, path)
+    _sync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def _sync_directory(directory):
+    """Make a rename in ``directory`` durable, if supported."""
+    if fcntl is None:
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class file_lock(object):
+
+    """Hold an exclusive advisory lock on ``path`` inside the context.
+
+    The lock file is created if it does not exist. Only processes that
+    also take the lock are excluded; readers that do not take it are
+    never blocked. On platforms without :mod:`fcntl`, no lock is taken.
+
+    :param on_wait: called without arguments before blocking if the
+        lock is held by another process
+    """
+
+    def __init__(self, path, on_wait=None):
+        self.path = path
+        self.on_wait = on_wait
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        self.file = open(self.path, 'a')
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            if self.on_wait is not None:
+                self.on_wait()
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self.file.close()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
 # TODO: document this soft dependency on pygments, and also add unit
 # test for printing exceptions with and without pygments (maybe in
 # "install" section of docs)
@@ -181,6 +306,56 @@ def is_program_installed(executable_name):
         return False
 
 
+class LRUCache(object):
+
+    """Mapping of bounded size that discards least recently used items.
+
+    All methods are thread safe.
+
+    :param int max_size: maximum number of items; if an item is added to
+        a full cache, the least recently used item is discarded
+    :ivar int hits: number of `get` calls that found their key
+    :ivar int misses: number of `get` calls that did not find their key
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return item for ``key`` and mark it as most recently used."""
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Add or replace item for ``key``."""
+        with self._lock:
+            self._items.pop(key, None)
+            if len(self._items) >= self.max_size:
+                if self.max_size < 1:
+                    return
+                self._items.popitem(last=False)
+            self._items[key] = value
+
+    def clear(self):
+        """Remove all items; the counters are kept."""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
 def remove_duplicates(seq):
     """Remove duplicates for a list while preserving the order.
 
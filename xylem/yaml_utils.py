@@ -16,6 +16,9 @@
 
 Use these utility function throughout to make sure unicde is handled
 correctly and output YAML looks consistent.
+
+The libyaml based C loader and dumper are used if PyYAML was built with
+libyaml, else the pure Python implementation. Results are the same.
 """
 
 
@@ -24,6 +27,26 @@ from __future__ import unicode_literals
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as _SafeLoader
+    from yaml import CSafeDumper as _SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+    from yaml import SafeDumper as _SafeDumper
+
+from xylem.text_utils import text_type
+
+
+class _Loader(_SafeLoader):
+
+    def construct_yaml_str(self, node):
+        # Override the default string handling function
+        # to always return unicode objects
+        return self.construct_scalar(node)
+
+
+_Loader.add_constructor('tag:yaml.org,2002:str', _Loader.construct_yaml_str)
+
 
 def load_yaml(data):
     """Parse a unicode string containing yaml.
@@ -33,17 +56,140 @@ def load_yaml(data):
     See :func:`yaml.load`.
 
     :raises yaml.YAMLError: if parsing fails"""
-
-    class MyLoader(yaml.SafeLoader):
-        def construct_yaml_str(self, node):
-            # Override the default string handling function
-            # to always return unicode objects
-            return self.construct_scalar(node)
-
-    MyLoader.add_constructor(
-        'tag:yaml.org,2002:str', MyLoader.construct_yaml_str)
-
-    return yaml.load(data, Loader=MyLoader)
+    return yaml.load(data, Loader=_Loader)
+
+
+def iter_yaml_mapping(data):
+    """Parse yaml with a mapping at the top level entry by entry.
+
+    Like :func:`load_yaml`, but instead of returning the whole mapping,
+    yield its ``(key, value)`` pairs one after another, each as soon as
+    it has been parsed. When parsing from a stream, only one entry is
+    held in memory at a time (apart from the consumer's copies). Anchors
+    may be referenced across entries, but aliased values are not shared
+    between entries.
+
+    An empty document yields no entries.
+
+    :param data: unicode string, file-like object or iterable of
+        unicode strings containing the yaml document
+    :raises yaml.YAMLError: if parsing fails
+    :raises ValueError: if the top level is not a mapping
+    """
+    if not isinstance(data, text_type) and not hasattr(data, 'read'):
+        data = _ChunkReader(data)
+    loader = _Loader(data)
+    try:
+        loader.get_event()  # stream start
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()  # document start
+        anchors = {}
+        if loader.check_event(yaml.MappingStartEvent):
+            loader.get_event()
+            while not loader.check_event(yaml.MappingEndEvent):
+                key = loader.construct_document(
+                    _compose_node(loader, anchors))
+                value = loader.construct_document(
+                    _compose_node(loader, anchors))
+                yield key, value
+            loader.get_event()
+        else:
+            value = loader.construct_document(_compose_node(loader, anchors))
+            if value is not None:
+                raise ValueError("Expected mapping at the top level, but "
+                                 "got '{0}'.".format(type(value)))
+        document_end = loader.get_event()
+        if not loader.check_event(yaml.StreamEndEvent):
+            event = loader.get_event()
+            raise yaml.composer.ComposerError(
+                "expected a single document in the stream",
+                document_end.start_mark, "but found another document",
+                event.start_mark)
+    finally:
+        loader.dispose()
+
+
+def _compose_node(loader, anchors):
+    """Compose the next yaml node from parser events.
+
+    This is what :class:`yaml.composer.Composer` does (without path
+    resolvers), but only relies on the parser interface.
+    """
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(
+                None, None, "found undefined alias '{0}'".format(event.anchor),
+                event.start_mark)
+        return anchors[event.anchor]
+    tag = event.tag
+    if isinstance(event, yaml.ScalarEvent):
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark,
+                               event.end_mark, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], event.start_mark, None,
+                                 flow_style=event.flow_style)
+    else:
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], event.start_mark, None,
+                                flow_style=event.flow_style)
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    if isinstance(event, yaml.SequenceStartEvent):
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose_node(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(event, yaml.MappingStartEvent):
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _compose_node(loader, anchors)
+            node.value.append((key, _compose_node(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    return node
+
+
+class _ChunkReader(object):
+
+    """File-like object reading from an iterable of string chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = ''
+                return ''
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class _Dumper(_SafeDumper):
+
+    def ignore_aliases(self, _data):
+        return True
+
+    def represent_sequence(self, tag, data, flow_style=False):
+        # represent lists inline
+        return super(_Dumper, self).represent_sequence(
+            tag, data, flow_style=True)
+
+    def represent_none(self, data):
+        return self.represent_scalar('tag:yaml.org,2002:null', '')
+
+
+_Dumper.add_representer(type(None), _Dumper.represent_none)
+# dict subclasses such as `xylem.config_utils.ConfigDict`
+_Dumper.add_multi_representer(dict, _Dumper.represent_dict)
 
 
 def dump_yaml(data, inline=False):
@@ -52,30 +198,14 @@ def dump_yaml(data, inline=False):
     # TODO: handle `inline` argument properly to produce output on a
     #       single line
 
-    # delay import to prevent circular import
-    from xylem.config_utils import ConfigDict
-
-    class MyDumper(yaml.SafeDumper):
-        def ignore_aliases(self, _data):
-            return True
-
-        def represent_sequence(self, tag, data, flow_style=False):
-            # represent lists inline
-            return yaml.SafeDumper.represent_sequence(
-                self, tag, data, flow_style=True)
-
-        def represent_none(self, data):
-            return self.represent_scalar('tag:yaml.org,2002:null', '')
-
-    MyDumper.add_representer(type(None), MyDumper.represent_none)
-    MyDumper.add_representer(ConfigDict, MyDumper.represent_dict)
-
     result = yaml.dump(data,
-                       Dumper=MyDumper,
+                       Dumper=_Dumper,
                        # TODO: use this for inline==True ??
                        # default_style=None,
                        default_flow_style=False,
                        allow_unicode=True,
+                       # return unicode also on python 2
+                       encoding=None,
                        indent=2,
                        width=10000000)
 